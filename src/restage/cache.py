@@ -1,16 +1,295 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
 from mccode_antlr.instr import Instr
-from .tables import InstrEntry, SimulationTableEntry, SimulationEntry
+from .tables import InstrEntry, SimulationTableEntry, SimulationEntry, SimulationCandidates, SimulationNeighbours
 from .database import Database
 
+
+@dataclass
+class _MemoTable:
+    version: tuple[int, int]
+    tables: list[SimulationTableEntry]
+    simulations: SimulationCandidates | None = None
+
+
+class SimulationMemo:
+    """An in-process LRU memo of simulation tables and their deserialized simulations, per database
+
+    Each memoized table is tagged with :meth:`Database.version`, which changes when anyone,
+    including another process, modifies the database; an out-of-date table is reloaded on its
+    next use.  Simulations inserted through :class:`FileSystem` are appended to the memo instead.
+    At most *maxsize* simulations are held, evicting the least-recently used tables first;
+    larger tables are not memoized and are queried in the database as before.
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._tables: OrderedDict[tuple[Path, str], _MemoTable] = OrderedDict()
+
+    def __len__(self):
+        return sum(len(t.simulations) for t in self._tables.values() if t.simulations is not None)
+
+    def clear(self) -> None:
+        self._tables.clear()
+
+    def discard(self, db: Database, table_id: str) -> None:
+        self._tables.pop((db.db_file, table_id), None)
+
+    def _table(self, db: Database, table_id: str) -> _MemoTable:
+        return self._tables_of([db], table_id)[0]
+
+    def _tables_of(self, dbs: list[Database], table_id: str) -> list[_MemoTable]:
+        """The memoized tables with *table_id* in each of *dbs*, reloading all out-of-date ones in one query"""
+        from .database import union_query
+        keys = [(db.db_file, table_id) for db in dbs]
+        versions = [db.version() for db in dbs]
+        stale = [i for i, (key, version) in enumerate(zip(keys, versions))
+                 if key not in self._tables or self._tables[key].version != version]
+        if len(stale):
+            found = union_query(SimulationTableEntry, [dbs[i] for i in stale], {'id': table_id})
+            for i, tables in zip(stale, found):
+                self._tables[keys[i]] = _MemoTable(versions[i], tables)
+        for key in keys:
+            self._tables.move_to_end(key)
+        return [self._tables[key] for key in keys]
+
+    def tables(self, db: Database, table_id: str) -> list[SimulationTableEntry]:
+        """The simulation tables with *table_id* in *db*"""
+        return self._table(db, table_id).tables
+
+    def tables_of(self, dbs: list[Database], table_id: str) -> list[list[SimulationTableEntry]]:
+        """The simulation tables with *table_id* in each of *dbs*"""
+        return [memo.tables for memo in self._tables_of(dbs, table_id)]
+
+    def simulations(self, db: Database, table_id: str, memo: _MemoTable | None = None) -> SimulationCandidates | None:
+        """All simulations of the table *table_id* in *db*, or None if there are too many to memoize
+
+        The up-to-date *memo* of the table, if already known, avoids checking the database version again.
+        """
+        memo = self._table(db, table_id) if memo is None else memo
+        if memo.simulations is None:
+            if len(memo.tables) != 1 or db.count_simulations(table_id) > self.maxsize:
+                return None
+            memo.simulations = db.retrieve_simulation_candidates(table_id)
+            self._evict()
+        return memo.simulations
+
+    def inserted(self, db: Database, table_id: str, simulations: list[SimulationEntry]) -> None:
+        """Record the insertion of *simulations* into *db*, which must be the latest change made to it"""
+        key = db.db_file, table_id
+        memo = self._tables.get(key)
+        if memo is None:
+            return
+        data_version, changes = db.version()
+        if memo.version != (data_version, changes - 1) or memo.simulations is None:
+            self.discard(db, table_id)
+            return
+        memo.version = data_version, changes
+        memo.simulations.extend(simulations)
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self) > self.maxsize and len(self._tables) > 1:
+            self._tables.popitem(last=False)
+
+
+# The columns of the stored simulations in a snapshot, as ``(name, kind)`` where strings are UTF-8 encoded bytes,
+# and the seed and ncount, which may be missing, have a flag column too
+_SNAPSHOT_COLUMNS = (('id', 'S'), ('parameter_values', 'S'), ('seed', 'i8'), ('has_seed', '?'), ('ncount', 'i8'),
+                     ('has_ncount', '?'), ('output_path', 'S'), ('gravitation', '?'), ('creation', 'f8'),
+                     ('last_access', 'f8'), ('derived_from', 'S'))
+_SNAPSHOT_FORMAT = 1
+
+
+@dataclass
+class _SnapshotRow:
+    """A stored simulation read from a snapshot, with the attributes of a stored simulation row"""
+    id: str
+    parameter_values: dict
+    seed: int | None
+    ncount: int | None
+    output_path: str
+    gravitation: bool
+    creation: float
+    last_access: float
+    derived_from: str | None
+
+
+def _snapshot_array(rows: list):
+    """The stored simulation *rows* as a structured array, which can be saved without pickling"""
+    import json
+    import numpy as np
+    columns = {
+        'id': [r.id.encode() for r in rows],
+        'parameter_values': [json.dumps(r.parameter_values or {}).encode() for r in rows],
+        'seed': [r.seed or 0 for r in rows],
+        'has_seed': [r.seed is not None for r in rows],
+        'ncount': [r.ncount or 0 for r in rows],
+        'has_ncount': [r.ncount is not None for r in rows],
+        'output_path': [(r.output_path or '').encode() for r in rows],
+        'gravitation': [bool(r.gravitation) for r in rows],
+        'creation': [np.nan if r.creation is None else r.creation for r in rows],
+        'last_access': [np.nan if r.last_access is None else r.last_access for r in rows],
+        'derived_from': [(getattr(r, 'derived_from', None) or '').encode() for r in rows],
+    }
+    dtype = [(name, f'S{max([1, *map(len, columns[name])])}' if kind == 'S' else kind) for name, kind in _SNAPSHOT_COLUMNS]
+    array = np.empty(len(rows), dtype=dtype)
+    for name, values in columns.items():
+        array[name] = values
+    return array
+
+
+def _snapshot_rows(array) -> list[_SnapshotRow]:
+    """The stored simulations of a structured array made by :func:`_snapshot_array`"""
+    import json
+    columns = {name: array[name].tolist() for name, _ in _SNAPSHOT_COLUMNS}
+    return [_SnapshotRow(id=i.decode(), parameter_values=json.loads(p), seed=s if hs else None,
+                         ncount=n if hn else None, output_path=o.decode(), gravitation=bool(g), creation=c,
+                         last_access=a, derived_from=d.decode() or None)
+            for i, p, s, hs, n, hn, o, g, c, a, d in zip(*(columns[name] for name, _ in _SNAPSHOT_COLUMNS))]
+
+
+class FixedSnapshot:
+    """The simulation tables and simulations of an immutable fixed database, read once and kept in memory
+
+    The manifest of every simulation table in the database is read on first use, so that looking
+    for a table which the database does not have needs no I/O at all, and the simulations of each
+    table are read the first time they are needed, unless there are more than *maxsize* of them.
+    If a *sidecar* directory is given, the whole database is written to it once, as a JSON manifest
+    and one ``.npy`` file per table, which later processes load (memory-mapped, and without unpickling
+    anything) instead of the database for as long as the database file is unchanged.
+    """
+
+    def __init__(self, db: Database, sidecar: Path | None = None, maxsize: int = 100_000):
+        self.db = db
+        self.sidecar = sidecar
+        self.maxsize = maxsize
+        self._manifest: dict[str, list[SimulationTableEntry]] | None = None
+        self._simulations: dict[str, SimulationCandidates | None] = {}
+        # the file of each table in the sidecar, None for a table with too many simulations
+        self._files: dict[str, Path | None] | None = None
+
+    def _stamp(self) -> list:
+        stat = self.db.db_file.stat()
+        return [str(self.db.db_file.resolve()), stat.st_size, stat.st_mtime_ns]
+
+    def _load(self) -> dict[str, list[SimulationTableEntry]]:
+        if self._manifest is None:
+            if self.sidecar is not None and self._read():
+                return self._manifest
+            self._manifest = {}
+            for table in self.db.retrieve_all_simulation_tables():
+                self._manifest.setdefault(table.id, []).append(table)
+            if self.sidecar is not None:
+                self._write()
+        return self._manifest
+
+    def _read(self) -> bool:
+        """Use the sidecar, if it is a snapshot of the database as it is now"""
+        import json
+        from zenlog import log
+        try:
+            manifest = json.loads(self.sidecar.joinpath('manifest.json').read_text())
+            if manifest['format'] != _SNAPSHOT_FORMAT or manifest['stamp'] != self._stamp():
+                return False
+            tables: dict[str, list[SimulationTableEntry]] = {}
+            for table in manifest['tables']:
+                tables.setdefault(table['id'], []).append(SimulationTableEntry(**table))
+            files = {table_id: None if index is None else self.sidecar.joinpath(f'{int(index)}.npy')
+                     for table_id, index in manifest['simulations'].items()}
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            log.debug(f'Ignoring unreadable snapshot {self.sidecar}: {error}')
+            return False
+        self._manifest, self._files = tables, files
+        return True
+
+    def _write(self) -> None:
+        """Write the snapshot of the whole database to its sidecar directory, replacing any older snapshot"""
+        import json
+        import numpy as np
+        from os import rename
+        from shutil import rmtree
+        from tempfile import mkdtemp
+        from uuid import uuid4
+        from zenlog import log
+        try:
+            self.sidecar.parent.mkdir(parents=True, exist_ok=True)
+            directory = Path(mkdtemp(dir=self.sidecar.parent, prefix=f'.{self.sidecar.name}.'))
+        except OSError as error:
+            log.debug(f'Could not save snapshot {self.sidecar}: {error}')
+            return
+        try:
+            simulations = {}
+            for index, (table_id, tables) in enumerate(self._manifest.items()):
+                if len(tables) != 1 or self.db.count_simulations(table_id) > self.maxsize:
+                    simulations[table_id] = None
+                    continue
+                np.save(directory.joinpath(f'{index}.npy'),
+                        _snapshot_array(self.db.retrieve_stored_simulations(table_id)), allow_pickle=False)
+                simulations[table_id] = index
+            manifest = {'format': _SNAPSHOT_FORMAT, 'stamp': self._stamp(), 'simulations': simulations,
+                        'tables': [table.model_dump() for tables in self._manifest.values() for table in tables]}
+            directory.joinpath('manifest.json').write_text(json.dumps(manifest))
+            if self.sidecar.exists():
+                # an outdated snapshot, which is moved aside first since a directory can not be replaced
+                outdated = self.sidecar.with_name(f'.{self.sidecar.name}.{uuid4().hex}')
+                rename(self.sidecar, outdated)
+                rmtree(outdated, ignore_errors=True)
+            rename(directory, self.sidecar)
+        except OSError as error:
+            # e.g., another process saved the snapshot first
+            log.debug(f'Could not save snapshot {self.sidecar}: {error}')
+            rmtree(directory, ignore_errors=True)
+            return
+        self._files = {table_id: None if index is None else self.sidecar.joinpath(f'{index}.npy')
+                       for table_id, index in simulations.items()}
+
+    def tables(self, table_id: str) -> list[SimulationTableEntry]:
+        """The simulation tables with *table_id*"""
+        return self._load().get(table_id, [])
+
+    def simulations(self, table_id: str) -> SimulationCandidates | None:
+        """All simulations of the table *table_id*, or None if there are too many to hold"""
+        tables = self.tables(table_id)
+        if len(tables) != 1:
+            return None
+        if table_id not in self._simulations:
+            self._simulations[table_id] = self._snapshot_simulations(table_id, tables[0])
+        return self._simulations[table_id]
+
+    def _snapshot_simulations(self, table_id: str, table: SimulationTableEntry) -> SimulationCandidates | None:
+        if self._files is not None and table_id in self._files:
+            import numpy as np
+            from zenlog import log
+            file = self._files[table_id]
+            if file is None:
+                return None
+            try:
+                rows = _snapshot_rows(np.load(file, mmap_mode='r', allow_pickle=False))
+            except (OSError, ValueError) as error:
+                log.debug(f'Ignoring unreadable snapshot {file}: {error}')
+            else:
+                candidates = SimulationCandidates()
+                candidates.extend_stored(rows, table.parameters or [])
+                return candidates
+        if self.db.count_simulations(table_id) > self.maxsize:
+            return None
+        return self.db.retrieve_simulation_candidates(table_id)
+
+
 @dataclass
 class FileSystem:
     root: Path
     db_fixed: tuple[Database,...]
     db_write: Database
+    memo: SimulationMemo = field(default_factory=SimulationMemo)
+    snapshots: dict[Path, FixedSnapshot] = field(default_factory=dict)
 
     @classmethod
     def from_config(cls, named: str):
@@ -20,11 +299,14 @@ class FileSystem:
         root = None
         if not named.endswith('.db'):
             named += '.db'
+        options = {name: config[name].get(kind) for name, kind in
+                   (('journal_mode', str), ('busy_timeout', float), ('lock_retries', int),
+                    ('flush_interval', float)) if config[name].exists()}
         if config['cache'].exists():
             path = config['cache'].as_path()
             if not path.exists():
                 path.mkdir(parents=True)
-            db_write = Database(path / named)
+            db_write = Database(path / named, **options)
             root = path
 
         def exists_not_root(roc):
@@ -35,18 +317,26 @@ class FileSystem:
 
         if config['fixed'].exists() and config['fixed'].get() is not None:
             more = [Path(c) for c in config['fixed'].as_str_seq() if exists_not_root(c)]
+            immutable = config['fixed_immutable'].get(bool) if config['fixed_immutable'].exists() else True
             for m in more:
-                db_fixed.append(Database(m / named, readonly=True))
+                db_fixed.append(Database(m / named, readonly=True, immutable=immutable, **options))
 
         if db_write is not None and db_write.readonly:
             raise ValueError("Specified writable database location is readonly")
         if db_write is None:
             from platformdirs import user_cache_path
-            db_write = Database(user_cache_path('restage', 'ess', ensure_exists=True) / named)
+            db_write = Database(user_cache_path('restage', 'ess', ensure_exists=True) / named, **options)
         if root is None:
             from platformdirs import user_data_path
             root = user_data_path('restage', 'ess')
-        return cls(root, tuple(db_fixed), db_write)
+        memo = SimulationMemo(config['memo_size'].get(int)) if config['memo_size'].exists() else SimulationMemo()
+        # read the fixed databases through the connection to the writable database
+        db_write.attach(db_fixed)
+        # and hold what is read from those which can not change in memory, optionally also on disk
+        sidecars = config['fixed_snapshot'].get(bool) if config['fixed_snapshot'].exists() else False
+        snapshots = {db.db_file: FixedSnapshot(db, _sidecar(root, db) if sidecars else None, memo.maxsize)
+                     for db in db_fixed if db.immutable}
+        return cls(root, tuple(db_fixed), db_write, memo, snapshots)
 
     def query(self, method, *args, **kwargs):
         q = [x for r in self.db_fixed for x in getattr(r, method)(*args, **kwargs)]
@@ -56,40 +346,109 @@ class FileSystem:
     def insert(self, method, *args, **kwargs):
         getattr(self.db_write, method)(*args, **kwargs)
 
-    def query_instr_file(self, *args, **kwargs):
-        query = [x for r in self.db_fixed for x in r.query_instr_file(*args, **kwargs)]
-        query.extend(self.db_write.query_instr_file(*args, **kwargs))
-        return query
+    def query_instr_file(self, search: dict):
+        from .database import union_query
+        return [x for found in union_query(InstrEntry, [*self.db_fixed, self.db_write], search) for x in found]
 
     def insert_instr_file(self, *args, **kwargs):
         self.db_write.insert_instr_file(*args, **kwargs)
 
+    def insert_instr_files(self, *args, **kwargs):
+        self.db_write.insert_instr_files(*args, **kwargs)
+
     def query_simulation_table(self, *args, **kwargs):
         return self.query('query_simulation_table', *args, **kwargs)
 
-    def retrieve_simulation_table(self, *args, **kwargs):
-        return self.query('retrieve_simulation_table', *args, **kwargs)
+    def _tables(self, table_id: str) -> list[tuple[Database, list[SimulationTableEntry], _MemoTable | None]]:
+        """Each database with its simulation tables *table_id*, and their memo unless the database has a snapshot"""
+        dbs = [*self.db_fixed, self.db_write]
+        live = [db for db in dbs if db.db_file not in self.snapshots]
+        memos = dict(zip((db.db_file for db in live), self.memo._tables_of(live, table_id)))
+        return [(db, memos[db.db_file].tables, memos[db.db_file]) if db.db_file in memos
+                else (db, self.snapshots[db.db_file].tables(table_id), None) for db in dbs]
+
+    def retrieve_simulation_table(self, table_id: str, update_access_time: bool = True):
+        query = []
+        for db, found, _ in self._tables(table_id):
+            if update_access_time and len(found) and not db.readonly:
+                db.touch_simulation_table(table_id)
+            query.extend(found)
+        return query
+
+    def insert_simulation_table(self, table: SimulationTableEntry):
+        self.insert('insert_simulation_table', table)
+        self.memo.discard(self.db_write, table.id)
 
-    def insert_simulation_table(self, *args, **kwargs):
-        self.insert('insert_simulation_table', *args, **kwargs)
+    def insert_simulation(self, table: SimulationTableEntry, simulation: SimulationEntry):
+        self.insert_simulations(table, [simulation])
 
-    def insert_simulation(self, *args, **kwargs):
-        # By definition, 'self.db_write' is writable and Database.insert_simulation
+    def insert_simulations(self, table: SimulationTableEntry, simulations: list[SimulationEntry]):
+        # By definition, 'self.db_write' is writable and Database.insert_simulations
         # _always_ ensures the presence of the specified table in its database.
         # Therefore this method 'just works'.
-        self.insert('insert_simulation', *args, **kwargs)
-
-    def retrieve_simulation(self, table_id: str, row: SimulationEntry):
-        matches = []
-        for db in self.db_fixed:
-            if len(db.retrieve_simulation_table(table_id, False)) == 1:
-                matches.extend(db.retrieve_simulation(table_id, row))
-        if len(self.db_write.retrieve_simulation_table(table_id, False)) == 1:
-            matches.extend(self.db_write.retrieve_simulation(table_id, row))
+        had_table = len(self.memo.tables(self.db_write, table.id)) == 1
+        self.insert('insert_simulations', table, simulations)
+        if had_table:
+            self.memo.inserted(self.db_write, table.id, simulations)
+        else:
+            self.memo.discard(self.db_write, table.id)
+
+    def touch_instr_file(self, instr_id: str):
+        self.db_write.touch_instr_file(instr_id)
+
+    def touch_simulations(self, ids: set[str]):
+        self.db_write.touch_simulations(ids)
+
+    def flush_access_times(self):
+        self.db_write.flush_access_times()
+
+    def retrieve_simulation(self, table_id: str, row: SimulationEntry, exact: bool = False):
+        return self.retrieve_simulations(table_id, [row], exact=exact)[0]
+
+    def simulation_neighbours(self, table_id: str, precision: dict[str, float]) -> list[SimulationNeighbours]:
+        """The spatial index of the simulations of table *table_id* in each database which holds them in memory
+
+        Each is built once for as long as its database, or the snapshot of a fixed database, is unchanged.
+        """
+        neighbours = []
+        for db, tables, memo in self._tables(table_id):
+            if len(tables) != 1:
+                continue
+            if memo is None:
+                candidates = self.snapshots[db.db_file].simulations(table_id)
+            else:
+                candidates = self.memo.simulations(db, table_id, memo)
+            if candidates is not None and len(candidates):
+                neighbours.append(candidates.neighbours(precision))
+        return neighbours
+
+    def retrieve_simulations(self, table_id: str, rows: list[SimulationEntry], exact: bool = False):
+        matches: list[list[SimulationEntry]] = [[] for _ in rows]
+        for db, tables, memo in self._tables(table_id):
+            if len(tables) != 1:
+                continue
+            if memo is None:
+                candidates = self.snapshots[db.db_file].simulations(table_id)
+            else:
+                candidates = self.memo.simulations(db, table_id, memo)
+            if candidates is None:
+                found = db.retrieve_simulations(table_id, rows, exact=exact)
+            else:
+                found = candidates.matches(rows, exact=exact)
+                if not db.readonly and any(len(f) for f in found):
+                    db.touch_simulations({m.id for f in found for m in f})
+            for match, f in zip(matches, found):
+                match.extend(f)
         return matches
 
 
 
+def _sidecar(root: Path, db: Database) -> Path:
+    """The snapshot directory of the fixed database *db*, under the writable cache *root*"""
+    from hashlib import sha256
+    return root / 'snapshots' / sha256(str(db.db_file.resolve()).encode()).hexdigest()[:32]
+
+
 FILESYSTEM = FileSystem.from_config('database')
 
 
@@ -146,6 +505,7 @@ def cache_instr(instr: Instr, mpi: bool = False, acc: bool = False, mccode_versi
     if len(query) > 1:
         raise RuntimeError(f"Multiple entries for instr_hash={instr_hash} in {FILESYSTEM}")
     elif len(query) == 1:
+        FILESYSTEM.touch_instr_file(query[0].id)
         return query[0]
 
     instr_file_entry = InstrEntry.from_instr(instr, mpi=mpi, acc=acc,
@@ -159,6 +519,13 @@ def cache_instr(instr: Instr, mpi: bool = False, acc: bool = False, mccode_versi
     return instr_file_entry
 
 
+def cache_instr_files(entries: list[InstrEntry]):
+    """Cache many already compiled instrument entries in a single database transaction"""
+    if not len(entries):
+        return
+    FILESYSTEM.insert_instr_files(entries)
+
+
 def cache_get_instr(instr: Instr, mpi: bool = False, acc: bool = False) -> InstrEntry | None:
     from .tables import instr_json_hash
     instr_hash = instr_json_hash(instr)
@@ -166,6 +533,7 @@ def cache_get_instr(instr: Instr, mpi: bool = False, acc: bool = False) -> Instr
     if len(query) > 1:
         raise RuntimeError(f"Multiple entries for instr_hash={instr_hash} in {FILESYSTEM}")
     elif len(query) == 1:
+        FILESYSTEM.touch_instr_file(query[0].id)
         return query[0]
     return None
 
@@ -194,11 +562,16 @@ def cache_simulation_table(entry: InstrEntry, row: SimulationEntry) -> Simulatio
 
 def cache_has_simulation(entry: InstrEntry, row: SimulationEntry) -> bool:
     table = cache_simulation_table(entry, row)
-    query = FILESYSTEM.retrieve_simulation(table.id, row)
+    query = FILESYSTEM.retrieve_simulation(table.id, row, exact=True)
     return len(query) > 0
 
 
 def cache_get_simulation(entry: InstrEntry, row: SimulationEntry) -> list[SimulationEntry]:
+    """Retrieve every cached simulation which matches *row* within its precision
+
+    Unlike :func:`cache_get_simulations`, simulations identical to *row* are not preferred, so that
+    callers can choose among all matches, e.g., via :func:`~restage.tables.best_simulation_entry_match`.
+    """
     table = cache_simulation_table(entry, row)
     query = FILESYSTEM.retrieve_simulation(table.id, row)
     if len(query) == 0:
@@ -206,6 +579,101 @@ def cache_get_simulation(entry: InstrEntry, row: SimulationEntry) -> list[Simula
     return query
 
 
+def cache_has_simulations(entry: InstrEntry, rows: list[SimulationEntry]) -> list[bool]:
+    if not len(rows):
+        return []
+    table = cache_simulation_table(entry, rows[0])
+    return [len(q) > 0 for q in FILESYSTEM.retrieve_simulations(table.id, rows, exact=True)]
+
+
+def cache_get_simulations(entry: InstrEntry, rows: list[SimulationEntry]) -> list[list[SimulationEntry]]:
+    """Retrieve the cached simulations matching each of many rows, with one pass over each database
+
+    A row for which a simulation identical to it is cached, per :meth:`SimulationEntry.exact_hash`,
+    is given only the identical simulations, while other rows are given every simulation which matches
+    them within their precision, as by :func:`cache_get_simulation`.  The rows of a scan carry the
+    seed, particle count and gravitation of the run, so an identical simulation is exactly what was
+    asked for, and preferring it lets most rows be answered via the indexed hash instead of comparing
+    them with every cached simulation.  For a row without a seed or particle count, the identical
+    simulation may be chosen over one with more particles which :func:`cache_get_simulation` followed
+    by :func:`~restage.tables.best_simulation_entry_match` would prefer.
+    """
+    if not len(rows):
+        return []
+    table = cache_simulation_table(entry, rows[0])
+    for row in rows[1:]:
+        verify_table_parameters(table, row.parameter_values)
+    query = FILESYSTEM.retrieve_simulations(table.id, rows, exact=True)
+    missing = sum(1 for q in query if len(q) == 0)
+    if missing:
+        raise RuntimeError(f"Expected 1 or more entry for {table.id} in {FILESYSTEM} for every row, "
+                           f"got none for {missing} of {len(rows)} rows")
+    return query
+
+
+def cache_find_simulations(entry: InstrEntry, rows: list[SimulationEntry]) -> list[list[SimulationEntry]]:
+    """Retrieve all cached simulations matching each of many rows, which may be none"""
+    if not len(rows):
+        return []
+    table = cache_simulation_table(entry, rows[0])
+    return FILESYSTEM.retrieve_simulations(table.id, rows)
+
+
+def cache_simulation_neighbours(entry: InstrEntry, row: SimulationEntry) -> list[SimulationNeighbours]:
+    """The reusable spatial indexes of the cached simulations of *entry*, in the precision of *row*"""
+    table = cache_simulation_table(entry, row)
+    return FILESYSTEM.simulation_neighbours(table.id, row.precision)
+
+
+def cache_flush_access_times():
+    """Write the buffered access times of cached tables and simulations, e.g., at the end of a scan"""
+    FILESYSTEM.flush_access_times()
+
+
+@contextmanager
+def cache_keep_in_use(entries: list[InstrEntry], simulations=None):
+    """Keep the instruments *entries*, and the simulations returned by *simulations*, from being evicted
+
+    Their access times are written on entry and again every half of the eviction grace period, see
+    :func:`~restage.maintenance.eviction_grace`, until the context exits, so that other processes do
+    not evict what a long-running scan still uses.
+    """
+    from threading import Event, Thread
+    from .maintenance import eviction_grace
+    interval = eviction_grace(FILESYSTEM) * 86400 / 2
+    stop = Event()
+
+    def touch():
+        for entry in entries:
+            FILESYSTEM.touch_instr_file(entry.id)
+        if simulations is not None:
+            FILESYSTEM.touch_simulations({sim.id for sim in simulations() if sim is not None})
+        FILESYSTEM.flush_access_times()
+
+    def keep():
+        while not stop.wait(interval):
+            touch()
+
+    touch()
+    thread = Thread(target=keep, name='restage-keep-in-use', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
 def cache_simulation(entry: InstrEntry, simulation: SimulationEntry):
     table = cache_simulation_table(entry, simulation)
     FILESYSTEM.insert_simulation(table, simulation)
+
+
+def cache_simulations(entry: InstrEntry, simulations: list[SimulationEntry]):
+    """Cache many simulations of one instrument in a single database transaction"""
+    if not len(simulations):
+        return
+    table = cache_simulation_table(entry, simulations[0])
+    for simulation in simulations[1:]:
+        verify_table_parameters(table, simulation.parameter_values)
+    FILESYSTEM.insert_simulations(table, simulations)
@@ -1,15 +1,176 @@
 from __future__ import annotations
 
+import atexit
 import sqlite3
+from contextlib import contextmanager
 from pathlib import Path
+from weakref import WeakSet
 
 from sqlmodel import SQLModel, Session, select, create_engine
 
 from .models import (
-    InstrModel, SimulationTableModel, NexusStructureModel, SimulationModel,
+    InstrModel, SimulationTableModel, NexusStructureModel, SimulationModel, SimulationValueModel,
     utc_timestamp,
 )
-from .tables import SimulationEntry, InstrEntry, SimulationTableEntry, NexusStructureEntry
+from .tables import SimulationEntry, SimulationSchema, InstrEntry, SimulationTableEntry, NexusStructureEntry
+
+
+# Databases with buffered access times, which are written when the interpreter exits
+_BUFFERED: WeakSet = WeakSet()
+
+
+def _flush_at_exit() -> None:
+    for db in list(_BUFFERED):
+        try:
+            db.flush_access_times()
+        except Exception as error:
+            from zenlog import log
+            log.warn(f'Could not record the access times of {db.db_file}: {error}')
+
+
+atexit.register(_flush_at_exit)
+
+
+def _json_deserializer():
+    """The fastest available JSON decoder, used for the JSON columns of every database"""
+    try:
+        from msgspec.json import decode
+    except ImportError:
+        from json import loads as decode
+    return decode
+
+
+# The columns of stored simulations needed to match them and to construct SimulationEntry objects
+_STORED_COLUMNS = ('id', 'parameter_values', 'seed', 'ncount', 'output_path', 'gravitation', 'creation', 'last_access')
+
+
+def _user_version(conn) -> int:
+    return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+# The tables of the first schema version, and the columns appended to them since
+_BASELINE_TABLES = {
+    'instr_file': InstrModel,
+    'nexus_structures': NexusStructureModel,
+    'simulation_tables': SimulationTableModel,
+    'simulations': SimulationModel,
+}
+_APPENDED_COLUMNS = {'simulations': ('parameter_hash', 'derived_from')}
+
+
+def _unversioned_schema(conn, db_file: Path) -> int:
+    """The schema version of a database written before versions were recorded, 0 if it has no tables
+
+    Tables which are not those of any known version are never dropped, since that would discard
+    the cached simulations they refer to; the database must be moved aside instead.
+    """
+    from sqlalchemy import inspect
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    if not existing & set(_BASELINE_TABLES):
+        return 0
+    for name, model in _BASELINE_TABLES.items():
+        if name not in existing:
+            raise ValueError(f'Table {name} does not exist in database {db_file}')
+        expected = list(model.__table__.c.keys())
+        actual = [c['name'] for c in inspector.get_columns(name)]
+        if actual != expected[:len(actual)] or not set(expected[len(actual):]) <= set(_APPENDED_COLUMNS.get(name, ())):
+            raise ValueError(f'Table {name} in {db_file} has columns {actual} but expected {expected}; '
+                             f'move the database aside to start a new cache')
+    if SimulationValueModel.__tablename__ not in existing:
+        return 1
+    columns = [c['name'] for c in inspector.get_columns('simulations')]
+    if 'parameter_hash' not in columns:
+        return 2
+    return 3 if 'derived_from' not in columns else 4
+
+
+def _stored_simulations(session: Session):
+    """Every stored simulation, with only the columns of the first schema version"""
+    table = SimulationModel.__table__
+    tables = {row.id: row.parameters or [] for row in session.execute(
+        select(SimulationTableModel.__table__.c.id, SimulationTableModel.__table__.c.parameters)).all()}
+    for s in session.execute(select(table.c.table_id, *(table.c[name] for name in _STORED_COLUMNS))).all():
+        yield s, SimulationEntry.from_model(s, tables.get(s.table_id, list((s.parameter_values or {}).keys())))
+
+
+def _add_value_index(session: Session) -> None:
+    """Version 2: mirror numeric parameter values into the indexed ``simulation_values`` table"""
+    SimulationValueModel.__table__.create(session.connection(), checkfirst=True)
+    session.execute(SimulationValueModel.__table__.delete())
+    for s, entry in _stored_simulations(session):
+        session.add_all(entry.to_value_models(s.table_id))
+
+
+def _add_column(session: Session, model: type[SQLModel], name: str) -> None:
+    """Append the column *name* of *model* to its existing table, with its indexes"""
+    table = model.__table__
+    column = table.c[name]
+    session.connection().exec_driver_sql(
+        f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(dialect=session.bind.dialect)}')
+    for index in table.indexes:
+        if column.name in index.columns:
+            index.create(session.connection(), checkfirst=True)
+
+
+def _add_parameter_hash(session: Session) -> None:
+    """Version 3: store the indexed ``parameter_hash`` of every simulation"""
+    from sqlalchemy import bindparam
+    table = SimulationModel.__table__
+    _add_column(session, SimulationModel, 'parameter_hash')
+    hashes = [{'_id': s.id, 'hash': entry.exact_hash()} for s, entry in _stored_simulations(session)]
+    if len(hashes):
+        session.execute(table.update().where(table.c.id == bindparam('_id')).values(parameter_hash=bindparam('hash')),
+                        hashes)
+
+
+def _add_derived_from(session: Session) -> None:
+    """Version 4: record the simulation which a simulation was derived from, e.g., by truncating its output"""
+    _add_column(session, SimulationModel, 'derived_from')
+
+
+# The ordered steps which migrate a database from schema version ``i + 1`` to ``i + 2``, keeping all of its rows.
+# A change to the models must append a step here; steps, once released, must never change.
+MIGRATIONS = (_add_value_index, _add_parameter_hash, _add_derived_from)
+# The schema version of databases written by this version of restage, stored in their ``PRAGMA user_version``
+SCHEMA_VERSION = len(MIGRATIONS) + 1
+
+
+# SQLite attaches at most ten databases to one connection by default, besides its main database
+_MAX_ATTACHED = 10
+# The tables which an attached database must have, with all of their current columns, to be queried with others
+_ATTACHED_TABLES = ('instr_file', 'simulation_tables')
+
+
+def _is_locked(error: Exception) -> bool:
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_when_locked(method):
+    """Repeat a :class:`Database` operation which failed because another connection kept the database locked
+
+    SQLite already waits for up to ``busy_timeout`` seconds for a lock, but some lock conflicts
+    are reported immediately; the operation is then repeated up to ``lock_retries`` times after
+    a randomised, exponentially increasing delay.  Failed write transactions are rolled back,
+    so repeating them is safe.  Only the outermost operations are decorated, and they call the
+    undecorated helpers of others, so that a conflict is never retried at several levels at once.
+    """
+    from functools import wraps
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        from random import uniform
+        from time import sleep
+        from sqlalchemy.exc import OperationalError
+        for attempt in range(self.lock_retries + 1):
+            try:
+                return method(self, *args, **kwargs)
+            except (OperationalError, sqlite3.OperationalError) as error:
+                if attempt == self.lock_retries or not _is_locked(error):
+                    raise
+                sleep(uniform(0.5, 1.0) * min(0.05 * 2 ** attempt, 5.0))
+    return wrapper
 
 
 class Database:
@@ -20,75 +181,166 @@ class Database:
     :mod:`restage.cache` and existing tests require minimal changes.
 
     Schema is managed by SQLModel/SQLAlchemy via
-    ``SQLModel.metadata.create_all``.  On open, tables whose column list does
-    not match the current model definition are dropped and recreated (writable
-    databases only; read-only databases raise ``ValueError`` on mismatch).
+    ``SQLModel.metadata.create_all``, and its version is stored in the
+    database's ``PRAGMA user_version``.  Opening a database of the current
+    :data:`SCHEMA_VERSION` only reads that integer; writable databases of an
+    older version are brought up to date in place by the ordered
+    :data:`MIGRATIONS`, which keep every stored row.
+
+    Numeric simulation parameter values are mirrored into the indexed
+    ``simulation_values`` table, which answers tolerance queries with range
+    lookups, and each simulation stores an indexed ``parameter_hash`` which
+    finds identical simulations directly.  Read-only databases created before
+    either existed are still usable, but
+    are searched by loading every row of a simulation table.
+
+    All access goes through one connection per object, so ``PRAGMA data_version``
+    (see :meth:`version`) only changes when another connection, typically in
+    another process, commits to the database; together with the count of this
+    object's own changes it tells in-memory caches when they are out of date.
+    A read-only database opened as *immutable* is assumed to never change while
+    in use, so SQLite takes no locks on it and its version is constant; it must
+    have been checkpointed, since its write-ahead log is ignored.
+
+    Many processes can share one database: writable databases use the
+    *journal_mode* (by default ``wal``, so that readers never wait for a
+    writer), each connection waits up to *busy_timeout* seconds for a lock,
+    and writes which still find the database locked are retried up to
+    *lock_retries* times.  Write transactions are kept short, and separate
+    from the reads which precede them.
+
+    Reading an instrument, simulation table or simulation does not write its new
+    ``last_access`` time immediately.  The times are buffered and written in
+    one transaction every *flush_interval* seconds, by :meth:`flush_access_times`,
+    on :meth:`close`, and when the interpreter exits.  A crash can lose at most
+    the buffered times, which are only bookkeeping, and never leaves them
+    partially written.
     """
 
     def __init__(self, db_file: Path,
                  instr_file_table: str | None = None,
                  nexus_structures_table: str | None = None,
                  simulations_table: str | None = None,
-                 readonly: bool = False):
-        from os import access, W_OK
+                 readonly: bool = False,
+                 journal_mode: str | None = 'wal',
+                 busy_timeout: float = 30.0,
+                 lock_retries: int = 5,
+                 flush_interval: float = 60.0,
+                 immutable: bool = False):
+        from os import access, getpid, W_OK
+        from time import monotonic
+        from threading import RLock
         self.db_file = db_file
         self.readonly = readonly or not access(db_file.parent, W_OK)
+        self.immutable = self.readonly and immutable
         # Table name attributes kept for API compat; values are fixed by the models.
         self.instr_file_table = 'instr_file'
         self.nexus_structures_table = 'nexus_structures'
         self.simulations_table = 'simulation_tables'
         self.verbose = False
+        self.value_index = True
+        self.exact_index = True
+        self.derivations = True
+        self.changes = 0
+        self.busy_timeout = busy_timeout
+        self.lock_retries = lock_retries
+        self.flush_interval = flush_interval
+        self._connection = None
+        self._lock = RLock()
+        self._attached: list[tuple[str, Database]] = []
+        self._hub: tuple[Database, str] | None = None
+        self._pid = getpid()
+        self._accessed_instr_files: dict[str, float] = {}
+        self._accessed_tables: dict[str, float] = {}
+        self._accessed_simulations: dict[str, float] = {}
+        self._last_flush = monotonic()
 
         if self.readonly:
             def _ro_creator():
-                return sqlite3.connect(f'file:{db_file}?mode=ro', uri=True)
-            self.engine = create_engine('sqlite+pysqlite://', creator=_ro_creator)
+                return sqlite3.connect(self._uri, uri=True, timeout=busy_timeout)
+            self.engine = create_engine('sqlite+pysqlite://', creator=_ro_creator,
+                                        json_deserializer=_json_deserializer())
         else:
-            self.engine = create_engine(f'sqlite:///{db_file}')
-            SQLModel.metadata.create_all(self.engine)
-
-        self._validate_schema(db_file)
+            # URI filenames are enabled so that read-only databases can be attached, see :meth:`attach`
+            self.engine = create_engine(f'sqlite:///{db_file}', connect_args={'timeout': busy_timeout, 'uri': True},
+                                        json_deserializer=_json_deserializer())
+            if journal_mode is not None:
+                self._set_journal_mode(journal_mode)
+            self._migrate()
+        if self.readonly:
+            self._check_schema()
 
-    def _validate_schema(self, db_file: Path) -> None:
-        """Drop/recreate tables whose columns no longer match the current models."""
-        from sqlalchemy import inspect as sa_inspect
+    @retry_when_locked
+    def _set_journal_mode(self, journal_mode: str) -> None:
+        """Switch the (persistent) journal mode of the database file, and tune new connections for it"""
+        from sqlalchemy import event
         from zenlog import log
-
-        inspector = sa_inspect(self.engine)
-        existing_tables = set(inspector.get_table_names())
-
-        expected: dict[str, type[SQLModel]] = {
-            'instr_file': InstrModel,
-            'nexus_structures': NexusStructureModel,
-            'simulation_tables': SimulationTableModel,
-            'simulations': SimulationModel,
-        }
-
-        needs_recreate: list[str] = []
-        for table_name, model_cls in expected.items():
-            expected_cols = list(model_cls.__table__.c.keys())
-            if table_name in existing_tables:
-                actual_cols = [c['name'] for c in inspector.get_columns(table_name)]
-                if actual_cols != expected_cols:
-                    if not self.readonly:
-                        log.warn(
-                            f'Table {table_name} in {db_file} has columns {actual_cols} '
-                            f'but expected {expected_cols}; dropping and recreating.'
-                        )
-                        needs_recreate.append(table_name)
-                    else:
-                        raise ValueError(
-                            f'Table {table_name} in readonly database {db_file} has outdated schema '
-                            f'(columns {actual_cols}, expected {expected_cols})'
-                        )
-            elif self.readonly:
-                raise ValueError(f'Table {table_name} does not exist in readonly database {db_file}')
-
-        if needs_recreate:
-            with self.engine.begin() as conn:
-                for table_name in needs_recreate:
-                    conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{table_name}"')
-            SQLModel.metadata.create_all(self.engine)
+        with self.engine.connect() as conn:
+            mode = conn.exec_driver_sql(f'PRAGMA journal_mode={journal_mode}').scalar()
+        if str(mode).lower() != journal_mode.lower():
+            log.warn(f'Could not set journal mode of {self.db_file} to {journal_mode}, it remains {mode}')
+        elif mode.lower() == 'wal':
+            # committed transactions are durable once the write-ahead log is checkpointed, which is safe in WAL mode
+            @event.listens_for(self.engine, 'connect')
+            def _synchronous(dbapi_connection, _):
+                dbapi_connection.execute('PRAGMA synchronous=NORMAL')
+
+    @retry_when_locked
+    def _migrate(self) -> None:
+        """Create the tables of a new database, or bring those of an older database up to :data:`SCHEMA_VERSION`
+
+        Each step of :data:`MIGRATIONS` runs in its own write transaction, which also records the
+        new ``user_version``, so that an interrupted migration resumes where it stopped and
+        concurrent processes wait for each other rather than migrating the same database twice.
+        """
+        from zenlog import log
+        with self.engine.connect() as conn:
+            if _user_version(conn) == SCHEMA_VERSION:
+                return
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            version = _user_version(conn) or _unversioned_schema(conn, self.db_file)
+            if version == 0:
+                SQLModel.metadata.create_all(conn)
+                version = SCHEMA_VERSION
+            elif version > SCHEMA_VERSION:
+                raise ValueError(f'{self.db_file} has schema version {version}, which is newer than '
+                                 f'{SCHEMA_VERSION}; upgrade restage to write to it')
+            elif version < SCHEMA_VERSION:
+                log.info(f'Migrating {self.db_file} from schema version {version} to {SCHEMA_VERSION}')
+                # tables created after the first version are made by the step which introduced them
+                SQLModel.metadata.create_all(conn, tables=[m.__table__ for m in _BASELINE_TABLES.values()])
+            conn.exec_driver_sql(f'PRAGMA user_version = {version}')
+            conn.commit()
+            while version < SCHEMA_VERSION:
+                conn.exec_driver_sql('BEGIN IMMEDIATE')
+                if _user_version(conn) == version:
+                    with Session(bind=conn) as session:
+                        MIGRATIONS[version - 1](session)
+                        session.flush()
+                    conn.exec_driver_sql(f'PRAGMA user_version = {version + 1}')
+                conn.commit()
+                version = _user_version(conn)
+
+    def _check_schema(self) -> None:
+        """Find which of the schema's indexes a read-only database has, from its version"""
+        from zenlog import log
+        with self.engine.connect() as conn:
+            version = _user_version(conn) or _unversioned_schema(conn, self.db_file)
+        if version == 0:
+            raise ValueError(f'{self.db_file} is not a restage database')
+        if version > SCHEMA_VERSION:
+            log.warn(f'Readonly database {self.db_file} has schema version {version}, newer than {SCHEMA_VERSION}')
+        self.value_index = version >= 2
+        self.exact_index = version >= 3
+        self.derivations = version >= 4
+
+    def _select_stored(self, *columns):
+        """A Core select of stored simulation rows, without constructing ORM objects"""
+        from sqlalchemy import literal_column
+        table = SimulationModel.__table__
+        position = literal_column(f'{table.name}.rowid').label('position')
+        columns = _STORED_COLUMNS + (('derived_from',) if self.derivations else ()) + columns
+        return select(*(table.c[name] for name in columns), position)
 
     def close(self) -> None:
         """Dispose the SQLAlchemy engine, releasing all pooled connections.
@@ -96,11 +348,21 @@ class Database:
         Call this (or use the database as a context manager) before deleting
         the object on Windows, where open file handles prevent ``unlink()``.
         """
+        self.flush_access_times()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
         self.engine.dispose()
 
     def __del__(self) -> None:
         # CPython reference-counting ensures this runs immediately on `del db`,
         # closing connections before the caller tries to unlink the file.
+        try:
+            self.flush_access_times()
+        except Exception:
+            pass
+        if getattr(self, '_connection', None) is not None:
+            self._connection.close()
         if hasattr(self, 'engine'):
             self.engine.dispose()
 
@@ -110,8 +372,81 @@ class Database:
     def __exit__(self, *_) -> None:
         self.close()
 
-    def _session(self) -> Session:
-        return Session(self.engine, expire_on_commit=False)
+    @property
+    def connection(self):
+        """The connection used for all access to the database by this object"""
+        if self._connection is None:
+            self._connection = self.engine.connect()
+            driver = self._connection.connection.driver_connection
+            for schema, db in self._attached:
+                driver.execute(f'ATTACH DATABASE ? AS "{schema}"', (db._uri,))
+        return self._connection
+
+    @property
+    def _uri(self) -> str:
+        """The URI used to open, or attach, this database read-only"""
+        return self.db_file.resolve().as_uri() + ('?mode=ro&immutable=1' if self.immutable else '?mode=ro')
+
+    def attach(self, databases: list[Database]) -> list[Database]:
+        """Attach read-only *databases* to the connection of this database, and return those attached
+
+        The tables of the attached databases are then read through this connection, e.g., by
+        :func:`union_query` in a single statement with this database, and their
+        :meth:`version` is checked through it too.  Databases which are writable, already
+        attached elsewhere, or are missing tables or columns are not attached, nor are
+        databases beyond the SQLite limit; they continue to be queried separately.
+        """
+        if self.readonly:
+            return []
+        attached = []
+        with self._lock:
+            self.connection.commit()
+            driver = self.connection.connection.driver_connection
+            for db in databases:
+                if not db.readonly or db._hub is not None or db is self or len(self._attached) >= _MAX_ATTACHED:
+                    continue
+                schema = f'fixed{len(self._attached)}'
+                try:
+                    driver.execute(f'ATTACH DATABASE ? AS "{schema}"', (db._uri,))
+                    complete = all(
+                        {row[1] for row in driver.execute(f'PRAGMA "{schema}".table_info("{name}")')}.issuperset(
+                            SQLModel.metadata.tables[name].c.keys())
+                        for name in _ATTACHED_TABLES)
+                except sqlite3.Error:
+                    complete = False
+                if not complete:
+                    try:
+                        driver.execute(f'DETACH DATABASE "{schema}"')
+                    except sqlite3.Error:
+                        pass
+                    continue
+                self._attached.append((schema, db))
+                db._hub = self, schema
+                attached.append(db)
+        return attached
+
+    @contextmanager
+    def _session(self):
+        with self._lock, Session(bind=self.connection, expire_on_commit=False) as session:
+            yield session
+
+    def version(self) -> tuple[int, int]:
+        """The ``PRAGMA data_version`` of the database and the number of changes made through this object
+
+        The pair changes whenever the stored data changes, whoever made the change.
+        The data version of an attached database is read through the connection it is attached to,
+        and that of an immutable database is never read, since it can not change.
+        """
+        if self.immutable:
+            return 0, self.changes
+        if self._hub is not None:
+            hub, schema = self._hub
+            with hub._lock:
+                driver = hub.connection.connection.driver_connection
+                return driver.execute(f'PRAGMA "{schema}".data_version').fetchone()[0], self.changes
+        with self._lock:
+            driver = self.connection.connection.driver_connection
+            return driver.execute('PRAGMA data_version').fetchone()[0], self.changes
 
     def announce(self, msg: str) -> None:
         if self.verbose:
@@ -134,11 +469,17 @@ class Database:
     # ------------------------------------------------------------------
 
     def insert_instr_file(self, instr_file: InstrEntry) -> None:
+        self.insert_instr_files([instr_file])
+
+    @retry_when_locked
+    def insert_instr_files(self, instr_files: list[InstrEntry]) -> None:
+        """Insert many instrument entries in one transaction"""
         if self.readonly:
             raise ValueError('Cannot insert into readonly database')
         with self._session() as session:
-            session.add(instr_file)
+            session.add_all(instr_files)
             session.commit()
+            self.changes += 1
 
     def retrieve_instr_file(self, instr_id: str) -> list[InstrEntry]:
         with self._session() as session:
@@ -151,10 +492,18 @@ class Database:
                 stmt = stmt.where(getattr(InstrModel, k) == v)
             return list(session.exec(stmt).all())
 
+    def touch_instr_file(self, instr_id: str) -> None:
+        """Record a use of the instrument *instr_id*, to be written by :meth:`flush_access_times`"""
+        if self.readonly:
+            return
+        self._accessed_instr_files[instr_id] = utc_timestamp()
+        self._buffered()
+
     def all_instr_files(self) -> list[InstrEntry]:
         with self._session() as session:
             return list(session.exec(select(InstrModel)).all())
 
+    @retry_when_locked
     def delete_instr_file(self, instr_id: str) -> None:
         if self.readonly:
             raise ValueError('Cannot delete from readonly database')
@@ -163,17 +512,20 @@ class Database:
             if obj is not None:
                 session.delete(obj)
                 session.commit()
+                self.changes += 1
 
     # ------------------------------------------------------------------
     # NexusStructureModel (NexusStructureEntry)
     # ------------------------------------------------------------------
 
+    @retry_when_locked
     def insert_nexus_structure(self, nexus_structure: NexusStructureEntry) -> None:
         if self.readonly:
             raise ValueError('Cannot insert into readonly database')
         with self._session() as session:
             session.add(nexus_structure)
             session.commit()
+            self.changes += 1
 
     def retrieve_nexus_structure(self, id: str) -> list[NexusStructureEntry]:
         with self._session() as session:
@@ -183,12 +535,17 @@ class Database:
     # SimulationTableModel (SimulationTableEntry)
     # ------------------------------------------------------------------
 
+    @retry_when_locked
     def insert_simulation_table(self, entry: SimulationTableEntry) -> None:
+        self._insert_simulation_table(entry)
+
+    def _insert_simulation_table(self, entry: SimulationTableEntry) -> None:
         if self.readonly:
             raise ValueError('Cannot insert into readonly database')
         with self._session() as session:
             session.add(entry)
             session.commit()
+            self.changes += 1
 
     def retrieve_simulation_table(self, primary_id: str,
                                    update_access_time: bool = True) -> list[SimulationTableEntry]:
@@ -196,17 +553,30 @@ class Database:
             results = list(session.exec(
                 select(SimulationTableModel).where(SimulationTableModel.id == primary_id)
             ).all())
-            if not self.readonly and update_access_time and results:
-                now = utc_timestamp()
-                for r in results:
-                    r.last_access = now
-                session.commit()
-            return results
+        if update_access_time and results:
+            self.touch_simulation_table(primary_id)
+        return results
+
+    def touch_simulation_table(self, primary_id: str) -> None:
+        """Record an access of the simulation table *primary_id*, to be written by :meth:`flush_access_times`"""
+        if self.readonly:
+            return
+        self._accessed_tables[primary_id] = utc_timestamp()
+        self._buffered()
+
+    def count_simulations(self, primary_id: str) -> int:
+        """The number of simulations stored for the simulation table *primary_id*"""
+        from sqlalchemy import func
+        with self._session() as session:
+            return session.exec(
+                select(func.count()).select_from(SimulationModel).where(SimulationModel.table_id == primary_id)
+            ).one()
 
     def retrieve_all_simulation_tables(self) -> list[SimulationTableEntry]:
         with self._session() as session:
             return list(session.exec(select(SimulationTableModel)).all())
 
+    @retry_when_locked
     def delete_simulation_table(self, primary_id: str) -> None:
         if self.readonly:
             raise ValueError('Cannot delete from readonly database')
@@ -217,10 +587,16 @@ class Database:
             ).all()
             for s in sims:
                 session.delete(s)
+            values = session.exec(
+                select(SimulationValueModel).where(SimulationValueModel.table_id == primary_id)
+            ).all()
+            for v in values:
+                session.delete(v)
             table = session.get(SimulationTableModel, primary_id)
             if table is not None:
                 session.delete(table)
             session.commit()
+            self.changes += 1
 
     def query_simulation_table(self, entry: SimulationTableEntry,
                                 use_id: bool = False,
@@ -253,6 +629,11 @@ class Database:
     # ------------------------------------------------------------------
 
     def insert_simulation(self, simulation: SimulationTableEntry, parameters: SimulationEntry) -> None:
+        self.insert_simulations(simulation, [parameters])
+
+    @retry_when_locked
+    def insert_simulations(self, simulation: SimulationTableEntry, entries: list[SimulationEntry]) -> None:
+        """Insert many simulations of the table *simulation* in one transaction"""
         if self.readonly:
             raise ValueError('Cannot insert into readonly database')
         if not self.retrieve_simulation_table(simulation.id, update_access_time=False):
@@ -265,58 +646,291 @@ class Database:
                 name=simulation.name,
                 parameters=list(simulation.parameters or []),
             )
-            self.insert_simulation_table(local_table)
+            self._insert_simulation_table(local_table)
         with self._session() as session:
-            session.add(parameters.to_model(simulation.id))
+            for parameters in entries:
+                session.add(parameters.to_model(simulation.id))
+                session.add_all(parameters.to_value_models(simulation.id))
             session.commit()
+            self.changes += 1
 
-    def retrieve_simulation(self, primary_id: str, pars: SimulationEntry) -> list[SimulationEntry]:
+    def retrieve_simulation(self, primary_id: str, pars: SimulationEntry, exact: bool = False) -> list[SimulationEntry]:
         """Retrieve all simulations for *primary_id* that match *pars* within tolerance.
 
-        All rows for the given ``table_id`` are loaded and filtered in Python via
-        :meth:`~restage.tables.SimulationEntry.matches_candidate`.  For typical cache
-        sizes (hundreds to low thousands of rows per table) this is fast; if scale
-        becomes a concern, the JSON ``parameter_values`` column could be indexed or the
-        query could be moved to a dedicated table.
+        See :meth:`retrieve_simulations`, which this calls with a single row.
+        """
+        return self.retrieve_simulations(primary_id, [pars], exact=exact)[0]
+
+    def retrieve_simulations(self, primary_id: str, rows: list[SimulationEntry],
+                             exact: bool = False) -> list[list[SimulationEntry]]:
+        """Retrieve the simulations for *primary_id* that match each of *rows* within tolerance.
+
+        With *exact* set, rows which have identical stored simulations are answered with only
+        those, found via the indexed ``parameter_hash``; the tolerance search is then only done
+        for the remaining rows.  This suits callers that need any (or the best) match rather
+        than all of them, since an identical simulation is always the closest match.
+
+        The numeric parameter values of each row select its candidate simulations via
+        range lookups on the indexed ``simulation_values`` table; only those candidates
+        are loaded and compared with the semantics of
+        :meth:`~restage.tables.SimulationEntry.matches_candidate`, which also compares
+        string values, seed, ncount and gravitation.  Rows without numeric values, or
+        databases without the index, fall back to loading every row of the table once
+        and resolving all such queries together.  Candidates are loaded as plain rows and
+        compared via :class:`~restage.tables.SimulationCandidates`, so that
+        :class:`~restage.tables.SimulationEntry` objects are only built for the matches.
         """
+        import numpy as np
+        from .tables import SimulationCandidates
         matches = self.retrieve_simulation_table(primary_id)
         if len(matches) != 1:
             raise RuntimeError(f"Expected exactly one match for id={primary_id}, got {matches}")
         param_names = matches[0].parameters or []
+        results: list[list[SimulationEntry]] = [[] for _ in rows]
+        row_ids: list[set[str] | None] = []
         with self._session() as session:
-            sim_models = session.exec(
-                select(SimulationModel).where(SimulationModel.table_id == primary_id)
-            ).all()
-            candidates = [SimulationEntry.from_model(s, param_names) for s in sim_models]
-            results = [c for c in candidates if pars.matches_candidate(c)]
-            if not self.readonly and results:
-                now = utc_timestamp()
-                ids = {r.id for r in results}
-                for s in sim_models:
-                    if s.id in ids:
-                        s.last_access = now
-                session.commit()
-            return results
+            remaining = list(range(len(rows)))
+            if exact and self.exact_index:
+                remaining = self._retrieve_exact_simulations(session, primary_id, param_names, rows, results)
+            rows = [rows[i] for i in remaining]
+            if self.value_index:
+                row_ids = [self._indexed_simulation_ids(session, primary_id, row) for row in rows]
+            else:
+                row_ids = [None for _ in rows]
 
+            if not len(rows):
+                stored = []
+            elif any(ids is None for ids in row_ids):
+                stored = list(session.execute(
+                    self._select_stored().where(SimulationModel.table_id == primary_id)
+                ).all())
+            else:
+                needed = sorted(set().union(*row_ids))
+                stored = []
+                for first in range(0, len(needed), 500):
+                    stored.extend(session.execute(
+                        self._select_stored().where(SimulationModel.id.in_(needed[first:first + 500]))
+                    ).all())
+        # the candidates matched by each row are in the order they were stored
+        stored.sort(key=lambda row: row.position)
+        candidates = SimulationCandidates()
+        candidates.extend_stored(stored, param_names)
+        found = candidates.match_many(rows)
+        for i, ids in enumerate(row_ids):
+            if ids is not None:
+                found[i] &= np.array([row.id in ids for row in stored], dtype=bool)
+            results[remaining[i]] = [candidates.entry(n) for n in found[i].nonzero()[0]]
+
+        if not self.readonly and any(len(r) for r in results):
+            self.touch_simulations({m.id for r in results for m in r})
+        return results
+
+    def touch_simulations(self, ids: set[str]) -> None:
+        """Record an access of the simulations with *ids*, to be written by :meth:`flush_access_times`"""
+        if self.readonly:
+            return
+        now = utc_timestamp()
+        self._accessed_simulations.update((x, now) for x in ids)
+        self._buffered()
+
+    def _buffered(self) -> None:
+        from time import monotonic
+        _BUFFERED.add(self)
+        if monotonic() - self._last_flush >= self.flush_interval:
+            self.flush_access_times()
+
+    @retry_when_locked
+    def flush_access_times(self) -> None:
+        """Write the buffered access times of instruments, simulation tables and simulations in one transaction
+
+        Stored times are never moved backwards, so that flushes from several processes can interleave.
+        """
+        self._flush_access_times()
+
+    def _flush_access_times(self) -> None:
+        from os import getpid
+        from time import monotonic
+        from sqlalchemy import bindparam, func, update
+        self._last_flush = monotonic()
+        buffers = ((InstrModel, self._accessed_instr_files), (SimulationTableModel, self._accessed_tables),
+                   (SimulationModel, self._accessed_simulations))
+        if getpid() != self._pid or not any(buffer for _, buffer in buffers):
+            # a forked child must not write through the connection it inherited
+            return
+        flushed = [(model, buffer, dict(buffer)) for model, buffer in buffers]
+        with self._session() as session:
+            connection = session.connection()
+            for model, _, times in flushed:
+                if len(times):
+                    table = model.__table__
+                    connection.execute(
+                        update(table).where(table.c.id == bindparam('b_id'))
+                        .values(last_access=func.max(table.c.last_access, bindparam('b_time'))),
+                        [{'b_id': k, 'b_time': v} for k, v in times.items()],
+                    )
+            session.commit()
+        for _, buffer, times in flushed:
+            for k, v in times.items():
+                # another thread may have recorded a newer access, or flushed this one, meanwhile
+                if buffer.get(k) == v:
+                    buffer.pop(k, None)
+        _BUFFERED.discard(self)
+
+    def _retrieve_exact_simulations(self, session: Session, primary_id: str, param_names: list[str],
+                                    rows: list[SimulationEntry], results: list[list[SimulationEntry]]) -> list[int]:
+        """Fill *results* for the rows with identical stored simulations, returning the indexes of the others"""
+        hashes = [row.exact_hash() for row in rows]
+        unique = sorted(set(hashes))
+        found: dict[str, list] = {}
+        for first in range(0, len(unique), 500):
+            for s in session.execute(self._select_stored('parameter_hash').where(
+                    SimulationModel.table_id == primary_id,
+                    SimulationModel.parameter_hash.in_(unique[first:first + 500]))).all():
+                found.setdefault(s.parameter_hash, []).append(s)
+        schema = SimulationSchema(param_names)
+        remaining = []
+        for i, (row, h) in enumerate(zip(rows, hashes)):
+            candidates = [SimulationEntry.from_model(s, param_names, schema) for s in found.get(h, [])]
+            results[i] = [c for c in candidates if row.matches_candidate(c)]
+            if not len(results[i]):
+                remaining.append(i)
+        return remaining
+
+    @staticmethod
+    def _indexed_simulation_ids(session: Session, primary_id: str, row: SimulationEntry) -> set[str] | None:
+        """The ids of simulations whose indexed values are all within tolerance of *row*.
+
+        Returns ``None`` if *row* has no numeric values to search for.
+        """
+        from sqlalchemy import and_, or_, func
+        values = row.indexed_values()
+        if not len(values):
+            return None
+        conditions = []
+        for name, value in values.items():
+            # floating point values match within tolerance, integers must be identical;
+            # the window is widened slightly so that rounding can not exclude a matching candidate
+            width = row.precision[name] * (1 + 1e-6) if row.parameter_values[name].is_float else 0
+            conditions.append(and_(SimulationValueModel.table_id == primary_id,
+                                   SimulationValueModel.name == name,
+                                   SimulationValueModel.value.between(value - width, value + width)))
+        stmt = (select(SimulationValueModel.simulation_id)
+                .where(or_(*conditions))
+                .group_by(SimulationValueModel.simulation_id)
+                .having(func.count() == len(conditions)))
+        return set(session.exec(stmt).all())
+
+    @retry_when_locked
     def delete_simulation(self, primary_id: str, simulation_id: str) -> None:
         if self.readonly:
             raise ValueError('Cannot delete from readonly database')
         with self._session() as session:
             obj = session.get(SimulationModel, simulation_id)
             if obj is not None:
+                values = session.exec(
+                    select(SimulationValueModel).where(SimulationValueModel.simulation_id == simulation_id)
+                ).all()
+                for v in values:
+                    session.delete(v)
                 session.delete(obj)
                 session.commit()
+                self.changes += 1
 
     def retrieve_all_simulations(self, primary_id: str) -> list[SimulationEntry]:
+        return self.retrieve_simulation_candidates(primary_id).candidates
+
+    def retrieve_simulation_candidates(self, primary_id: str):
+        """All simulations for *primary_id* as :class:`~restage.tables.SimulationCandidates`
+
+        The rows are read without constructing ORM objects, and each
+        :class:`~restage.tables.SimulationEntry` is only constructed when it is first used.
+        """
+        from .tables import SimulationCandidates
         matches = self.retrieve_simulation_table(primary_id)
         if len(matches) != 1:
             raise RuntimeError(f"Expected exactly one match for id={primary_id}, got {matches}")
-        param_names = matches[0].parameters or []
+        candidates = SimulationCandidates()
+        candidates.extend_stored(self.retrieve_stored_simulations(primary_id), matches[0].parameters or [])
+        return candidates
+
+    def retrieve_stored_simulations(self, primary_id: str) -> list:
+        """All simulations for *primary_id* as plain rows, with the columns of stored simulations"""
         with self._session() as session:
-            sim_models = session.exec(
-                select(SimulationModel).where(SimulationModel.table_id == primary_id)
+            return session.execute(self._select_stored().where(SimulationModel.table_id == primary_id)).all()
+
+    # ------------------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------------------
+
+    def simulation_usage(self) -> list:
+        """The id, table_id, output_path, last_access and creation of every stored simulation, least recently used first"""
+        table = SimulationModel.__table__
+        with self._session() as session:
+            return session.execute(
+                select(table.c.id, table.c.table_id, table.c.output_path, table.c.last_access, table.c.creation)
+                .order_by(table.c.last_access)
             ).all()
-            return [SimulationEntry.from_model(s, param_names) for s in sim_models]
+
+    def instr_usage(self) -> list:
+        """The id, binary_path, json_path, last_access and creation of every instrument, least recently used first
+
+        An instrument is used whenever it or its simulation table is accessed.
+        """
+        from sqlalchemy import func
+        instr, tables = InstrModel.__table__, SimulationTableModel.__table__
+        last = func.max(instr.c.last_access, func.coalesce(tables.c.last_access, instr.c.last_access))
+        with self._session() as session:
+            return session.execute(
+                select(instr.c.id, instr.c.binary_path, instr.c.json_path, last.label('last_access'),
+                       instr.c.creation)
+                .outerjoin(tables, tables.c.id == instr.c.id)
+                .order_by(last)
+            ).all()
+
+    @retry_when_locked
+    def evict(self, simulation_ids: list[str], instr_ids: list[str] = ()) -> None:
+        """Delete the simulations with *simulation_ids*, and the instruments with *instr_ids*, in one transaction
+
+        The simulation table, NeXus structure and simulations of each instrument are deleted with it.
+        """
+        from sqlalchemy import delete, or_
+        if self.readonly:
+            raise ValueError('Cannot delete from readonly database')
+        simulation_ids, instr_ids = list(simulation_ids), list(instr_ids)
+        values, simulations = SimulationValueModel.__table__, SimulationModel.__table__
+        with self._session() as session:
+            connection = session.connection()
+            for first in range(0, max(len(simulation_ids), len(instr_ids)), 500):
+                sims, instrs = simulation_ids[first:first + 500], instr_ids[first:first + 500]
+                connection.execute(delete(values).where(
+                    or_(values.c.simulation_id.in_(sims), values.c.table_id.in_(instrs))))
+                connection.execute(delete(simulations).where(
+                    or_(simulations.c.id.in_(sims), simulations.c.table_id.in_(instrs))))
+                for model in (SimulationTableModel, NexusStructureModel, InstrModel):
+                    table = model.__table__
+                    connection.execute(delete(table).where(table.c.id.in_(instrs)))
+            session.commit()
+            self.changes += 1
+        for buffer, ids in ((self._accessed_simulations, simulation_ids), (self._accessed_tables, instr_ids),
+                            (self._accessed_instr_files, instr_ids)):
+            for k in ids:
+                buffer.pop(k, None)
+
+    @retry_when_locked
+    def compact(self) -> None:
+        """Rebuild the indexes, refresh the query planner statistics and reclaim unused space
+
+        Runs ``REINDEX``, ``ANALYZE`` and ``VACUUM``, then truncates the write-ahead log.
+        ``VACUUM`` rewrites the whole database and needs as much free disk space again.
+        """
+        if self.readonly:
+            raise ValueError('Cannot compact a readonly database')
+        self._flush_access_times()
+        with self._lock:
+            self.connection.commit()
+            driver = self.connection.connection.driver_connection
+            for statement in ('REINDEX', 'ANALYZE', 'VACUUM', 'PRAGMA wal_checkpoint(TRUNCATE)'):
+                driver.execute(statement)
 
     # ------------------------------------------------------------------
     # Schema inspection helpers (kept for API compatibility)
@@ -338,3 +952,51 @@ class Database:
         actual = self.retrieve_column_names(table_name)
         return actual[:len(columns)] == columns
 
+
+def _schema_table(model: type[SQLModel], schema: str):
+    """The table of *model* in the attached database *schema*"""
+    from sqlalchemy import MetaData
+    key = model.__tablename__, schema
+    if key not in _SCHEMA_TABLES:
+        _SCHEMA_TABLES[key] = model.__table__.to_metadata(MetaData(), schema=schema)
+    return _SCHEMA_TABLES[key]
+
+
+_SCHEMA_TABLES: dict[tuple[str, str], object] = {}
+
+
+def union_query(model: type[SQLModel], databases: list[Database], search: dict) -> list[list]:
+    """The rows of the table of *model* which match *search* in each of *databases*
+
+    Databases attached to a common connection, see :meth:`Database.attach`, are queried with one
+    ``UNION ALL`` statement on that connection; any others are queried separately.
+    """
+    from sqlalchemy import literal, union_all
+    results: list[list] = [[] for _ in databases]
+    groups: dict[int, tuple[Database, list[tuple[int, str]]]] = {}
+    for index, db in enumerate(databases):
+        hub, schema = db._hub if db._hub is not None else (db, 'main')
+        if db._hub is None and not db._attached:
+            with db._session() as session:
+                stmt = select(model)
+                for k, v in search.items():
+                    stmt = stmt.where(getattr(model, k) == v)
+                results[index] = list(session.exec(stmt).all())
+            continue
+        groups.setdefault(id(hub), (hub, []))[1].append((index, schema))
+    for hub, members in groups.values():
+        parts = []
+        for index, schema in members:
+            table = _schema_table(model, schema)
+            stmt = select(*table.c, literal(index).label('_source'))
+            for k, v in search.items():
+                stmt = stmt.where(table.c[k] == v)
+            parts.append(stmt)
+        names = model.__table__.c.keys()
+        with hub._lock:
+            rows = hub.connection.execute(union_all(*parts) if len(parts) > 1 else parts[0]).all()
+            hub.connection.commit()
+        for row in rows:
+            results[row._source].append(model(**{name: getattr(row, name) for name in names}))
+    return results
+
@@ -0,0 +1,426 @@
+"""Reclaim the disk space used by the writable cache
+
+Primary simulation outputs (under the cache root's ``sim`` directory) and compiled
+instruments (under its ``bin`` directory) are evicted least-recently-used first,
+together with their database rows, once they are older than a maximum age or while
+the cache is larger than its quota.  Directories which no database row refers to, and
+rows whose files are gone, are garbage collected.  Only the writable database and files
+below the cache root are ever touched; fixed caches and user-provided binaries are left alone.
+The MCPL files of primary simulations which have not been used recently can also be recompressed.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+@dataclass
+class Eviction:
+    """The simulations, instruments and directories selected for removal, and the sizes of their files"""
+    simulations: list[str] = field(default_factory=list)
+    instruments: list[str] = field(default_factory=list)
+    paths: list[Path] = field(default_factory=list)
+    freed: int = 0
+    remaining: int = 0
+
+    def __len__(self):
+        return len(self.simulations) + len(self.instruments)
+
+
+def disk_usage(path: Path) -> int:
+    """The total size in bytes of the files under *path*, without following symbolic links"""
+    from os import scandir
+    total = 0
+    try:
+        entries = list(scandir(path))
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += disk_usage(Path(entry.path))
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def newest_mtime(path: Path, since: float | None = None) -> float:
+    """The latest modification time of *path* and of anything under it, without following symbolic links
+
+    A running simulation writes into files inside its directory, which does not change the
+    modification time of the directory itself.  The search stops once anything modified after
+    *since* is found.
+    """
+    from os import scandir
+    newest = path.stat().st_mtime
+    pending = [path]
+    while pending and (since is None or newest <= since):
+        try:
+            entries = list(scandir(pending.pop()))
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        for entry in entries:
+            try:
+                newest = max(newest, entry.stat(follow_symlinks=False).st_mtime)
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(Path(entry.path))
+            except FileNotFoundError:
+                pass
+    return newest
+
+
+def human_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if size < 1024 or unit == 'TiB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def parse_quota(quota) -> int | None:
+    """A quota in bytes from, e.g., 500000000, '500G', '500 GB' or '2Ti'; None for no quota"""
+    if quota is None or isinstance(quota, int):
+        return quota
+    suffix_value = {
+        'Ki': 2 ** 10, 'Mi': 2 ** 20, 'Gi': 2 ** 30, 'Ti': 2 ** 40, 'Pi': 2 ** 50,
+        'k': 1000, 'K': 1000, 'M': 10 ** 6, 'G': 10 ** 9, 'T': 10 ** 12, 'P': 10 ** 15,
+    }
+    text = str(quota).strip().removesuffix('B').strip()
+    for suffix, value in suffix_value.items():
+        if text.endswith(suffix):
+            return int(float(text[:-len(suffix)]) * value)
+    return int(float(text))
+
+
+def _owned(path, under: Path) -> Path | None:
+    """*path* if it is a directory inside of *under*, otherwise None"""
+    if not path:
+        return None
+    path = Path(path).resolve()
+    if path == under or not path.is_relative_to(under) or not path.is_dir():
+        return None
+    return path
+
+
+def eviction_grace(filesystem) -> float:
+    """The default grace period of :func:`plan_eviction` in days, one hour or the flush interval of the
+    writable database of *filesystem* if that is longer"""
+    return max(3600.0, filesystem.db_write.flush_interval) / 86400
+
+
+def plan_eviction(filesystem, quota: int | None = None, max_age: float | None = None,
+                  now: float | None = None, grace: float | None = None) -> Eviction:
+    """Select what to evict from the writable database and cache directory of *filesystem*
+
+    Everything last used more than *max_age* days before *now* is selected, then the least recently
+    used simulations and instruments until the remaining files take at most *quota* bytes.
+    Evicting an instrument evicts its simulations too.
+    Nothing created or used within *grace* days of *now* is selected, since other processes buffer
+    their access times and may still be using it; by default see :func:`eviction_grace`.
+    """
+    from .models import utc_timestamp
+    db, root = filesystem.db_write, Path(filesystem.root).resolve()
+    now = utc_timestamp() if now is None else now
+    cutoff = None if max_age is None else now - max_age * 86400
+    recent = now - (eviction_grace(filesystem) if grace is None else grace) * 86400
+
+    sizes: dict[Path, int] = {}
+    children: dict[str, list] = {}
+    items = []
+    for s in db.simulation_usage():
+        if (path := _owned(s.output_path, root / 'sim')) is not None and path not in sizes:
+            sizes[path] = disk_usage(path)
+            item = (max(s.last_access or 0, s.creation or 0), 'simulation', s.id, path)
+            children.setdefault(s.table_id, []).append(item)
+            items.append(item)
+    for i in db.instr_usage():
+        if (path := _owned(Path(i.binary_path).parent, root / 'bin')) is not None and path not in sizes:
+            sizes[path] = disk_usage(path)
+            items.append((max(i.last_access or 0, i.creation or 0), 'instrument', i.id, path))
+    items.sort(key=lambda item: item[0])
+
+    plan = Eviction(remaining=sum(sizes.values()))
+    evicted: set[str] = set()
+
+    def select(kind, key, path):
+        evicted.add(key)
+        getattr(plan, f'{kind}s').append(key)
+        plan.paths.append(path)
+        plan.freed += sizes[path]
+        plan.remaining -= sizes[path]
+
+    for last_access, kind, key, path in items:
+        if key in evicted:
+            continue
+        expired = cutoff is not None and last_access < cutoff
+        if last_access >= recent or (not expired and (quota is None or plan.remaining <= quota)):
+            break
+        if kind == 'instrument' and any(used >= recent for used, *_ in children.get(key, [])):
+            continue
+        select(kind, key, path)
+        if kind == 'instrument':
+            for _, child_kind, child, child_path in children.get(key, []):
+                if child not in evicted:
+                    select(child_kind, child, child_path)
+    return plan
+
+
+def evict(filesystem=None, quota: int | None = None, max_age: float | None = None,
+          dry_run: bool = False, now: float | None = None, grace: float | None = None) -> Eviction:
+    """Evict least-recently-used simulations and instruments from the writable cache
+
+    The selected directories are first moved aside, then their database rows are deleted in one
+    transaction, and only then are the directories removed; if the rows can not be deleted the
+    directories are restored, so that no database row ever refers to a partially deleted directory.
+    """
+    if filesystem is None:
+        from .cache import FILESYSTEM as filesystem
+    filesystem.flush_access_times()
+    plan = plan_eviction(filesystem, quota, max_age, now, grace)
+    if not dry_run:
+        _remove(filesystem, plan)
+    return plan
+
+
+def _remove(filesystem, plan: Eviction) -> None:
+    """Remove the directories and database rows of *plan*, see :func:`evict`"""
+    from shutil import rmtree
+    from uuid import uuid4
+    if not len(plan) and not len(plan.paths):
+        return
+    trash = Path(filesystem.root).resolve() / f'.evicting-{uuid4().hex}'
+    trash.mkdir()
+    moved = []
+    try:
+        for number, path in enumerate(plan.paths):
+            try:
+                path.rename(trash / str(number))
+            except FileNotFoundError:
+                continue
+            moved.append((path, trash / str(number)))
+        if len(plan):
+            filesystem.db_write.evict(plan.simulations, plan.instruments)
+    except BaseException:
+        for path, moved_to in moved:
+            moved_to.rename(path)
+        rmtree(trash, ignore_errors=True)
+        raise
+    rmtree(trash, ignore_errors=True)
+
+
+def plan_collection(filesystem, grace: float = 1.0, now: float | None = None) -> Eviction:
+    """Select the orphaned directories and dangling database rows of *filesystem*
+
+    Directories directly under the cache root's ``sim``, ``bin`` and ``readable`` directories which no
+    database row refers to are orphans, e.g., left by interrupted simulations or scans, but only once
+    nothing in them has been modified for *grace* days, see :func:`newest_mtime`, since a running
+    simulation records its directory when it finishes.
+    Rows of the writable database whose output directory or instrument binary no longer exists
+    are dangling; the simulations of a dangling instrument are removed with it.
+    """
+    from .models import utc_timestamp
+    root = Path(filesystem.root).resolve()
+    now = utc_timestamp() if now is None else now
+    db = filesystem.db_write
+    plan = Eviction()
+
+    instruments = db.instr_usage()
+    missing = {i.id for i in instruments if i.binary_path and not Path(i.binary_path).exists()}
+    plan.instruments.extend(i.id for i in instruments if i.id in missing)
+    referenced: set[Path] = set()
+    for store in (*filesystem.db_fixed, db):
+        for s in store.simulation_usage():
+            if not s.output_path:
+                continue
+            path = Path(s.output_path).resolve()
+            if store is db and not path.exists():
+                plan.simulations.append(s.id)
+            elif store is not db or s.table_id not in missing:
+                referenced.add(path)
+        referenced.update(Path(i.binary_path).parent.resolve() for i in store.instr_usage()
+                          if i.binary_path and (store is not db or i.id not in missing))
+
+    orphans = [path for sub in ('sim', 'bin', 'readable') if (root / sub).is_dir() for path in (root / sub).iterdir()]
+    # directories of interrupted evictions
+    orphans.extend(root.glob('.evicting-*'))
+    for path in orphans:
+        try:
+            if not path.is_dir() or path.is_symlink() or path.resolve() in referenced:
+                continue
+            if newest_mtime(path, since=now - grace * 86400) > now - grace * 86400:
+                continue
+        except FileNotFoundError:
+            continue
+        size = disk_usage(path)
+        plan.paths.append(path)
+        plan.freed += size
+    return plan
+
+
+def collect_garbage(filesystem=None, grace: float = 1.0, dry_run: bool = False, compact: bool = True,
+                    now: float | None = None) -> Eviction:
+    """Remove orphaned cache directories and dangling database rows, then compact the writable database
+
+    Removal follows the same steps as :func:`evict`, and compaction is :meth:`Database.compact`.
+    """
+    if filesystem is None:
+        from .cache import FILESYSTEM as filesystem
+    filesystem.flush_access_times()
+    plan = plan_collection(filesystem, grace, now)
+    if not dry_run:
+        _remove(filesystem, plan)
+        if compact:
+            filesystem.db_write.compact()
+    return plan
+
+
+def configured_limits() -> tuple[int | None, float | None]:
+    """The cache quota in bytes and maximum age in days, from the ``cache_quota`` and ``cache_max_age`` settings"""
+    from .config import config
+    quota = config['cache_quota'].get() if config['cache_quota'].exists() else None
+    max_age = config['cache_max_age'].get() if config['cache_max_age'].exists() else None
+    return parse_quota(quota), None if max_age is None else float(max_age)
+
+
+def evict_configured() -> Eviction | None:
+    """Apply the configured quota and maximum age to the cache, if either is set"""
+    from zenlog import log
+    quota, max_age = configured_limits()
+    if quota is None and max_age is None:
+        return None
+    plan = evict(quota=quota, max_age=max_age)
+    if len(plan):
+        log.info(f'Evicted {len(plan.simulations)} simulations and {len(plan.instruments)} instruments '
+                 f'from the cache, freeing {human_size(plan.freed)}')
+    return plan
+
+
+def configured_compression(instrument: str, cold: bool = False) -> str | None:
+    """The compression of the cached MCPL files of the primary *instrument*, None to keep them as written
+
+    Read from the ``mcpl_compression`` setting, or for files unused for ``mcpl_cold_age`` days from
+    ``mcpl_cold_compression``; either is one of :data:`~restage.mcpl.MCPL_COMPRESSION`, or a mapping
+    from instrument names to those with an optional ``default``.
+    """
+    from .config import config
+    setting = config['mcpl_cold_compression' if cold else 'mcpl_compression']
+    policy = setting.get() if setting.exists() else None
+    if isinstance(policy, dict):
+        policy = policy.get(instrument, policy.get('default'))
+    return policy
+
+
+def plan_recompression(filesystem, max_age: float, now: float | None = None) -> list[tuple[Path, str]]:
+    """Select the MCPL files of primary simulations last used more than *max_age* days before *now*
+
+    Each is paired with the cold compression of its instrument, see :func:`configured_compression`,
+    unless it is already stored that way.
+    """
+    from .mcpl import mcpl_real_extension, _compression
+    from .models import utc_timestamp
+    db, root = filesystem.db_write, Path(filesystem.root).resolve()
+    now = utc_timestamp() if now is None else now
+    # compiled instruments are named for the instrument
+    names = {i.id: Path(i.binary_path).stem for i in db.instr_usage() if i.binary_path}
+    plan = []
+    for s in db.simulation_usage():
+        if (s.last_access or 0) >= now - max_age * 86400:
+            break
+        if (path := _owned(s.output_path, root / 'sim')) is None:
+            continue
+        if (compression := configured_compression(names.get(s.table_id, ''), cold=True)) is None:
+            continue
+        stored: dict[str, list[Path]] = {}
+        for file in sorted(path.iterdir()):
+            if file.is_file() and not file.name.startswith('.') and (ext := mcpl_real_extension(file)):
+                stored.setdefault(file.name.removesuffix(ext), []).append(file)
+        plan.extend((files[0], compression) for files in stored.values()
+                    if len(files) > 1 or _compression(files[0]) != compression)
+    return plan
+
+
+def recompress(filesystem=None, max_age: float = 7.0, dry_run: bool = False,
+               now: float | None = None) -> list[tuple[Path, str]]:
+    """Recompress the MCPL files of cached primary simulations which have not been used for *max_age* days"""
+    from .mcpl import mcpl_compress
+    if filesystem is None:
+        from .cache import FILESYSTEM as filesystem
+    filesystem.flush_access_times()
+    plan = plan_recompression(filesystem, max_age, now)
+    if not dry_run:
+        plan = [(mcpl_compress(file, compression), compression) for file, compression in plan]
+    return plan
+
+
+def recompress_configured() -> list[tuple[Path, str]] | None:
+    """Recompress cold MCPL files as configured by ``mcpl_cold_compression`` and ``mcpl_cold_age``, if set"""
+    from zenlog import log
+    from .config import config
+    if not config['mcpl_cold_compression'].exists() or config['mcpl_cold_compression'].get() is None:
+        return None
+    max_age = config['mcpl_cold_age'].get(float) if config['mcpl_cold_age'].exists() else 7.0
+    plan = recompress(max_age=max_age)
+    if len(plan):
+        log.info(f'Recompressed {len(plan)} MCPL files unused for {max_age} days')
+    return plan
+
+
+def script():
+    from argparse import ArgumentParser
+    parser = ArgumentParser('restage_cache', description='Maintain the restage cache')
+    commands = parser.add_subparsers(dest='command', required=True)
+    evict_parser = commands.add_parser('evict', help='Evict least-recently-used simulations and instruments')
+    evict_parser.add_argument('--quota', type=str, default=None,
+                              help='Maximum total size of the cache, e.g., 500G or 2Ti -- DEFAULT: cache_quota')
+    evict_parser.add_argument('--max-age', type=float, default=None, metavar='DAYS',
+                              help='Evict everything unused for longer than DAYS -- DEFAULT: cache_max_age')
+    evict_parser.add_argument('--dry-run', action='store_true', default=False,
+                              help='Only report what would be evicted')
+    collect_parser = commands.add_parser('gc', help='Remove orphaned directories and dangling database entries, '
+                                                    'then compact the database')
+    collect_parser.add_argument('--grace', type=float, default=1.0, metavar='DAYS',
+                                help='Keep unreferenced directories modified within DAYS -- DEFAULT: 1')
+    collect_parser.add_argument('--no-compact', action='store_true', default=False,
+                                help='Do not VACUUM, ANALYZE and REINDEX the database')
+    collect_parser.add_argument('--dry-run', action='store_true', default=False,
+                                help='Only report what would be removed')
+    compress_parser = commands.add_parser('compress', help='Recompress the MCPL files of cached simulations '
+                                                           'which have not been used recently')
+    compress_parser.add_argument('--max-age', type=float, default=None, metavar='DAYS',
+                                 help='Recompress files unused for longer than DAYS -- DEFAULT: mcpl_cold_age')
+    compress_parser.add_argument('--dry-run', action='store_true', default=False,
+                                 help='Only report what would be recompressed')
+    args = parser.parse_args()
+
+    if args.command == 'gc':
+        plan = collect_garbage(grace=args.grace, dry_run=args.dry_run, compact=not args.no_compact)
+        verb = 'Would remove' if args.dry_run else 'Removed'
+        for path in plan.paths:
+            print(f'{verb} {path}')
+        print(f'{verb} {len(plan.paths)} orphaned directories, freeing {human_size(plan.freed)}, '
+              f'and {len(plan.simulations)} simulations and {len(plan.instruments)} instruments without files')
+    elif args.command == 'compress':
+        from .config import config
+        max_age = args.max_age
+        if max_age is None:
+            max_age = config['mcpl_cold_age'].get(float) if config['mcpl_cold_age'].exists() else 7.0
+        plan = recompress(max_age=max_age, dry_run=args.dry_run)
+        verb = 'Would recompress' if args.dry_run else 'Recompressed'
+        for path, compression in plan:
+            print(f'{verb} {path} with {compression}')
+        print(f'{verb} {len(plan)} MCPL files')
+    elif args.command == 'evict':
+        quota, max_age = configured_limits()
+        quota = quota if args.quota is None else parse_quota(args.quota)
+        max_age = max_age if args.max_age is None else args.max_age
+        plan = evict(quota=quota, max_age=max_age, dry_run=args.dry_run)
+        verb = 'Would evict' if args.dry_run else 'Evicted'
+        for path in plan.paths:
+            print(f'{verb} {path}')
+        print(f'{verb} {len(plan.simulations)} simulations and {len(plan.instruments)} instruments, '
+              f'freeing {human_size(plan.freed)}; {human_size(plan.remaining)} remain')
+
+
+if __name__ == '__main__':
+    script()
@@ -1,3 +1,6 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
 from pathlib import Path
 
 
@@ -5,10 +8,10 @@ def mcpl_real_filename(filename: Path) -> Path:
     """MCPL_output from McCode instruments has the bad habit of changing the output file name silently.
     Find the _real_ output file name by looking for the expected variants"""
     base, ext = filename.parent / filename.stem, filename.suffix
-    if ext in ('.gz',):
+    if ext in ('.gz', '.zst'):
         ext = base.suffix + ext
         base = base.parent / base.stem
-    extensions = {'.mcpl.gz', '.mcpl', ''}
+    extensions = ('.mcpl', '.mcpl.gz', '.mcpl.zst', '')
     if ext not in extensions:
         ValueError(f'Unsupported file extension: {ext}')
     for ext in extensions:
@@ -19,54 +22,313 @@ def mcpl_real_filename(filename: Path) -> Path:
 
 
 def mcpl_real_extension(filename: Path) -> str:
-    for ext in ('.mcpl.gz', '.mcpl'):
+    for ext in ('.mcpl.gz', '.mcpl.zst', '.mcpl'):
         if str(filename).endswith(ext):
             return ext
     return ''
 
 
+@dataclass
+class MCPLHeader:
+    """The header of an MCPL file, see https://mctools.github.io/mcpl/mcpl.pdf for the format"""
+    version: int
+    little_endian: bool
+    particles: int
+    particle_size: int
+    source: str
+    comments: list[str] = field(default_factory=list)
+    blobs: dict[str, bytes] = field(default_factory=dict)
+    user_flags: bool = False
+    polarisation: bool = False
+    single_precision: bool = False
+    universal_pdg_code: int = 0
+    universal_weight: float = 0.0
+    # The size of the header in bytes, i.e., the (uncompressed) position of the first particle
+    length: int = 0
+    compressed: bool = False
+
+
+# The extensions of MCPL files stored with each supported compression
+MCPL_COMPRESSION = {'none': '.mcpl', 'gzip': '.mcpl.gz', 'zstd': '.mcpl.zst'}
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError('Reading or writing zstd compressed MCPL files requires the zstandard package, '
+                           'install it via `pip install restage[fast]`')
+    return zstandard
+
+
+def _open_mcpl(filename: Path):
+    """Open an MCPL file for reading, decompressing it on the fly if it is gzip or zstd compressed"""
+    from gzip import GzipFile
+    file = open(filename, 'rb')
+    magic = file.read(4)
+    file.seek(0)
+    if magic[:2] == b'\x1f\x8b':
+        return GzipFile(fileobj=file, mode='rb'), True
+    if magic == b'\x28\xb5\x2f\xfd':
+        try:
+            return _zstandard().ZstdDecompressor().stream_reader(file, closefd=True), True
+        except RuntimeError:
+            file.close()
+            raise
+    return file, False
+
+
+def _write_mcpl(file, compression: str):
+    """A writer for the MCPL file opened as *file*, which compresses what is written to it"""
+    from gzip import GzipFile
+    if compression == 'gzip':
+        return GzipFile(fileobj=file, mode='wb', compresslevel=6)
+    if compression == 'zstd':
+        return _zstandard().ZstdCompressor(level=3).stream_writer(file, closefd=False)
+    return file
+
+
+def _read_exactly(file, size: int, filename) -> bytes:
+    data = file.read(size)
+    if len(data) != size:
+        raise RuntimeError(f'Unexpected end of MCPL header in {filename}')
+    return data
+
+
+def _read_mcpl_header(file, filename, compressed: bool = False) -> MCPLHeader:
+    from struct import unpack
+    start = _read_exactly(file, 8, filename)
+    if start[:4] != b'MCPL' or not start[4:7].isdigit() or start[7:8] not in (b'L', b'B'):
+        raise RuntimeError(f'{filename} is not an MCPL file')
+    version = int(start[4:7])
+    if version not in (2, 3):
+        raise RuntimeError(f'{filename} is in unsupported MCPL format version {version}')
+    order = '<' if start[7:8] == b'L' else '>'
+    particles, = unpack(f'{order}Q', _read_exactly(file, 8, filename))
+    (comments, blobs, user_flags, polarisation, single_precision, pdg_code, particle_size,
+     weighted) = unpack(f'{order}8I', _read_exactly(file, 32, filename))
+    length = 48
+    weight = 0.0
+    if weighted:
+        weight, = unpack(f'{order}d', _read_exactly(file, 8, filename))
+        length += 8
+
+    def read_buffer() -> bytes:
+        nonlocal length
+        size, = unpack(f'{order}I', _read_exactly(file, 4, filename))
+        length += 4 + size
+        return _read_exactly(file, size, filename)
+
+    source = read_buffer().decode('utf-8', errors='replace')
+    comment_list = [read_buffer().decode('utf-8', errors='replace') for _ in range(comments)]
+    keys = [read_buffer().decode('utf-8', errors='replace') for _ in range(blobs)]
+    blob_dict = {key: read_buffer() for key in keys}
+    # the universal PDG code is stored as an unsigned integer, but may be negative (anti-particles)
+    pdg_code = pdg_code - 2 ** 32 if pdg_code >= 2 ** 31 else pdg_code
+    return MCPLHeader(version=version, little_endian=order == '<', particles=particles, particle_size=particle_size,
+                      source=source, comments=comment_list, blobs=blob_dict, user_flags=bool(user_flags),
+                      polarisation=bool(polarisation), single_precision=bool(single_precision),
+                      universal_pdg_code=pdg_code, universal_weight=weight, length=length, compressed=compressed)
+
+
+def mcpl_read_header(filename) -> MCPLHeader:
+    """Read the header of an MCPL file, which may be gzipped, without reading any of its particles
+
+    An uncompressed file which was not closed properly, e.g., by an interrupted simulation, records too
+    few particles in its header; the count is then recovered from the file size, as ``mcpltool`` does.
+    """
+    from zenlog import log
+    filename = mcpl_real_filename(Path(filename))
+    file, compressed = _open_mcpl(filename)
+    with file:
+        header = _read_mcpl_header(file, filename, compressed)
+    if not compressed and header.particle_size:
+        stored = (filename.stat().st_size - header.length) // header.particle_size
+        if stored < header.particles:
+            raise RuntimeError(f'{filename} records {header.particles} particles but holds only {stored}')
+        if stored > header.particles:
+            log.warn(f'{filename} records {header.particles} particles but holds {stored}, '
+                     f'it was probably not closed properly')
+            header.particles = stored
+    return header
+
+
 def mcpl_particle_count(filename):
-    """Call the MCPL command line tool to get the number of particles in an MCPL file"""
-    # There _is_ a Python module for reading MCPL files, but it doesn't close file handles!
-    from subprocess import run, PIPE
-    import re
-    command = ['mcpltool', '--justhead', str(mcpl_real_filename(filename))]
-    result = run(command, stdout=PIPE)
-    if result.returncode != 0:
-        raise RuntimeError(f'mcpltool failed with return code {result.returncode}')
-    info = result.stdout.decode('utf-8')
-    r = re.compile(r'No\. of particles\s*:\s*(\d+)')
-    m = r.search(info)
-    if m is None:
-        raise RuntimeError(f'Could not find number of particles in {info}')
-    return int(m.group(1))
+    """The number of particles in an MCPL file, read from its header"""
+    return mcpl_read_header(filename).particles
+
+
+# The fields of MCPL headers which must agree for their particles to be concatenated byte-for-byte
+_MERGE_FIELDS = ('version', 'little_endian', 'particle_size', 'user_flags', 'polarisation', 'single_precision',
+                 'universal_pdg_code', 'universal_weight')
+# The size of the chunks in which particles are copied, bounding the memory used by a merge
+_MERGE_CHUNK = 16 * 2 ** 20
+
+
+def _copy_particles(source, compressed: bool, offset: int, size: int, destination, direct: bool) -> None:
+    """Copy *size* bytes of particles, starting at the uncompressed *offset* of *source*, to *destination*
+
+    Between uncompressed files the copy is done by the kernel, via ``copy_file_range`` or ``sendfile``
+    where available; otherwise the particles are streamed in bounded chunks.
+    """
+    import os
+    if direct and not compressed:
+        copy = getattr(os, 'copy_file_range', None)
+        try:
+            destination.flush()
+            while size > 0:
+                if copy is not None:
+                    copied = copy(source.fileno(), destination.fileno(), min(size, 2 ** 30), offset)
+                else:
+                    copied = os.sendfile(destination.fileno(), source.fileno(), offset, min(size, 2 ** 30))
+                if copied == 0:
+                    raise RuntimeError(f'Unexpected end of particles in {source.name}')
+                offset += copied
+                size -= copied
+            destination.seek(0, os.SEEK_END)
+            return
+        except (AttributeError, OSError):
+            # e.g., no kernel support, or a file system which does not provide it; continue with a normal copy
+            destination.seek(0, os.SEEK_END)
+    source.seek(offset)
+    while size > 0:
+        chunk = source.read(min(size, _MERGE_CHUNK))
+        if not chunk:
+            raise RuntimeError(f'Unexpected end of particles in {getattr(source, "name", source)}')
+        destination.write(chunk)
+        size -= len(chunk)
 
 
 def mcpl_merge_files(files: list[Path], filepath: Path, keep_originals: bool = False):
-    """Merge a list of MCPL files into a single file using mcpltool.
+    """Merge a list of MCPL files into a single file, without running mcpltool.
+
+    The particles of all files are streamed into one file, which has the header of the first file with
+    only its particle count changed, so the files must share their particle format.  The merged file is
+    compressed if the first file is, and it replaces any existing file only once it is complete.
 
     :param files: The list of files to merge.
-    :param filename: The name of the output file.
+    :param filepath: The name of the output file, its extension is replaced to match the first file.
     :param keep_originals: Whether to keep the original files.
 
-    :raises RuntimeError: If mcpltool fails.
-
-    :note: This function is not thread-safe.
-        A future version of the Python mcpl package might include a merge function.
+    :raises RuntimeError: If the files can not be merged.
     """
-    from subprocess import run
+    import os
+    from struct import pack
+    from tempfile import NamedTemporaryFile
+    from zenlog import log
     real_filenames = [mcpl_real_filename(f) for f in files]
+    headers = [mcpl_read_header(f) for f in real_filenames]
+    first = headers[0]
+    for name, header in zip(real_filenames[1:], headers[1:]):
+        different = [f for f in _MERGE_FIELDS if getattr(header, f) != getattr(first, f)]
+        if len(different):
+            raise RuntimeError(f'Can not merge {name} with {real_filenames[0]}, their {", ".join(different)} differ')
+        if (header.source, header.comments, header.blobs) != (first.source, first.comments, first.blobs):
+            log.debug(f'Merging {name} with {real_filenames[0]}, whose header comments differ, keeps the latter')
     # if the real filenames have .mcpl or .mcpl.gz, the merged filename should too
     ext = mcpl_real_extension(real_filenames[0])
-    filename = filepath.with_suffix(ext).as_posix()
+    filename = filepath.with_suffix(ext)
 
-    command = ['mcpltool', '--merge', filename] + [str(f) for f in real_filenames]
-    result = run(command)
-    if result.returncode != 0:
-        raise RuntimeError(f'mcpltool failed with return code {result.returncode} for command {" ".join(command)}')
+    # the header of the first file, with the total number of particles
+    opened, _ = _open_mcpl(real_filenames[0])
+    with opened:
+        header = bytearray(opened.read(first.length))
+    header[8:16] = pack('<Q' if first.little_endian else '>Q', sum(h.particles for h in headers))
+
+    with NamedTemporaryFile('wb', dir=filename.parent, prefix=f'.{filename.name}.', delete=False) as output:
+        try:
+            destination = _write_mcpl(output, _compression(real_filenames[0]))
+            with destination:
+                destination.write(header)
+                for name, h in zip(real_filenames, headers):
+                    source, compressed = _open_mcpl(name)
+                    with source:
+                        _copy_particles(source, compressed, h.length, h.particles * h.particle_size,
+                                        destination, not first.compressed)
+        except BaseException:
+            output.close()
+            os.unlink(output.name)
+            raise
+    os.chmod(output.name, real_filenames[0].stat().st_mode & 0o777)
+    os.replace(output.name, filename)
     if not keep_originals:
         for file in real_filenames:
-            file.unlink()
+            if file.resolve() != filename.resolve():
+                file.unlink()
+
+
+def _weight_dtype(header: MCPLHeader):
+    """A structured dtype which views the weights of the particles of an MCPL file in place"""
+    import numpy as np
+    size = 4 if header.single_precision else 8
+    # polarisation, position, packed direction and energy, and time precede the weight of each particle
+    offset = size * (3 * header.polarisation + 7)
+    expected = offset + size * (not header.universal_weight) + 4 * (not header.universal_pdg_code) \
+        + 4 * header.user_flags
+    if expected != header.particle_size:
+        raise RuntimeError(f'Unexpected MCPL particle size {header.particle_size}, expected {expected}')
+    order = '<' if header.little_endian else '>'
+    return np.dtype({'names': ['weight'], 'formats': [f'{order}f{size}'], 'offsets': [offset],
+                     'itemsize': header.particle_size})
+
+
+def mcpl_truncate(filename: Path, filepath: Path, particles: int, scale: float = 1.0) -> Path:
+    """Write the first *particles* particles of an MCPL file to a new file, with their weights scaled
+
+    The particles of a McCode simulation are stored in the random order in which they were simulated,
+    so the first particles are an unbiased sample of all of them. Scaling their weights by the
+    fraction of the particles that are dropped keeps the total intensity of the file.
+    The new file has the compression of the original, and is only in place once it is complete.
+
+    :param filename: The MCPL file to read from.
+    :param filepath: The name of the output file, its extension is replaced to match the original file.
+    :param particles: The number of particles to keep, at most the number in the original file.
+    :param scale: The factor applied to the weight of every particle kept.
+    :return: The path of the new file.
+    """
+    import os
+    import numpy as np
+    from struct import pack
+    from tempfile import NamedTemporaryFile
+    real_filename = mcpl_real_filename(Path(filename))
+    first = mcpl_read_header(real_filename)
+    if particles > first.particles:
+        raise ValueError(f'Can not take {particles} particles from {real_filename} which has {first.particles}')
+    filename = Path(filepath).with_suffix(mcpl_real_extension(real_filename))
+    order = '<' if first.little_endian else '>'
+    dtype = None if scale == 1.0 or first.universal_weight else _weight_dtype(first)
+
+    source, compressed = _open_mcpl(real_filename)
+    with source:
+        header = bytearray(source.read(first.length))
+        header[8:16] = pack(f'{order}Q', particles)
+        if first.universal_weight and scale != 1.0:
+            # a universal weight follows the 48 fixed bytes of the header
+            header[48:56] = pack(f'{order}d', first.universal_weight * scale)
+        with NamedTemporaryFile('wb', dir=filename.parent, prefix=f'.{filename.name}.', delete=False) as output:
+            try:
+                with _write_mcpl(output, _compression(real_filename)) as destination:
+                    destination.write(header)
+                    if dtype is None:
+                        _copy_particles(source, compressed, first.length, particles * first.particle_size,
+                                        destination, not compressed)
+                    else:
+                        chunk = max(1, _MERGE_CHUNK // first.particle_size) * first.particle_size
+                        remaining = particles * first.particle_size
+                        while remaining > 0:
+                            data = bytearray(source.read(min(remaining, chunk)))
+                            if not data or len(data) % first.particle_size:
+                                raise RuntimeError(f'Unexpected end of particles in {real_filename}')
+                            np.frombuffer(data, dtype=dtype)['weight'] *= scale
+                            destination.write(data)
+                            remaining -= len(data)
+            except BaseException:
+                output.close()
+                os.unlink(output.name)
+                raise
+    os.chmod(output.name, real_filename.stat().st_mode & 0o777)
+    os.replace(output.name, filename)
+    return filename
 
 
 def mcpl_rename_file(source: Path, dest: Path, strict: bool = False):
@@ -80,3 +342,106 @@ def mcpl_rename_file(source: Path, dest: Path, strict: bool = False):
 
     filepath.rename(dest)
     return dest
+
+
+def _compression(filename: Path) -> str:
+    """The compression of an MCPL file, from its extension"""
+    ext = mcpl_real_extension(filename)
+    return next((name for name, e in MCPL_COMPRESSION.items() if e == ext), 'none')
+
+
+def mcpl_compress(filename: Path, compression: str) -> Path:
+    """Store an MCPL file with *compression*, one of :data:`MCPL_COMPRESSION`, and return its new path
+
+    The file is converted by streaming it through a temporary file, which replaces it once complete;
+    any other stored variant of the file is removed too.
+    """
+    import os
+    from shutil import copyfileobj
+    from tempfile import NamedTemporaryFile
+    if compression not in MCPL_COMPRESSION:
+        raise ValueError(f'Unknown MCPL compression {compression}, expected one of {", ".join(MCPL_COMPRESSION)}')
+    filename = Path(filename)
+    base = filename.parent / filename.name.removesuffix(mcpl_real_extension(filename))
+    target = base.with_name(base.name + MCPL_COMPRESSION[compression])
+    variants = [filename] + [base.with_name(base.name + ext) for ext in MCPL_COMPRESSION.values()]
+    sources = [f for f in dict.fromkeys(variants) if f.is_file()]
+    if target not in sources:
+        source, _ = _open_mcpl(sources[0])
+        with source, NamedTemporaryFile('wb', dir=target.parent, prefix=f'.{target.name}.', delete=False) as output:
+            try:
+                with _write_mcpl(output, compression) as destination:
+                    copyfileobj(source, destination, _MERGE_CHUNK)
+            except BaseException:
+                output.close()
+                os.unlink(output.name)
+                raise
+        os.chmod(output.name, filename.stat().st_mode & 0o777)
+        os.replace(output.name, target)
+    for source in sources:
+        if source != target:
+            source.unlink()
+    return target
+
+
+class MCPLReadable:
+    """Paths to MCPL files which McCode instruments can read, shared by the simulations of one scan
+
+    The MCPL library reads uncompressed and gzip compressed files; each zstd compressed file is
+    decompressed once, when first needed, into a directory of its own under *parent*, and reused
+    by every later simulation until :meth:`close` removes the directory again.  Calls from several
+    threads at once are safe, and only one of them decompresses each file.
+    """
+
+    def __init__(self, parent: Path):
+        from threading import Lock
+        self.parent = Path(parent)
+        self.directory: Path | None = None
+        self._lock = Lock()
+        self._files: dict[Path, tuple] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __call__(self, filename: Path) -> Path:
+        import os
+        from shutil import copyfileobj
+        from tempfile import mkdtemp
+        from threading import Lock
+        filename = Path(filename)
+        if _compression(filename) != 'zstd':
+            return filename
+        with self._lock:
+            if self.directory is None:
+                self.parent.mkdir(parents=True, exist_ok=True)
+                self.directory = Path(mkdtemp(dir=self.parent, prefix='scan-'))
+            name = filename.name.removesuffix(MCPL_COMPRESSION['zstd']) + MCPL_COMPRESSION['none']
+            lock, target = self._files.setdefault(filename, (Lock(), self.directory / str(len(self._files)) / name))
+        with lock:
+            if not target.exists():
+                target.parent.mkdir(exist_ok=True)
+                partial = target.with_name(f'.{name}')
+                source, _ = _open_mcpl(filename)
+                try:
+                    with source, open(partial, 'wb') as output:
+                        copyfileobj(source, output, _MERGE_CHUNK)
+                except BaseException:
+                    partial.unlink(missing_ok=True)
+                    raise
+                os.replace(partial, target)
+            else:
+                # the copy is in use, which :func:`~restage.maintenance.plan_collection` can tell from its age
+                os.utime(target)
+        return target
+
+    def close(self) -> None:
+        """Remove every decompressed file"""
+        from shutil import rmtree
+        with self._lock:
+            if self.directory is not None:
+                rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+            self._files.clear()
@@ -15,6 +15,7 @@ The following models exist:
 * :class:`SimulationTableModel` — one row per instrument, records parameter names
 * :class:`NexusStructureModel`  — one row per instrument NeXus structure
 * :class:`SimulationModel`     — one row per cached simulation run
+* :class:`SimulationValueModel` — one row per numeric parameter value of a cached run
 
 The legacy names ``InstrEntry``, ``SimulationTableEntry``, and
 ``NexusStructureEntry`` are re-exported from :mod:`restage.tables` as aliases
@@ -25,7 +26,7 @@ from __future__ import annotations
 from typing import Optional, Any
 
 from pydantic import field_validator
-from sqlalchemy import Column, JSON
+from sqlalchemy import Column, JSON, Index
 from sqlmodel import SQLModel, Field
 
 
@@ -189,6 +190,11 @@ class SimulationModel(SQLModel, table=True):
     raw values are ``float | int | str``.  The business-logic
     :class:`~restage.tables.SimulationEntry` dataclass handles tolerance-based
     matching and ``mccode_antlr.common.Expr`` reconstruction.
+
+    ``parameter_hash`` is the indexed :meth:`~restage.tables.SimulationEntry.exact_hash`
+    of the run, used to find identical simulations without a tolerance search.
+    ``derived_from`` is the ``id`` of the simulation whose output this run's was made from,
+    e.g., by keeping only some of its particles, or ``None`` if it was simulated.
     """
     __tablename__ = 'simulations'
 
@@ -201,3 +207,23 @@ class SimulationModel(SQLModel, table=True):
     gravitation: bool = False
     creation: float = Field(default_factory=utc_timestamp)
     last_access: float = Field(default_factory=utc_timestamp)
+    parameter_hash: Optional[str] = Field(default=None, index=True)
+    derived_from: Optional[str] = None
+
+
+class SimulationValueModel(SQLModel, table=True):
+    """One row per numeric parameter value of a cached simulation run.
+
+    Mirrors the integer and floating-point entries of
+    :attr:`SimulationModel.parameter_values` so that tolerance queries can be
+    answered by SQLite range lookups on the ``(table_id, name, value)`` index,
+    rather than by loading and filtering every row of a table in Python.
+    """
+    __tablename__ = 'simulation_values'
+    __table_args__ = (Index('ix_simulation_values_lookup', 'table_id', 'name', 'value'),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    simulation_id: str = Field(foreign_key='simulations.id', index=True)
+    table_id: str
+    name: str
+    value: float
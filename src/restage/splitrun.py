@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
-from .tables import SimulationEntry, InstrEntry
+from .tables import SimulationEntry, SimulationSchema, InstrEntry
 
 def mcpl_parameters_split(s: str) -> list[tuple[str, str]]:
     return [(k, v) for k, v in [kv.split(':', maxsplit=1) for kv in s.split(',')]]
@@ -77,6 +78,8 @@ def make_splitrun_parser():
        help='Use GPU OpenACC parallelism')
     aa('--process-count', type=int, default=0,
        help='MPI process count, 0 == System Default')
+    aa('--jobs', type=int, default=1, metavar='N',
+       help='Number of simulations to run concurrently in each stage -- DEFAULT: 1')
     # splitrun controlling parameters
     aa('--split-at', type=str, default='mcpl_split',
        help='Component at which to split -- DEFAULT: mcpl_split')
@@ -202,6 +205,7 @@ def splitrun_args(instr, parameters, precision, args, **kwargs):
              parallel=args.parallel,
              gpu=args.gpu,
              process_count=args.process_count,
+             jobs=args.jobs,
              mcpl_output_component=args.mcpl_output_component,
              mcpl_output_parameters=args.mcpl_output_parameters,
              mcpl_input_component=args.mcpl_input_component,
@@ -221,11 +225,13 @@ def splitrun(instr, parameters, precision: dict[str, float], split_at=None, grid
              mcpl_output_component=None, mcpl_output_parameters: dict[str, str] | None = None,
              mcpl_input_component=None, mcpl_input_parameters: dict[str, str] | None = None,
              progress: bool = False,
+             jobs: int = 1,
              **runtime_arguments):
     from zenlog import log
     from mccode_antlr.common import ComponentParameter, Expr
     from .energy import get_energy_parameter_names
-    from .cache import cache_instr
+    from .cache import cache_instr, cache_flush_access_times
+    from .maintenance import evict_configured, recompress_configured
     if split_at is None:
         split_at = 'mcpl_split'
 
@@ -264,25 +270,42 @@ def splitrun(instr, parameters, precision: dict[str, float], split_at=None, grid
     # Populate the cache now to avoid delayed compilation failures
     pre_entry, post_entry = [cache_instr(x, mpi=parallel, acc=gpu) for x in (pre, post)]
 
-    splitrun_pre(pre_entry, pre, pre_parameters, grid, precision, **runtime_arguments,
-                 minimum_particle_count=minimum_particle_count,
-                 maximum_particle_count=maximum_particle_count,
-                 dry_run=dry_run, parallel=parallel, gpu=gpu, process_count=process_count,
-                 progress=progress)
-
-    splitrun_combined(pre_entry, post_entry, pre, post, pre_parameters, post_parameters, grid, precision,
-                      dry_run=dry_run, parallel=parallel, gpu=gpu, process_count=process_count,
-                      callback=callback, callback_arguments=callback_arguments,
-                      progress=progress, **runtime_arguments)
+    try:
+        if jobs is not None and jobs > 1:
+            # Without a barrier between the stages, secondary simulations start as soon as their primary is cached
+            splitrun_pipelined(pre_entry, post_entry, pre, post, pre_parameters, post_parameters, grid, precision,
+                               minimum_particle_count=minimum_particle_count,
+                               maximum_particle_count=maximum_particle_count,
+                               dry_run=dry_run, parallel=parallel, gpu=gpu, process_count=process_count,
+                               callback=callback, callback_arguments=callback_arguments,
+                               progress=progress, jobs=jobs, **runtime_arguments)
+        else:
+            splitrun_pre(pre_entry, pre, pre_parameters, grid, precision, **runtime_arguments,
+                         minimum_particle_count=minimum_particle_count,
+                         maximum_particle_count=maximum_particle_count,
+                         dry_run=dry_run, parallel=parallel, gpu=gpu, process_count=process_count,
+                         progress=progress, jobs=jobs)
+
+            splitrun_combined(pre_entry, post_entry, pre, post, pre_parameters, post_parameters, grid, precision,
+                              dry_run=dry_run, parallel=parallel, gpu=gpu, process_count=process_count,
+                              callback=callback, callback_arguments=callback_arguments,
+                              progress=progress, jobs=jobs, **runtime_arguments)
+    finally:
+        cache_flush_access_times()
+    if not dry_run:
+        # the simulations and instruments just used are the most recent, so are evicted last
+        evict_configured()
+        recompress_configured()
 
 
 def splitrun_pre(entry, instr, parameters, grid, precision: dict[str, float],
                  minimum_particle_count=None, maximum_particle_count=None,
-                 dry_run=False, process_count=0, progress: bool = False,
+                 dry_run=False, process_count=0, progress: bool = False, jobs: int = 1,
                  **runtime_arguments):
 
     from functools import partial
     from tqdm.auto import tqdm
+    from .cache import cache_keep_in_use
     from .energy import energy_to_chopper_translator
     from mccode_antlr.run.range import parameters_to_scan
     # get the function with converts energy parameters to chopper parameters:
@@ -292,61 +315,186 @@ def splitrun_pre(entry, instr, parameters, grid, precision: dict[str, float],
     args = regular_mccode_runtime_dict(runtime_arguments)
     sit_kw = {'seed': args.get('seed'), 'ncount': args.get('ncount'), 'gravitation': args.get('gravitation', False)}
 
-    step = partial(_pre_step, instr, entry, names, precision, translate, sit_kw,
-                   minimum_particle_count, maximum_particle_count,
+    # Collapse the scan to its unique primary simulations before doing anything else.
+    # If the parameters are empty, we still need to run the simulation once:
+    configurations = _pre_configurations(instr, names, precision, translate, sit_kw, scan if n_pts else [[]])
+
+    if jobs is not None and jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+        from .cache import cache_simulations
+        pending = _pre_pending(entry, configurations, dry_run)
+        partials = _pre_partials(entry, [sim for sim, _ in pending], dry_run)
+        worker = partial(_primary_worker, entry, sit_kw, minimum_particle_count, maximum_particle_count,
+                         dry_run, process_count, progress)
+        # The SQLite database can not be shared between concurrently-writing processes, so the workers
+        # only run simulations and this process is the single writer which caches their results,
+        # all of those which finished together in one transaction
+        with cache_keep_in_use([entry], lambda: [p for found in partials for p in found]), \
+                ProcessPoolExecutor(max_workers=jobs) as pool, \
+                tqdm(desc='Primary', total=len(pending), unit='point', disable=not progress) as bar:
+            running = {pool.submit(worker, sim, nv, found) for (sim, nv), found in zip(pending, partials)}
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                cache_simulations(entry, [future.result() for future in done])
+                bar.update(len(done))
+        return
+
+    if _reuse_larger_primaries():
+        # serve what is possible from larger cached primary simulations before simulating the rest
+        _pre_pending(entry, configurations, dry_run)
+    step = partial(_pre_step, entry, sit_kw, minimum_particle_count, maximum_particle_count,
                    dry_run, process_count, progress)
-
-    # this does not work due to the sqlite database being locked by the parallel processes
-    # from joblib import Parallel, delayed
-    # Parallel(n_jobs=-3)(delayed(step)(values) for values in scan)
-
-    for values in tqdm(scan, desc='Primary', unit='point', disable=not progress):
-        step(values)
-    if n_pts == 0:
-        # If the parameters are empty, we still need to run the simulation once:
-        step([])
+    with cache_keep_in_use([entry]):
+        for sim, nv in tqdm(configurations, desc='Primary', unit='point', disable=not progress):
+            step(sim, nv)
 
 
-def _pre_step(instr, entry, names, precision, translate, kw, min_pc, max_pc, dry_run, process_count, progress, values):
-    """The per-step function for the primary instrument simulation. Broken out for parallelization"""
-    from .instr import collect_parameter_dict
-    from .cache import cache_has_simulation, cache_simulation, cache_get_simulation
-    nv = translate({n: v for n, v in zip(names, values)})
-    sim = SimulationEntry(collect_parameter_dict(instr, nv), precision=precision, **kw)
+def _pre_step(entry, kw, min_pc, max_pc, dry_run, process_count, progress, sim, nv):
+    """The per-configuration function for the primary instrument simulation."""
+    from .cache import cache_has_simulation, cache_simulation
     if not cache_has_simulation(entry, sim):
         sim.output_path = do_primary_simulation(sim, entry, nv, kw,
                                                 minimum_particle_count=min_pc,
                                                 maximum_particle_count=max_pc,
                                                 dry_run=dry_run,
                                                 process_count=process_count,
-                                                capture_output=progress)
+                                                capture_output=progress,
+                                                partials=_pre_partials(entry, [sim], dry_run)[0])
         cache_simulation(entry, sim)
-    return cache_get_simulation(entry, sim)
+    return sim
 
 
+def _pre_configurations(instr, names, precision, translate, kw, scan) -> list[tuple[SimulationEntry, dict]]:
+    """Collapse a primary scan into its unique simulation configurations
 
-def splitrun_combined(pre_entry, post_entry, pre, post, pre_parameters, post_parameters,
-                      grid, precision: dict[str, float], summary=True, dry_run=False,
-                      callback=None, callback_arguments: dict[str, str] | None = None,
-                      process_count=0, progress: bool = False, **runtime_arguments):
-    from pathlib import Path
-    from tqdm.auto import tqdm
-    from .cache import cache_get_simulation
-    from .energy import energy_to_chopper_translator
-    from mccode_antlr.run.range import parameters_to_scan
+    Repeated points, e.g., from a mesh which includes secondary-only parameters, are removed before
+    any translation, and the remaining configurations are collapsed within the matching precision.
+    """
     from .instr import collect_parameter_dict
+    from .tables import unique_simulation_entry_indexes
+    unique_values = list(dict.fromkeys(tuple(values) for values in scan))
+    translated = [translate({n: v for n, v in zip(names, values)}) for values in unique_values]
+    schema = SimulationSchema([p.name for p in instr.parameters], precision)
+    sims = [SimulationEntry(collect_parameter_dict(instr, nv), schema=schema, **kw) for nv in translated]
+    indexes, _ = unique_simulation_entry_indexes(sims)
+    return [(sims[index], translated[index]) for index in indexes]
+
+
+def _reuse_larger_primaries() -> bool:
+    """Whether primary simulations may be served from cached ones with more particles"""
+    from .config import config
+    setting = config['reuse_larger_primaries']
+    return setting.get(bool) if setting.exists() else False
+
+
+def _pre_pending(entry, configurations, dry_run: bool = False) -> list[tuple[SimulationEntry, dict]]:
+    """Find the unique primary simulations which are not yet cached
+
+    If ``reuse_larger_primaries`` is configured, those which can be derived from a cached simulation
+    with more particles are derived and cached instead, see :func:`derive_primary_simulation`.
+    """
+    from .cache import cache_has_simulations
+    cached = cache_has_simulations(entry, [sim for sim, _ in configurations])
+    pending = [configuration for configuration, has in zip(configurations, cached) if not has]
+    if not dry_run and _reuse_larger_primaries():
+        pending = _derive_pending(entry, pending)
+    return pending
+
+
+def _derive_pending(entry, pending) -> list[tuple[SimulationEntry, dict]]:
+    """Derive the pending primary simulations which have a larger cached simulation, and return the others"""
+    from zenlog import log
+    from .cache import cache_find_simulations, cache_simulations, cache_simulation_neighbours
     from .tables import best_simulation_entry_match
-    from .emulate import mccode_sim_io, mccode_dat_io, mccode_dat_line
+    # only a requested particle count, without a fixed seed, can be served by part of another simulation
+    reusable = [index for index, (sim, _) in enumerate(pending) if sim.ncount is not None and sim.seed is None]
+    found = cache_find_simulations(entry, [pending[index][0].replace(ncount=None) for index in reusable])
+    derived = {}
+    neighbours = None
+    for index, candidates in zip(reusable, found):
+        sim = pending[index][0]
+        larger = [c for c in candidates if c.ncount is not None and c.ncount > sim.ncount]
+        if not len(larger):
+            continue
+        if neighbours is None and len(larger) > 1:
+            neighbours = cache_simulation_neighbours(entry, sim)
+        source = best_simulation_entry_match(larger, sim, neighbours or [])
+        try:
+            derived[index] = derive_primary_simulation(source, sim.ncount, entry)
+        except (OSError, RuntimeError) as error:
+            log.warn(f'Can not derive a primary simulation from {source.output_path}: {error}')
+    cache_simulations(entry, list(derived.values()))
+    return [configuration for index, configuration in enumerate(pending) if index not in derived]
+
+
+def _top_up_primaries() -> bool:
+    """Whether primary simulations may add to cached ones with fewer particles"""
+    from .config import config
+    setting = config['top_up_primaries']
+    return setting.get(bool) if setting.exists() else False
 
-    args = regular_mccode_runtime_dict(runtime_arguments)
-    sit_kw = {'seed': args.get('seed'), 'ncount': args.get('ncount'), 'gravitation': args.get('gravitation', False)}
-    # recombine the parameters to ensure the 'correct' scan is performed
-    # TODO the order of a mesh scan may not be preserved here - is this a problem?
-    parameters = {**pre_parameters, **post_parameters}
-    n_pts, names, scan = parameters_to_scan(parameters, grid=grid)
-    n_zeros = len(str(n_pts))  # we could use math.log10(n_pts) + 1, but why not use a hacky solution?
 
-    # Ensure _an_ output folder is created for the run, even if the user did not specify one.
+def _pre_partials(entry, sims: list[SimulationEntry], dry_run: bool = False) -> list[list[SimulationEntry]]:
+    """The cached simulations with fewer particles that each of the pending primary simulations can add to
+
+    The largest cached simulation is always used; others are only combined with it if all of them were
+    simulated independently, i.e., none is derived from another simulation or shares its seed, and
+    together they hold at most the requested particle count. Only simulations without a fixed seed can
+    be topped up, since the particles added use fresh seeds, and only from cached simulations with
+    exactly their parameter values and gravitation, since the particles of all of them are merged.
+    """
+    from .cache import cache_find_simulations
+    partials: list[list[SimulationEntry]] = [[] for _ in sims]
+    if dry_run or not _top_up_primaries():
+        return partials
+
+    def configuration(sim: SimulationEntry) -> str:
+        return sim.replace(ncount=None, seed=None).exact_hash()
+
+    indexes = [index for index, sim in enumerate(sims) if sim.ncount is not None and sim.seed is None]
+    found = cache_find_simulations(entry, [sims[index].replace(ncount=None) for index in indexes])
+    for index, candidates in zip(indexes, found):
+        ncount, wanted = sims[index].ncount, configuration(sims[index])
+        smaller = sorted((c for c in candidates if c.ncount is not None and c.ncount < ncount
+                          and configuration(c) == wanted), key=lambda c: c.ncount, reverse=True)
+        chosen = partials[index]
+        for candidate in smaller:
+            if not len(chosen):
+                chosen.append(candidate)
+            elif candidate.derived_from is None and sum(c.ncount for c in chosen) + candidate.ncount <= ncount \
+                    and all(c.derived_from is None and (c.seed is None or c.seed != candidate.seed) for c in chosen):
+                chosen.append(candidate)
+    return partials
+
+
+def _primary_worker(entry, kw, min_pc, max_pc, dry_run, process_count, capture_output, sim, parameters,
+                    partials=None):
+    """Run one primary simulation in a worker process, leaving the database to the calling process"""
+    sim.output_path = do_primary_simulation(sim, entry, parameters, kw,
+                                            minimum_particle_count=min_pc,
+                                            maximum_particle_count=max_pc,
+                                            dry_run=dry_run,
+                                            process_count=process_count,
+                                            capture_output=capture_output,
+                                            partials=partials)
+    return sim
+
+
+@dataclass
+class _ScanPoint:
+    """One point of the combined scan, and the primary simulation entry it uses"""
+    number: int
+    values: list
+    pars: dict
+    secondary_pars: dict
+    query: SimulationEntry
+    arguments: dict
+    primary: SimulationEntry | None = None
+
+
+def _ensure_output_directory(args: dict, pre, post):
+    """Ensure _an_ output folder is created for the run, even if the user did not specify one."""
+    from pathlib import Path
     # TODO Fix this hack
     if args.get('dir') is None:
         from os.path import commonprefix
@@ -357,10 +505,16 @@ def splitrun_combined(pre_entry, post_entry, pre, post, pre_parameters, post_par
     if not Path(args['dir']).exists():
         Path(args['dir']).mkdir(parents=True)
 
-    detectors, dat_lines = [], []
+
+def _scan_points(pre, post, names, scan, precision, kw, directory, runtime_arguments) -> list[_ScanPoint]:
+    from .energy import energy_to_chopper_translator
+    from .instr import collect_parameter_dict
     # get the function that performs the translation (or no-op if the instrument name is unknown)
     translate = energy_to_chopper_translator(post.name)
-    for number, values in tqdm(enumerate(scan), desc='Scan', total=n_pts, unit='point', disable=not progress):
+    # all primary entries share their parameter names and matching precision
+    schema = SimulationSchema([p.name for p in pre.parameters], precision)
+    points = []
+    for number, values in enumerate(scan):
         # convert, e.g., energy parameters to chopper parameters:
         pars = translate({n: v for n, v in zip(names, values)})
         # parameters for the primary instrument:
@@ -369,37 +523,226 @@ def splitrun_combined(pre_entry, post_entry, pre, post, pre_parameters, post_par
         secondary_pars = {k: v for k, v in pars.items() if post.has_parameter(k)}
         # use the parameters for the primary instrument to construct a (partial) simulation entry for matching
         primary_table_parameters = collect_parameter_dict(pre, primary_pars, strict=True)
-        primary_sent = SimulationEntry(primary_table_parameters, precision=precision, **sit_kw)
-        # and use it to retrieve the already-simulated primary instrument details:
-        sim_entry = best_simulation_entry_match(cache_get_simulation(pre_entry, primary_sent), primary_sent)
-        # now we can use the best primary simulation entry to perform the secondary simulation
-        # but because McCode refuses to use a specified output directory if it is not empty,
-        # we need to update the runtime_arguments first!
+        primary_sent = SimulationEntry(primary_table_parameters, schema=schema, **kw)
+        # because McCode refuses to use a specified output directory if it is not empty,
+        # each point needs its own copy of the runtime_arguments!
         # TODO Use the following line instead of the one after it when McCode is fixed to use zero-padded folder names
-        # # runtime_arguments['dir'] = args["dir"].joinpath(str(number).zfill(n_zeros))
-        runtime_arguments['dir'] = args['dir'].joinpath(str(number))
-        do_secondary_simulation(sim_entry, post_entry, secondary_pars, runtime_arguments,
-                                dry_run=dry_run, process_count=process_count, capture_output=progress)
-        if summary and not dry_run:
-            # the data file has *all* **scanned** parameters recorded for each step:
-            detectors, line = mccode_dat_line(runtime_arguments['dir'], {k: v for k,v in zip(names, values)})
-            dat_lines.append(line)
-        if callback is not None:
-            arguments = {}
-            # 'names' _is_ a list already
-            arg_names = names + ['number', 'n_pts', 'pars', 'dir', 'arguments']
-            # 'values' is a tuple, so we need to convert it to a list
-            arg_values = list(values) + [number, n_pts, pars, runtime_arguments['dir'], runtime_arguments]
-            for x, v in zip(arg_names, arg_values):
-                if callback_arguments is not None and x in callback_arguments:
-                    arguments[callback_arguments[x]] = v
-            callback(**arguments)
+        # # arguments = {**runtime_arguments, 'dir': directory.joinpath(str(number).zfill(n_zeros))}
+        arguments = {**runtime_arguments, 'dir': directory.joinpath(str(number))}
+        points.append(_ScanPoint(number, values, pars, secondary_pars, primary_sent, arguments))
+    return points
 
+
+def _resolve_primaries(entry, points: list[_ScanPoint]) -> list[_ScanPoint]:
+    """Use the primary-instrument parameters of the points to retrieve the already-simulated primary details
+
+    Their access times are written immediately, rather than buffered, so that another process
+    does not evict the primary simulations while the secondary simulations of this scan use them.
+    """
+    from .cache import cache_get_simulations, cache_flush_access_times, cache_simulation_neighbours
+    from .tables import best_simulation_entry_matches
+    queries = [point.query for point in points]
+    found = cache_get_simulations(entry, queries)
+    # the index of the whole table is only worth finding if some point has a choice of primary simulations
+    neighbours = cache_simulation_neighbours(entry, queries[0]) if any(len(f) > 1 for f in found) else []
+    for point, best in zip(points, best_simulation_entry_matches(found, queries, neighbours)):
+        point.primary = best
+    cache_flush_access_times()
+    return points
+
+
+def _secondary_task(entry, point: _ScanPoint, dry_run: bool, process_count: int, capture_output: bool, readable):
+    from functools import partial
+    return partial(do_secondary_simulation, point.primary, entry, point.secondary_pars, point.arguments,
+                   dry_run=dry_run, process_count=process_count, capture_output=capture_output, readable=readable)
+
+
+def _readable_primaries():
+    """The readable primary MCPL files of one scan, decompressed under the cache root once each"""
+    from .cache import module_data_path
+    from .mcpl import MCPLReadable
+    return MCPLReadable(module_data_path('readable'))
+
+
+def _finish_point(point: _ScanPoint, names, n_pts, summary, dry_run, callback, callback_arguments):
+    """Collect the summary line of a finished scan point, and notify any callback of its completion"""
+    from .emulate import mccode_dat_line
+    detectors, line = None, None
     if summary and not dry_run:
-        with args['dir'].joinpath('mccode.sim').open('w') as f:
-            mccode_sim_io(post, parameters, args, detectors, file=f, grid=grid)
-        with args['dir'].joinpath('mccode.dat').open('w') as f:
-            mccode_dat_io(post, parameters, args, detectors, dat_lines, file=f, grid=grid)
+        # the data file has *all* **scanned** parameters recorded for each step:
+        detectors, line = mccode_dat_line(point.arguments['dir'], {k: v for k, v in zip(names, point.values)})
+    if callback is not None:
+        arguments = {}
+        # 'names' _is_ a list already
+        arg_names = names + ['number', 'n_pts', 'pars', 'dir', 'arguments']
+        # 'values' is a tuple, so we need to convert it to a list
+        arg_values = list(point.values) + [point.number, n_pts, point.pars, point.arguments['dir'], point.arguments]
+        for x, v in zip(arg_names, arg_values):
+            if callback_arguments is not None and x in callback_arguments:
+                arguments[callback_arguments[x]] = v
+        callback(**arguments)
+    return detectors, line
+
+
+def _write_scan_summary(post, parameters, args, detectors, dat_lines, grid):
+    from .emulate import mccode_sim_io, mccode_dat_io
+    with args['dir'].joinpath('mccode.sim').open('w') as f:
+        mccode_sim_io(post, parameters, args, detectors, file=f, grid=grid)
+    with args['dir'].joinpath('mccode.dat').open('w') as f:
+        mccode_dat_io(post, parameters, args, detectors, dat_lines, file=f, grid=grid)
+
+
+def splitrun_combined(pre_entry, post_entry, pre, post, pre_parameters, post_parameters,
+                      grid, precision: dict[str, float], summary=True, dry_run=False,
+                      callback=None, callback_arguments: dict[str, str] | None = None,
+                      process_count=0, progress: bool = False, jobs: int = 1, **runtime_arguments):
+    from contextlib import nullcontext
+    from concurrent.futures import ThreadPoolExecutor
+    from tqdm.auto import tqdm
+    from mccode_antlr.run.range import parameters_to_scan
+    from .cache import cache_keep_in_use
+
+    args = regular_mccode_runtime_dict(runtime_arguments)
+    sit_kw = {'seed': args.get('seed'), 'ncount': args.get('ncount'), 'gravitation': args.get('gravitation', False)}
+    # recombine the parameters to ensure the 'correct' scan is performed
+    # TODO the order of a mesh scan may not be preserved here - is this a problem?
+    parameters = {**pre_parameters, **post_parameters}
+    n_pts, names, scan = parameters_to_scan(parameters, grid=grid)
+    _ensure_output_directory(args, pre, post)
+
+    points = _scan_points(pre, post, names, scan, precision, sit_kw, args['dir'], runtime_arguments)
+    # the primary simulations for all points are resolved together, with a single pass over the cache
+    _resolve_primaries(pre_entry, points)
+    readable = _readable_primaries()
+    tasks = [_secondary_task(post_entry, point, dry_run, process_count, progress, readable) for point in points]
+
+    detectors, dat_lines = [], []
+    # Secondary simulations are independent external processes, so a thread pool is enough to run them
+    # concurrently; their results are still handled in scan order below.
+    # the instruments and primary simulations stay in use, and safe from eviction, until the scan finishes
+    with cache_keep_in_use([pre_entry, post_entry], lambda: [point.primary for point in points]), readable, \
+            (ThreadPoolExecutor(max_workers=jobs) if jobs is not None and jobs > 1 else nullcontext()) as pool:
+        futures = [pool.submit(task) for task in tasks] if pool is not None else None
+        for point in tqdm(points, desc='Scan', unit='point', disable=not progress):
+            if futures is None:
+                tasks[point.number]()
+            else:
+                futures[point.number].result()
+            detectors, line = _finish_point(point, names, n_pts, summary, dry_run, callback, callback_arguments)
+            if line is not None:
+                dat_lines.append(line)
+
+    if summary and not dry_run:
+        _write_scan_summary(post, parameters, args, detectors, dat_lines, grid)
+
+
+def splitrun_pipelined(pre_entry, post_entry, pre, post, pre_parameters, post_parameters,
+                       grid, precision: dict[str, float], minimum_particle_count=None, maximum_particle_count=None,
+                       summary=True, dry_run=False, callback=None, callback_arguments: dict[str, str] | None = None,
+                       process_count=0, progress: bool = False, jobs: int = 2, **runtime_arguments):
+    """Run both stages of a split scan together, without waiting for every primary simulation first
+
+    Each secondary simulation is dispatched as soon as the primary simulation it uses is cached,
+    so that missing primary simulations overlap with the secondary simulations which are already
+    possible. At most `jobs` simulations run at once, and this process remains the only writer to
+    the cache database. Summary lines and callbacks are handled in scan order.
+    """
+    from collections import deque
+    from functools import partial
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+    from tqdm.auto import tqdm
+    from mccode_antlr.run.range import parameters_to_scan
+    from .cache import cache_simulations, cache_keep_in_use
+    from .energy import energy_to_chopper_translator
+
+    args = regular_mccode_runtime_dict(runtime_arguments)
+    sit_kw = {'seed': args.get('seed'), 'ncount': args.get('ncount'), 'gravitation': args.get('gravitation', False)}
+    jobs = max(1, jobs or 1)
+
+    # The missing primary simulations are found from the primary-only scan
+    pre_n, pre_names, pre_scan = parameters_to_scan(pre_parameters, grid=grid)
+    configurations = _pre_configurations(pre, pre_names, precision, energy_to_chopper_translator(pre.name), sit_kw,
+                                         pre_scan if pre_n else [[]])
+    pending = _pre_pending(pre_entry, configurations, dry_run)
+    partials = _pre_partials(pre_entry, [sim for sim, _ in pending], dry_run)
+
+    parameters = {**pre_parameters, **post_parameters}
+    n_pts, names, scan = parameters_to_scan(parameters, grid=grid)
+    _ensure_output_directory(args, pre, post)
+    points = _scan_points(pre, post, names, scan, precision, sit_kw, args['dir'], runtime_arguments)
+
+    # Every scan point either waits on a pending primary simulation, or is ready to run now
+    waiting: dict[int, list[_ScanPoint]] = {index: [] for index in range(len(pending))}
+    available: list[_ScanPoint] = []
+    for point in points:
+        index = next((i for i, (sim, _) in enumerate(pending) if point.query.matches_candidate(sim)), None)
+        if index is None:
+            available.append(point)
+        else:
+            waiting[index].append(point)
+    ready: deque[_ScanPoint] = deque(_resolve_primaries(pre_entry, available))
+    primaries = deque(range(len(pending)))
+
+    worker = partial(_primary_worker, pre_entry, sit_kw, minimum_particle_count, maximum_particle_count,
+                     dry_run, process_count, progress)
+    running: dict = {}
+    finished = [False for _ in points]
+    next_point = 0
+    detectors, dat_lines = [], []
+
+    def in_use():
+        # the primary simulations resolved so far, and the cached ones which pending primaries add to
+        return [point.primary for point in points] + [p for found in partials for p in found]
+
+    with cache_keep_in_use([pre_entry, post_entry], in_use), _readable_primaries() as readable, \
+            ProcessPoolExecutor(max_workers=jobs) as primary_pool, \
+            ThreadPoolExecutor(max_workers=jobs) as secondary_pool:
+        def submit_primary():
+            index = primaries.popleft()
+            running[primary_pool.submit(worker, *pending[index], partials[index])] = (True, index)
+
+        def submit_secondary():
+            point = ready.popleft()
+            task = _secondary_task(post_entry, point, dry_run, process_count, progress, readable)
+            running[secondary_pool.submit(task)] = (False, point)
+
+        def dispatch():
+            # Keep one secondary simulation going whenever possible, to deliver results early, but
+            # otherwise prefer the primary simulations since they unblock more secondary simulations
+            if ready and len(running) < jobs and all(is_primary for is_primary, _ in running.values()):
+                submit_secondary()
+            while primaries and len(running) < jobs:
+                submit_primary()
+            while ready and len(running) < jobs:
+                submit_secondary()
+
+        with tqdm(total=len(pending) + len(points), desc='Scan', unit='sim', disable=not progress) as bar:
+            dispatch()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                simulated = []
+                for future in done:
+                    is_primary, item = running.pop(future)
+                    if is_primary:
+                        simulated.append((future.result(), item))
+                    else:
+                        future.result()
+                        finished[item.number] = True
+                    bar.update()
+                # cache all primary simulations which finished together in one transaction
+                cache_simulations(pre_entry, [sim for sim, _ in simulated])
+                for _, index in simulated:
+                    ready.extend(_resolve_primaries(pre_entry, waiting.pop(index)))
+                while next_point < len(points) and finished[next_point]:
+                    detectors, line = _finish_point(points[next_point], names, n_pts, summary, dry_run,
+                                                    callback, callback_arguments)
+                    if line is not None:
+                        dat_lines.append(line)
+                    next_point += 1
+                dispatch()
+
+    if summary and not dry_run:
+        _write_scan_summary(post, parameters, args, detectors, dat_lines, grid)
 
 
 def _args_pars_mcpl(args: dict, params: dict, mcpl_filename) -> str:
@@ -437,7 +780,14 @@ def do_primary_simulation(sit: SimulationEntry,
                           dry_run: bool = False,
                           process_count: int = 0,
                           capture_output: bool = False,
+                          partials: list[SimulationEntry] | None = None,
                           ):
+    """Simulate the primary instrument for *sit* in a new cache directory, and return the directory
+
+    If cached *partials* of the same simulation with fewer particles are given, only the particles they
+    lack are simulated, and they are merged with those, see :func:`repeat_simulation_until`; *sit* then
+    records the first of *partials* as the simulation it is derived from.
+    """
     from zenlog import log
     from pathlib import Path
     from functools import partial
@@ -485,11 +835,73 @@ def do_primary_simulation(sit: SimulationEntry,
         _run_and_log(runner, _args_pars_mcpl(args_dict, parameters, mcpl_filepath),
                      work_dir, capture_output)
     else:
+        if partials:
+            sit.derived_from = partials[0].id
         repeat_simulation_until(args['ncount'], runner, args_dict, parameters, work_dir, mcpl_filepath,
-                                minimum_particle_count, maximum_particle_count, capture_output=capture_output)
+                                minimum_particle_count, maximum_particle_count, capture_output=capture_output,
+                                partials=[_primary_mcpl_filepath(p) for p in partials or []])
+    if not dry_run:
+        from .maintenance import configured_compression
+        from .mcpl import mcpl_compress, mcpl_real_filename
+        compression = configured_compression(binary_at.stem)
+        if compression is not None:
+            try:
+                mcpl_compress(mcpl_real_filename(mcpl_filepath), compression)
+            except FileNotFoundError:
+                log.warn(f'No MCPL file {mcpl_filepath} was written by the primary simulation')
     return str(work_dir)
 
 
+def _primary_mcpl_filepath(sit: SimulationEntry) -> Path:
+    """The MCPL file of a cached primary simulation"""
+    from .mcpl import mcpl_real_filename
+    value = sit.parameter_values.get('mcpl_filename')
+    if value is not None and value.is_str and value.value is not None and len(value.value):
+        mcpl_filename = value.value.strip('"')
+    else:
+        mcpl_filename = f'{sit.id}.mcpl'
+    mcpl_filename = mcpl_filename.removesuffix('.gz').removesuffix('.mcpl')
+    return mcpl_real_filename(Path(sit.output_path).joinpath(mcpl_filename))
+
+
+def derive_primary_simulation(source: SimulationEntry, ncount: int, instr_file_entry: InstrEntry) -> SimulationEntry:
+    """A primary simulation of *ncount* particles, taken from the cached *source* simulation of more particles
+
+    The first ``ncount / source.ncount`` of the particles in the MCPL file of *source* are written to a new
+    simulation directory, with their weights scaled to keep the total intensity, see
+    :func:`~restage.mcpl.mcpl_truncate`; its other outputs are copied. The returned entry records the
+    identifier of *source* as the one it is derived from, and is not yet cached. It has no seed, even if
+    *source* has one, since its particles are not those of a simulation run with that seed.
+    """
+    from zenlog import log
+    from shutil import copy2
+    from .cache import directory_under_module_data_path
+    from .maintenance import configured_compression
+    from .mcpl import mcpl_compress, mcpl_read_header, mcpl_real_extension, mcpl_truncate
+    source_dir = Path(source.output_path)
+    mcpl_filepath = _primary_mcpl_filepath(source)
+    mcpl_filename = mcpl_filepath.name.removesuffix(mcpl_real_extension(mcpl_filepath))
+    stored = mcpl_read_header(mcpl_filepath).particles
+    # the same fraction of the stored particles as of the simulated particles, rounded up
+    keep = min(stored, -(-stored * ncount // source.ncount))
+    work_dir = directory_under_module_data_path('sim', prefix=f'{Path(instr_file_entry.binary_path).parent.stem}_')
+    log.info(f'Using {keep} of the {stored} particles of primary simulation {source.id} in {work_dir}')
+    try:
+        for file in source_dir.iterdir():
+            if file.is_file() and file != mcpl_filepath and not mcpl_real_extension(file):
+                copy2(file, work_dir.joinpath(file.name))
+        derived = mcpl_truncate(mcpl_filepath, work_dir.joinpath(mcpl_filename), keep, stored / keep if keep else 1.0)
+        compression = configured_compression(Path(instr_file_entry.binary_path).stem)
+        if compression is not None:
+            mcpl_compress(derived, compression)
+    except BaseException:
+        from shutil import rmtree
+        rmtree(work_dir, ignore_errors=True)
+        raise
+    return source.replace(parameter_values=dict(source.parameter_values), seed=None, ncount=ncount,
+                          output_path=str(work_dir), id=None, creation=None, last_access=None, derived_from=source.id)
+
+
 def _run_and_log(runner, cmd_args: str, work_dir: Path, capture_output: bool) -> None:
     """Run the simulation; if capture_output, save stdout+stderr to sim.log in work_dir."""
     result = runner(cmd_args)
@@ -505,18 +917,28 @@ def _run_and_log(runner, cmd_args: str, work_dir: Path, capture_output: bool) ->
 def repeat_simulation_until(count, runner, args: dict, parameters, work_dir: Path, mcpl_filepath: Path,
                             minimum_particle_count: int | None = None,
                             maximum_particle_count: int | None = None,
-                            capture_output: bool = False):
+                            capture_output: bool = False,
+                            partials: list[Path] | None = None):
+    """Simulate until the MCPL file at *mcpl_filepath* holds at least *count* particles
+
+    Each repetition uses a fresh seed, and writes to its own subdirectory of *work_dir*; their MCPL files
+    are then merged, and their other outputs combined, in *work_dir*. The particles of the MCPL files of
+    already cached simulations given as *partials* are included, so that only the remainder is simulated.
+    """
     import random
     from functools import partial
     from zenlog import log
     from .emulate import combine_mccode_dats_in_directories, combine_mccode_sims_in_directories
     from .mcpl import mcpl_particle_count, mcpl_merge_files, mcpl_rename_file
-    goal, latest_result, one_trillion = count, -1, 1_000_000_000_000
+    partials = partials or []
+    goal, latest_result, one_trillion = count - sum(mcpl_particle_count(f) for f in partials), -1, 1_000_000_000_000
+    if len(partials):
+        log.info(f'Adding {max(goal, 0)} particles to the {count - goal} of {len(partials)} cached simulation(s)')
     # avoid looping for too long by limiting the minimum number of particles to simulate
-    minimum_particle_count = _clamp(1, one_trillion, minimum_particle_count or count)
+    minimum_particle_count = _clamp(1, one_trillion, minimum_particle_count or goal)
     # avoid any one loop iteration from taking too long by limiting the maximum number of particles to simulate
     clamp = partial(_clamp, minimum_particle_count,
-                    _clamp(minimum_particle_count, one_trillion, maximum_particle_count or count))
+                    _clamp(minimum_particle_count, one_trillion, maximum_particle_count or goal))
 
     # Normally we _don't_ create `work_dir` to avoid complaints about the directory existing but in this case
     # we will use subdirectories for the actual output files, so we need to create it
@@ -553,16 +975,27 @@ def repeat_simulation_until(count, runner, args: dict, parameters, work_dir: Pat
         # rename the outputfile to this run's filename
         files[-1] = mcpl_rename_file(mcpl_filepath, files[-1])
 
-    # now we need to concatenate the mcpl files, and combine output (.dat and .sim) files
-    mcpl_merge_files(files, mcpl_filepath)
+    # now we need to concatenate the mcpl files, and combine output (.dat and .sim) files;
+    # those of the cached simulations are left in place, since they remain in use
+    mcpl_merge_files(files + partials, mcpl_filepath, keep_originals=bool(len(partials)))
+    if len(partials):
+        for file in files:
+            file.unlink()
+    outputs.extend(f.parent for f in partials)
     combine_mccode_dats_in_directories(outputs, work_dir)
     combine_mccode_sims_in_directories(outputs, work_dir)
 
 
 def do_secondary_simulation(p_sit: SimulationEntry, entry: InstrEntry, pars: dict, args: dict,
                             dry_run: bool = False, process_count: int = 0,
-                            capture_output: bool = False):
+                            capture_output: bool = False, readable=None):
+    """Run the secondary instrument from the MCPL file of the primary simulation *p_sit*
+
+    A zstd compressed primary MCPL file is decompressed by *readable*, the
+    :class:`~restage.mcpl.MCPLReadable` of the scan, or for this simulation alone if there is none.
+    """
     from zenlog import log
+    from contextlib import nullcontext
     from pathlib import Path
     from shutil import copy
     from mccode_antlr.compiler.c import run_compiled_instrument, CBinaryTarget
@@ -577,15 +1010,17 @@ def do_secondary_simulation(p_sit: SimulationEntry, entry: InstrEntry, pars: dic
         log.info('Expected mcpl_filename parameter in secondary simulation, using default')
         mcpl_filename = f'{p_sit.id}.mcpl'
 
-    mcpl_path = mcpl_real_filename(Path(p_sit.output_path).joinpath(mcpl_filename))
     executable = Path(entry.binary_path)
     target = CBinaryTarget(mpi=entry.mpi, acc=entry.acc, count=process_count, nexus=False)
     work_dir = Path(args['dir'])
-    _run_and_log(
-        lambda cmd: run_compiled_instrument(executable, target, cmd, capture=capture_output, dry_run=dry_run),
-        _args_pars_mcpl(args, pars, mcpl_path),
-        work_dir, capture_output
-    )
+    mcpl_path = mcpl_real_filename(Path(p_sit.output_path).joinpath(mcpl_filename))
+    # a dry run does not read the primary MCPL file, so it is not decompressed for one
+    with nullcontext(readable) if readable is not None or dry_run else _readable_primaries() as readable:
+        _run_and_log(
+            lambda cmd: run_compiled_instrument(executable, target, cmd, capture=capture_output, dry_run=dry_run),
+            _args_pars_mcpl(args, pars, mcpl_path if dry_run else readable(mcpl_path)),
+            work_dir, capture_output
+        )
 
     if not dry_run:
         # Copy the primary simulation's .dat file to the secondary simulation's directory and combine .sim files?
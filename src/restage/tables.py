@@ -1,12 +1,12 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+import re
 from mccode_antlr.common import Expr
 
 # Re-export SQLModel table models and utility functions so existing imports continue to work.
 from .models import (
     uuid, utc_timestamp, str_hash, instr_json_hash,
-    InstrModel, SimulationTableModel, NexusStructureModel, SimulationModel,
+    InstrModel, SimulationTableModel, NexusStructureModel, SimulationModel, SimulationValueModel,
 )
 
 # Backward-compatible type aliases: these names now point to SQLModel table models.
@@ -16,48 +16,186 @@ NexusStructureEntry = NexusStructureModel
 
 COMMON_COLUMNS = ['seed', 'ncount', 'output_path', 'gravitation', 'creation', 'last_access']
 
+# The sympy representations which Expr.to_dict produces for scalar float, integer and string values
+_STORED_FLOAT = re.compile(r"Float\('([^']+)', precision=(\d+)\)")
+_STORED_INTEGER = re.compile(r"Integer\((-?\d+)\)")
+_STORED_STRING = re.compile(r"""Symbol\(('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"), commutative=False\)""")
+
+
+def _column_value(value, numeric: bool) -> tuple[object, bool]:
+    """Numeric values which can not be represented as a double are only compared exactly"""
+    if numeric:
+        try:
+            float(value)
+        except OverflowError:
+            return value, False
+    return value, numeric
+
+
+def stored_parameter_value(data: dict) -> tuple[object, bool]:
+    """The Python value of a stored ``Expr.to_dict`` dictionary, and whether it is numeric
+
+    Scalar floats, integers and strings are parsed directly from their stored representation,
+    which is much faster than restoring them via ``Expr.from_dict``; other values still are.
+    The value is the same as ``Expr.from_dict(data).value``.
+    """
+    from ast import literal_eval
+    exprs = data.get('exprs') or []
+    if data.get('shape_type') == 1 and data.get('object_type') == 1 and len(exprs) == 1:
+        kind, text = data.get('data_type'), exprs[0]
+        if kind == 1 and (match := _STORED_FLOAT.fullmatch(text)):
+            if match.group(2) == '53':
+                return float(match.group(1)), True
+            # sympy rounds a decimal string to other binary precisions differently
+            from sympy import Float
+            return float(Float(match.group(1), precision=int(match.group(2)))), True
+        if kind == 2 and (match := _STORED_INTEGER.fullmatch(text)):
+            return _column_value(int(match.group(1)), True)
+        if kind == 3 and (match := _STORED_STRING.fullmatch(text)):
+            return literal_eval(match.group(1)), False
+    value = Expr.from_dict(data)
+    return _column_value(value.value if value.has_value else str(value), (value.is_float or value.is_int) and value.has_value)
+
+
+class SimulationSchema:
+    """The parameter names and matching precisions shared by many :class:`SimulationEntry` objects
+
+    Every simulation of one table, or every point of one scan, can share a schema so that the
+    user-specified *precision* is only searched once per parameter name, e.g., to select 'speed'
+    for 'ps1speed', rather than once per entry.  The resolved precisions are stored in the shared
+    *precision* dictionary, which is also what each entry reports as its ``precision``.
+    """
+    __slots__ = ('names', 'index', 'precision', '_given', '_keys')
+
+    def __init__(self, names=(), precision: dict[str, float] | None = None):
+        self.names = tuple(names)
+        self.index = {name: column for column, name in enumerate(self.names)}
+        self.precision = {} if precision is None else precision
+        self._given = tuple(self.precision)
+        self._keys: dict[str, str | None] = {}
+
+    def __repr__(self):
+        return f'SimulationSchema(names={self.names!r}, precision={self.precision!r})'
+
+    def __getstate__(self):
+        return self.names, self.precision, self._given
+
+    def __setstate__(self, state):
+        self.names, self.precision, self._given = state
+        self.index = {name: column for column, name in enumerate(self.names)}
+        self._keys = {}
+
+    def precision_key(self, name: str) -> str | None:
+        """The user-specified precision key which applies to parameter *name*, if any"""
+        if name not in self._keys:
+            from zenlog import log
+            best = [p for p in self._given if p in name]
+            if len(best) > 1:
+                log.info(f"SimulationSchema.precision_key:: Multiple precision matches for {name}: {best}")
+            self._keys[name] = best[0] if len(best) else None
+        return self._keys[name]
+
+    def resolve(self, name: str, value: Expr) -> None:
+        """Ensure that the floating point parameter *name*, with *value*, has a matching precision"""
+        if name in self.precision:
+            return
+        key = self.precision_key(name)
+        if key is not None:
+            # This abs is probably overkill, but it's worth protecting against a user-specified negative value
+            self.precision[name] = abs(self.precision[key])
+        elif value.has_value:
+            # This abs is *crucial* since a negative parameter value would have a negative precision otherwise
+            self.precision[name] = abs(value.value / 10000)
+        else:
+            from zenlog import log
+            log.info(f'SimulationSchema.resolve:: No precision match for value-less {name}, using 0.1;'
+                     ' consider specifying precision dict during initialization')
+            self.precision[name] = 0.1
+
 
-@dataclass
 class SimulationEntry:
-    """Business-logic dataclass representing one cached simulation run.
+    """Business-logic object representing one cached simulation run.
 
     This is *not* a SQLModel table model — persistence is handled via
     :class:`~restage.models.SimulationModel`.  Use :meth:`to_model` /
     :meth:`from_model` to convert, and :meth:`matches_candidate` for the
     Python-side tolerance check that replaces the old SQL ``BETWEEN`` query.
+
+    Entries are slotted, since whole tables of them may be held in memory, and their parameter
+    names and precisions are held by a :class:`SimulationSchema` which is shared when one is given.
     """
-    parameter_values: dict[str, Expr]
-    seed: int | None = None
-    ncount: int | None = None
-    output_path: str = field(default_factory=str)
-    gravitation: bool = False
-    precision: dict[str, float] = field(default_factory=dict)
-    id: str = field(default_factory=uuid)
-    creation: float = field(default_factory=utc_timestamp)
-    last_access: float = field(default_factory=utc_timestamp)
-
-    def __post_init__(self):
-        from zenlog import log
+    __slots__ = ('parameter_values', 'seed', 'ncount', 'output_path', 'gravitation', 'id', 'creation',
+                 'last_access', 'schema', 'derived_from', '_vector')
+
+    def __init__(self, parameter_values: dict[str, Expr], seed: int | None = None, ncount: int | None = None,
+                 output_path: str = '', gravitation: bool = False, precision: dict[str, float] | None = None,
+                 id: str | None = None, creation: float | None = None, last_access: float | None = None,
+                 schema: SimulationSchema | None = None, derived_from: str | None = None):
+        self.parameter_values = parameter_values
+        self.seed = seed
+        self.ncount = ncount
+        self.output_path = output_path
+        self.gravitation = gravitation
+        self.id = uuid() if id is None else id
+        self.creation = utc_timestamp() if creation is None else creation
+        self.last_access = utc_timestamp() if last_access is None else last_access
+        self.schema = SimulationSchema(parameter_values, precision) if schema is None else schema
+        self.derived_from = derived_from
+        self._vector = None
         for k, v in self.parameter_values.items():
             if not isinstance(v, Expr):
                 self.parameter_values[k] = Expr.best(v)
 
         for k, v in self.parameter_values.items():
-            if v.is_float and k not in self.precision:
-                # Find the best matching precision, e.g., k='ps1speed' would select 'speed' from ('speed', 'phase', ...)
-                best = [p for p in self.precision.keys() if p in k]
-                if len(best) > 1:
-                    log.info(f"SimulationEntry.__post_init__:: Multiple precision matches for {k}: {best}")
-                if len(best):
-                    # This abs is probably overkill, but it's worth protecting against a user-specified negative value
-                    self.precision[k] = abs(self.precision[best[0]])
-                elif self.parameter_values[k].has_value:
-                    # This abs is *crucial* since a negative parameter value would have a negative precision otherwise
-                    self.precision[k] = abs(self.parameter_values[k].value / 10000)
-                else:
-                    log.info(f'SimulationEntry.__post_init__:: No precision match for value-less {k}, using 0.1;'
-                             ' consider specifying precision dict during initialization')
-                    self.precision[k] = 0.1
+            if v.is_float:
+                self.schema.resolve(k, v)
+
+    @property
+    def precision(self) -> dict[str, float]:
+        return self.schema.precision
+
+    @property
+    def vector(self):
+        """The numeric parameter values, in the order of the schema names, with NaN for any other value"""
+        if self._vector is None:
+            import numpy as np
+            vector = np.full(len(self.schema.names), np.nan)
+            for k, v in self.parameter_values.items():
+                column = self.schema.index.get(k)
+                if column is not None and (v.is_float or v.is_int) and v.has_value:
+                    value, numeric = _column_value(v.value, True)
+                    if numeric:
+                        vector[column] = value
+            self._vector = vector
+        return self._vector
+
+    def _fields(self) -> tuple:
+        return (self.parameter_values, self.seed, self.ncount, self.output_path, self.gravitation, self.precision,
+                self.id, self.creation, self.last_access, self.derived_from)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __repr__(self):
+        names = ('parameter_values', 'seed', 'ncount', 'output_path', 'gravitation', 'precision', 'id', 'creation',
+                 'last_access', 'derived_from')
+        return f"SimulationEntry({', '.join(f'{n}={v!r}' for n, v in zip(names, self._fields()))})"
+
+    def replace(self, **changes) -> 'SimulationEntry':
+        """A copy of this entry, sharing its schema, with some fields changed like :func:`dataclasses.replace`"""
+        names = ('parameter_values', 'seed', 'ncount', 'output_path', 'gravitation', 'id', 'creation', 'last_access',
+                 'schema', 'derived_from')
+        return SimulationEntry(**{**{name: getattr(self, name) for name in names}, **changes})
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != '_vector'}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._vector = None
 
     def __hash__(self):
         return hash((tuple(self.parameter_values.values()), self.seed, self.ncount, self.gravitation))
@@ -103,15 +241,59 @@ class SimulationEntry:
             gravitation=self.gravitation,
             creation=self.creation,
             last_access=self.last_access,
+            parameter_hash=self.exact_hash(),
+            derived_from=self.derived_from,
         )
 
+    def exact_hash(self) -> str:
+        """A canonical digest of the parameter values, seed, ncount and gravitation of this entry.
+
+        Identical simulations have identical digests, independent of parameter order and of the
+        Python process, so the digest can be stored and compared via an index.
+        Integers and floating point values are distinguished, and floats are represented exactly.
+        """
+        parts = []
+        for k in sorted(self.parameter_values):
+            v = self.parameter_values[k]
+            if v.is_float and v.has_value:
+                parts.append(f'{k}=float:{float(v.value).hex()}')
+            elif v.is_int and v.has_value:
+                parts.append(f'{k}=int:{int(v.value)}')
+            elif v.is_str and v.has_value:
+                parts.append(f'{k}=str:{v.value}')
+            else:
+                parts.append(f'{k}=expr:{v}')
+        parts.extend((f'seed={self.seed}', f'ncount={self.ncount}', f'gravitation={bool(self.gravitation)}'))
+        return str_hash('\n'.join(parts))
+
+    def indexed_values(self) -> dict[str, float]:
+        """The numeric parameter values which can be represented by :class:`~restage.models.SimulationValueModel`
+
+        Integers beyond the exactly-representable range of a double, and non-finite values, are excluded.
+        """
+        from math import isfinite
+        values = {}
+        for k, v in self.parameter_values.items():
+            if (v.is_float or v.is_int) and v.has_value:
+                value = v.value
+                if isfinite(value) and abs(value) < 2 ** 53:
+                    values[k] = float(value)
+        return values
+
+    def to_value_models(self, table_id: str) -> list[SimulationValueModel]:
+        """The :class:`~restage.models.SimulationValueModel` index rows for this simulation"""
+        return [SimulationValueModel(simulation_id=self.id, table_id=table_id, name=k, value=v)
+                for k, v in self.indexed_values().items()]
+
     @classmethod
-    def from_model(cls, model: SimulationModel, param_names: list[str]) -> 'SimulationEntry':
+    def from_model(cls, model: SimulationModel, param_names: list[str],
+                   schema: SimulationSchema | None = None) -> 'SimulationEntry':
         """Reconstruct a :class:`SimulationEntry` from a persisted :class:`~restage.models.SimulationModel`.
 
         *param_names* is the ordered list of parameter names stored in the parent
         :class:`~restage.models.SimulationTableModel`.  Each value is restored via
         ``Expr.from_dict`` so that type information (float/int/string) is preserved.
+        Entries from the same table should share one *schema*.
         """
         pv_raw = model.parameter_values or {}
         parameter_values = {k: Expr.from_dict(pv_raw[k]) for k in param_names if k in pv_raw}
@@ -124,6 +306,8 @@ class SimulationEntry:
             id=model.id,
             creation=model.creation,
             last_access=model.last_access,
+            schema=schema,
+            derived_from=getattr(model, 'derived_from', None),
         )
 
     def parameter_distance(self, other: 'SimulationEntry') -> float:
@@ -140,7 +324,365 @@ class SimulationEntry:
         return total
 
 
-def best_simulation_entry_match_index(candidates: list[SimulationEntry], pivot: SimulationEntry) -> int:
+class SimulationCandidates:
+    """A columnar view of many :class:`SimulationEntry` candidates for vectorized tolerance matching
+
+    Numeric parameter values are held in a ``(candidates, parameters)`` floating point array,
+    with NaN where a candidate has no numeric value, while every value is also held in an object
+    array for exact (integer and string) comparisons.  Seed, ncount and gravitation are columns too.
+    :meth:`match` tests one query against every candidate, and :meth:`match_many` tests many
+    queries at once, with the same semantics as :meth:`SimulationEntry.matches_candidate`.
+    """
+
+    def __init__(self, candidates: list[SimulationEntry] = ()):
+        import numpy as np
+        self.names: dict[str, int] = {}
+        self.keysets: dict[frozenset, int] = {}
+        self.numbers = np.empty((0, 0))
+        self.objects = np.empty((0, 0), dtype=object)
+        self.keyset = np.empty(0, dtype=np.int64)
+        self.seed = np.empty(0, dtype=object)
+        self.ncount = np.empty(0, dtype=object)
+        self.gravitation = np.empty(0, dtype=bool)
+        self._entries: list[SimulationEntry | None] = []
+        self._stored: list[tuple | None] = []
+        self._neighbours: tuple[tuple, SimulationNeighbours] | None = None
+        self.extend(candidates)
+
+    def extend(self, candidates: list[SimulationEntry]) -> None:
+        """Append more candidates, converting only the new ones to columns"""
+        values = [{k: _column_value(v.value if v.has_value else str(v), (v.is_float or v.is_int) and v.has_value)
+                   for k, v in c.parameter_values.items()} for c in candidates]
+        self._append(values, [(c.seed, c.ncount, c.gravitation) for c in candidates])
+        self._entries.extend(candidates)
+        self._stored.extend(None for _ in candidates)
+
+    def extend_stored(self, rows: list, param_names: list[str]) -> None:
+        """Append stored simulations, e.g., :class:`~restage.models.SimulationModel` or equivalent query rows
+
+        Their values are decoded by :func:`stored_parameter_value`, and each :class:`SimulationEntry`
+        is only constructed (via :meth:`SimulationEntry.from_model`) once it is needed, sharing
+        one :class:`SimulationSchema` with the other rows.
+        """
+        schema = SimulationSchema(param_names)
+        values = []
+        for row in rows:
+            raw = row.parameter_values or {}
+            values.append({k: stored_parameter_value(raw[k]) for k in param_names if k in raw})
+        self._append(values, [(row.seed, row.ncount, row.gravitation) for row in rows])
+        self._entries.extend(None for _ in rows)
+        self._stored.extend((row, schema) for row in rows)
+
+    def _append(self, values: list[dict[str, tuple[object, bool]]], settings: list[tuple]) -> None:
+        import numpy as np
+        for v in values:
+            for k in v:
+                self.names.setdefault(k, len(self.names))
+        n, p = len(values), len(self.names)
+        numbers = np.full((n, p), np.nan)
+        objects = np.empty((n, p), dtype=object)
+        keyset = np.empty(n, dtype=np.int64)
+        seed = np.empty(n, dtype=object)
+        ncount = np.empty(n, dtype=object)
+        gravitation = np.zeros(n, dtype=bool)
+        for i, (v, (s, nc, g)) in enumerate(zip(values, settings)):
+            keyset[i] = self.keysets.setdefault(frozenset(v), len(self.keysets))
+            for k, (value, numeric) in v.items():
+                objects[i, self.names[k]] = value
+                if numeric:
+                    numbers[i, self.names[k]] = value
+            seed[i] = s
+            ncount[i] = nc
+            gravitation[i] = bool(g)
+        # parameters which are new with these candidates are missing from all earlier candidates
+        extra = p - self.numbers.shape[1]
+        self.numbers = np.concatenate((np.pad(self.numbers, ((0, 0), (0, extra)), constant_values=np.nan), numbers))
+        self.objects = np.concatenate((np.pad(self.objects, ((0, 0), (0, extra)), constant_values=None), objects))
+        self.keyset = np.concatenate((self.keyset, keyset))
+        self.seed = np.concatenate((self.seed, seed))
+        self.ncount = np.concatenate((self.ncount, ncount))
+        self.gravitation = np.concatenate((self.gravitation, gravitation))
+        self._neighbours = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def entry(self, index: int) -> SimulationEntry:
+        """The candidate at *index*, constructed from its stored form on first use"""
+        if self._entries[index] is None:
+            import numpy as np
+            row, schema = self._stored[index]
+            entry = SimulationEntry.from_model(row, list(schema.names), schema)
+            # the numeric values are already known, and are slow to retrieve from each Expr
+            known = [(column, self.names[k]) for column, k in enumerate(schema.names) if k in self.names]
+            entry._vector = np.full(len(schema.names), np.nan)
+            entry._vector[[c for c, _ in known]] = self.numbers[index, [n for _, n in known]]
+            self._entries[index] = entry
+            self._stored[index] = None
+        return self._entries[index]
+
+    @property
+    def candidates(self) -> list[SimulationEntry]:
+        return [self.entry(index) for index in range(len(self))]
+
+    def neighbours(self, precision: dict[str, float]) -> SimulationNeighbours:
+        """The :class:`SimulationNeighbours` of all candidates in units of *precision*, built once until they change"""
+        key = tuple(sorted(precision.items()))
+        if self._neighbours is None or self._neighbours[0] != key:
+            self._neighbours = key, SimulationNeighbours(self.candidates, dict(precision))
+        return self._neighbours[1]
+
+    def _signature(self, row: SimulationEntry) -> tuple:
+        """The parts of a query which determine which columns it is compared against, and how"""
+        return (frozenset(row.parameter_values), tuple((k, bool(v.is_float)) for k, v in row.parameter_values.items()),
+                row.seed, row.ncount, bool(row.gravitation))
+
+    def _common_mask(self, signature: tuple):
+        """Candidates which can match any query with *signature*, before comparing parameter values"""
+        import numpy as np
+        keys, _, seed, ncount, gravitation = signature
+        if keys not in self.keysets:
+            return np.zeros(len(self), dtype=bool)
+        mask = self.keyset == self.keysets[keys]
+        if seed is not None:
+            mask &= self.seed == seed
+        if ncount is not None:
+            mask &= self.ncount == ncount
+        if gravitation:
+            mask &= self.gravitation
+        return mask
+
+    def matches(self, rows: list[SimulationEntry], exact: bool = False) -> list[list[SimulationEntry]]:
+        """The candidates which each row matches, in candidate order
+
+        With *exact* set, rows which match candidates identical to themselves, per
+        :meth:`SimulationEntry.exact_hash`, are given only those candidates.
+        """
+        import numpy as np
+        results = [[self.entry(i) for i in np.flatnonzero(mask)] for mask in self.match_many(rows)]
+        if exact:
+            for index, (row, found) in enumerate(zip(rows, results)):
+                if len(found):
+                    digest = row.exact_hash()
+                    results[index] = [c for c in found if c.exact_hash() == digest] or found
+        return results
+
+    def match(self, row: SimulationEntry):
+        """A boolean mask of the candidates which *row* matches"""
+        return self.match_many([row])[0]
+
+    def match_many(self, rows: list[SimulationEntry], chunk: int = 1 << 22):
+        """A boolean ``(rows, candidates)`` matrix of the candidates which each row matches
+
+        Rows which share their parameter names, exact values, seed, ncount and gravitation are
+        compared in one broadcast operation, in blocks of at most *chunk* row-candidate pairs.
+        """
+        import numpy as np
+        result = np.zeros((len(rows), len(self)), dtype=bool)
+        if not len(self) or not len(rows):
+            return result
+        groups: dict[tuple, list[int]] = {}
+        for index, row in enumerate(rows):
+            signature = self._signature(row)
+            exact = tuple((k, v.value if v.has_value else str(v)) for k, v in row.parameter_values.items()
+                          if not v.is_float)
+            groups.setdefault((signature, exact), []).append(index)
+        for (signature, exact), indexes in groups.items():
+            common = self._common_mask(signature)
+            for k, value in exact:
+                if common.any():
+                    common &= self.objects[:, self.names[k]] == value
+            columns = np.flatnonzero(common)
+            if not len(columns):
+                continue
+            inexact = [k for k, is_float in signature[1] if is_float]
+            if not len(inexact):
+                result[np.ix_(indexes, columns)] = True
+                continue
+            numbers = self.numbers[np.ix_(columns, [self.names[k] for k in inexact])]
+            values = np.array([[rows[i].parameter_values[k].value for k in inexact] for i in indexes], dtype=float)
+            widths = np.array([[rows[i].precision[k] for k in inexact] for i in indexes], dtype=float)
+            step = max(1, chunk // (len(columns) * len(inexact)))
+            for first in range(0, len(indexes), step):
+                block = slice(first, first + step)
+                within = np.abs(numbers[None, :, :] - values[block, None, :]) <= widths[block, None, :]
+                result[np.ix_(indexes[block], columns)] = within.all(axis=2)
+        return result
+
+
+def match_simulation_candidates(rows: list[SimulationEntry],
+                                candidates: list[SimulationEntry]) -> list[list[SimulationEntry]]:
+    """Find the candidates which each row matches, with the semantics of :meth:`SimulationEntry.matches_candidate`
+
+    The comparison is vectorized over all candidates and rows via :class:`SimulationCandidates`.
+    The matches for each row are returned in their original candidate order.
+    """
+    if not len(rows):
+        return []
+    return SimulationCandidates(candidates).matches(rows)
+
+
+class SimulationNeighbours:
+    """A spatial index of simulation entries, for nearest-neighbour and within-precision queries
+
+    Entries are grouped by their parameter names and non-floating-point values, which must be
+    identical for entries to be compared, and within each group their floating point parameter
+    values are divided by *precision* so that one unit of distance is one unit of matching tolerance.
+    Each group is indexed by a :class:`scipy.spatial.cKDTree`, when SciPy is installed, so that queries
+    take logarithmic rather than linear time; otherwise every group member is compared via NumPy.
+    Distances between entries are the sum of their normalized differences, like
+    :meth:`SimulationEntry.parameter_distance`, and equidistant entries are ordered by decreasing ncount.
+    """
+
+    def __init__(self, entries: list[SimulationEntry], precision: dict[str, float]):
+        import numpy as np
+        self.entries = entries
+        self.precision = precision
+        self.position = {entry.id: index for index, entry in enumerate(entries)}
+        self.ncount = np.array([entry.ncount or 0 for entry in entries], dtype=np.int64)
+        self.group = np.empty(len(entries), dtype=np.int64)
+        members: dict[tuple, list[int]] = {}
+        for index, entry in enumerate(entries):
+            members.setdefault(self._key(entry), []).append(index)
+        self.groups: dict[tuple, tuple] = {}
+        for number, (key, indexes) in enumerate(members.items()):
+            self.group[indexes] = number
+            if self._scalable(key[0]):
+                points = np.array([self._point(entries[i], key[0]) for i in indexes], dtype=float)
+                points = points.reshape(len(indexes), len(key[0]))
+                self.groups[key] = number, np.array(indexes), points, self._tree(points)
+
+    @staticmethod
+    def _key(entry: SimulationEntry) -> tuple:
+        inexact = tuple(sorted(k for k, v in entry.parameter_values.items() if v.is_float and v.has_value))
+        exact = tuple(sorted((k, v.value if v.has_value else str(v)) for k, v in entry.parameter_values.items()
+                             if not (v.is_float and v.has_value)))
+        return inexact, exact
+
+    def _scalable(self, names: tuple) -> bool:
+        return all(self.precision.get(k, 0) > 0 for k in names)
+
+    def _point(self, entry: SimulationEntry, names: tuple) -> list[float]:
+        vector, index = entry.vector, entry.schema.index
+        return [(vector[index[k]] if k in index else entry.parameter_values[k].value) / self.precision[k]
+                for k in names]
+
+    @staticmethod
+    def _tree(points):
+        if not points.shape[1] or len(points) < 16:
+            return None
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            return None
+        return cKDTree(points)
+
+    def _locate(self, pivot: SimulationEntry):
+        """The group which *pivot* belongs to, and its normalized position, or None if it matches no group"""
+        key = self._key(pivot)
+        if key not in self.groups:
+            return None
+        return self.groups[key], self._point(pivot, key[0])
+
+    def _ordered(self, indexes, distances, rank=None) -> list[int]:
+        """Order by distance, then decreasing ncount, then *rank* or index"""
+        import numpy as np
+        indexes = np.asarray(indexes, dtype=np.int64)
+        order = np.lexsort((indexes if rank is None else rank, -self.ncount[indexes], distances))
+        return [int(i) for i in indexes[order]]
+
+    def nearest(self, pivot: SimulationEntry, k: int = 1) -> list[int]:
+        """The indexes of the (at most) *k* entries nearest to *pivot*, the closest and then largest ncount first
+
+        Entries at the same distance as the k-th nearest are considered too, so the choice between
+        equidistant entries depends only on their ncount.
+        """
+        import numpy as np
+        located = self._locate(pivot)
+        if located is None or k < 1:
+            return []
+        (_, indexes, points, tree), point = located
+        if tree is None:
+            distances = np.abs(points - point).sum(axis=1)
+            last = min(k, len(distances)) - 1
+            nearest = np.flatnonzero(distances <= np.partition(distances, last)[last])
+            return self._ordered(indexes[nearest], distances[nearest])[:k]
+        count = k
+        while True:
+            count = min(count * 2, len(indexes))
+            distances, found = tree.query(point, k=count, p=1)
+            distances, found = np.atleast_1d(distances), np.atleast_1d(found)
+            # equidistant entries beyond the count queried may be more important than those found
+            if count == len(indexes) or distances[-1] > distances[min(k, count) - 1]:
+                break
+        return self._ordered(indexes[found], distances)[:k]
+
+    def within(self, pivot: SimulationEntry, radius: float = 1.0) -> list[int]:
+        """The indexes of the entries with every normalized parameter within *radius* of *pivot*, nearest first
+
+        With the default radius, and the precision of *pivot*, these are the entries that it matches
+        for any seed, ncount and gravitation.
+        """
+        return self._ordered(*self._within(pivot, radius))
+
+    def _within(self, pivot: SimulationEntry, radius: float):
+        import numpy as np
+        located = self._locate(pivot)
+        if located is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        (_, indexes, points, tree), point = located
+        if tree is None:
+            found = np.flatnonzero(np.abs(points - point).max(axis=1, initial=0) <= radius)
+        else:
+            found = np.array(tree.query_ball_point(point, radius, p=np.inf), dtype=np.int64)
+        return indexes[found], np.abs(points[found] - point).sum(axis=1)
+
+    def best(self, pivot: SimulationEntry, among=None) -> int | None:
+        """The index of the nearest entry to *pivot*, preferring those with more particles at the same distance
+
+        If *among* is given only those indexes, which should all match *pivot*, are considered,
+        and equally good entries are chosen in the order given.  None is returned if the entries to consider can not be compared, e.g., because their
+        non-floating-point values differ from those of *pivot*.
+        """
+        located = self._locate(pivot)
+        if located is None:
+            return None
+        number = located[0][0]
+        if among is None:
+            if (self.group != number).any():
+                return None
+            found = self.nearest(pivot)
+            return found[0] if len(found) else None
+        import numpy as np
+        rank = {index: order for order, index in enumerate(among)}
+        if any(self.group[i] != number for i in rank):
+            return None
+        # a little beyond the matching tolerance, to allow for rounding when normalizing
+        indexes, distances = self._within(pivot, 1 + 1e-9)
+        keep = np.array([i in rank for i in indexes], dtype=bool)
+        if keep.sum() != len(rank):
+            return None
+        indexes, distances = indexes[keep], distances[keep]
+        return self._ordered(indexes, distances, np.array([rank[i] for i in indexes], dtype=np.int64))[0]
+
+
+def _best_among(neighbours, candidates: list[SimulationEntry], pivot: SimulationEntry) -> int | None:
+    """The index of the best of *candidates* for *pivot*, found via the first of the prebuilt *neighbours*
+    which holds all of them in the precision of *pivot*, or None if none does"""
+    for index in neighbours:
+        if index.precision != pivot.precision:
+            continue
+        positions = [index.position.get(c.id) for c in candidates]
+        if None in positions or any(index.entries[p] is not c for p, c in zip(positions, candidates)):
+            continue
+        best = index.best(pivot, among=positions)
+        if best is not None:
+            return positions.index(best)
+    return None
+
+
+def best_simulation_entry_match_index(candidates: list[SimulationEntry], pivot: SimulationEntry,
+                                      neighbours: list[SimulationNeighbours] = ()) -> int:
     # There are many reasons a query could have returned multiple matches.
     #   there could be multiple points repeated within the uncertainty we used to select the primary simulation
     #   the same simulation could be repeated with different seed values, and we haven't specified a seed here
@@ -152,6 +694,14 @@ def best_simulation_entry_match_index(candidates: list[SimulationEntry], pivot:
     #   ... come up with some heuristic for picking the best seed?
     if len(candidates) < 2:
         return 0
+    # the index of all simulations of the table, if it has been built already
+    best = _best_among(neighbours, candidates, pivot)
+    if best is not None:
+        return best
+    # candidates which share the non-floating-point values of the pivot are compared in units of its precision
+    best = SimulationNeighbours(candidates, pivot.precision).best(pivot)
+    if best is not None:
+        return best
     # sort the candidate indexes by parameter-distance from the pivot
     distances = [c.parameter_distance(pivot) for c in candidates]
     indexes = sorted(range(len(candidates)), key=lambda index: distances[index])
@@ -166,5 +716,82 @@ def best_simulation_entry_match_index(candidates: list[SimulationEntry], pivot:
     return indexes[best]
 
 
-def best_simulation_entry_match(candidates: list[SimulationEntry], pivot: SimulationEntry) -> SimulationEntry:
-    return candidates[best_simulation_entry_match_index(candidates, pivot)]
+def best_simulation_entry_matches(candidates: list[list[SimulationEntry]], pivots: list[SimulationEntry],
+                                  neighbours: list[SimulationNeighbours] = ()) -> list[SimulationEntry]:
+    """The best of the candidates matched by each pivot, per :func:`best_simulation_entry_match`
+
+    The prebuilt *neighbours* of whole simulation tables, see :meth:`SimulationCandidates.neighbours`,
+    are used where they hold all candidates of a pivot; otherwise the distinct candidates of all pivots
+    are indexed once by :class:`SimulationNeighbours`, in units of the precision of the first pivot,
+    so that the best candidate for each pivot is found without comparing it to every one of its candidates.
+    """
+    unique: dict[str, SimulationEntry] = {}
+    for found in candidates:
+        for candidate in found:
+            unique.setdefault(candidate.id, candidate)
+    entries = list(unique.values())
+    position = {candidate_id: index for index, candidate_id in enumerate(unique)}
+    combined = None
+    best = []
+    for found, pivot in zip(candidates, pivots):
+        index = _best_among(neighbours, found, pivot) if len(found) > 1 else None
+        if index is not None:
+            best.append(found[index])
+            continue
+        if len(found) > 1 and pivot.precision is pivots[0].precision:
+            if combined is None:
+                combined = SimulationNeighbours(entries, pivots[0].precision)
+            index = combined.best(pivot, among=[position[c.id] for c in found])
+        best.append(entries[index] if index is not None else best_simulation_entry_match(found, pivot))
+    return best
+
+
+def best_simulation_entry_match(candidates: list[SimulationEntry], pivot: SimulationEntry,
+                                neighbours: list[SimulationNeighbours] = ()) -> SimulationEntry:
+    return candidates[best_simulation_entry_match_index(candidates, pivot, neighbours)]
+
+
+def _exact_match_key(entry: SimulationEntry) -> tuple:
+    """The parts of an entry which must be identical for it to match another, within tolerance or not"""
+    inexact = tuple(k for k, v in entry.parameter_values.items() if v.is_float)
+    exact = tuple((k, v) for k, v in entry.parameter_values.items() if not v.is_float)
+    return inexact, exact, entry.seed, entry.ncount, entry.gravitation
+
+
+def unique_simulation_entry_indexes(entries: list[SimulationEntry]) -> tuple[list[int], list[int]]:
+    """Collapse the entries which match each other within their precision
+
+    Returns the sorted indexes of one representative entry per unique configuration, and the index of
+    the representative of every entry.  Each entry matches its representative, but entries which share
+    a representative need not match each other, so no other member can stand in for it.
+    Entries are only compared with those which share their non-floating-point values, and within those
+    groups only with entries whose first floating-point value is within tolerance, so that large scans
+    do not require comparing every pair of entries.
+    """
+    groups: dict[tuple, list[int]] = {}
+    for index, entry in enumerate(entries):
+        groups.setdefault(_exact_match_key(entry), []).append(index)
+
+    representative = list(range(len(entries)))
+    for (inexact, *_), indexes in groups.items():
+        if not len(inexact):
+            for index in indexes:
+                representative[index] = indexes[0]
+            continue
+        first = inexact[0]
+        values = {index: entries[index].parameter_values[first].value for index in indexes}
+        kept: list[int] = []
+        for index in sorted(indexes, key=values.__getitem__):
+            entry = entries[index]
+            lowest = values[index] - entry.precision[first]
+            for other in reversed(kept):
+                if values[other] < lowest:
+                    kept.append(index)
+                    break
+                if entry.matches_candidate(entries[other]):
+                    representative[index] = other
+                    break
+            else:
+                kept.append(index)
+
+    return sorted(set(representative)), representative
@@ -2,6 +2,17 @@ import unittest
 from restage.database import Database
 
 
+def _insert_from_process(db_file, table_id, first, count):
+    from restage import SimulationTableEntry, SimulationEntry
+    from mccode_antlr.common import Expr
+    table = SimulationTableEntry(parameters=['x'], name='shared_instr', id=table_id)
+    with Database(db_file, busy_timeout=60.0) as db:
+        for index in range(first, first + count):
+            db.insert_simulation(table, SimulationEntry({'x': Expr.best(index + 0.5)}))
+            db.retrieve_simulations(table_id, [SimulationEntry({'x': Expr.best(index + 0.5)})])
+    return count
+
+
 class MyTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -119,6 +130,232 @@ class MyTestCase(unittest.TestCase):
         # So it's up to the user to specify the correct parameters to retrieve the correct simulation,
         # or to filter on the returned values for the most-appropriate simulation.
 
+    def test_simulations(self):
+        from restage import SimulationTableEntry, SimulationEntry
+        from mccode_antlr.common import Expr
+        entry = SimulationTableEntry(parameters=['par1', 'par2'], name='super_instr_3')
+        self.db.insert_simulation_table(entry)
+
+        def sim(par1, par2, **kwargs):
+            return SimulationEntry({'par1': Expr.best(par1), 'par2': Expr.best(par2)}, **kwargs)
+
+        for par1 in (1.1, 2.2, 3.3):
+            self.db.insert_simulation(entry, sim(par1, 0.5, seed=1))
+            self.db.insert_simulation(entry, sim(par1, 0.5, seed=2))
+        rows = [sim(1.1, 0.5), sim(2.2, 0.5, seed=2), sim(4.4, 0.5), sim(3.3, 0.75)]
+        retrieved = self.db.retrieve_simulations(entry.id, rows)
+        self.assertEqual([len(r) for r in retrieved], [2, 1, 0, 0])
+        # each batched result must be identical to its single-row query
+        for row, batch in zip(rows, retrieved):
+            single = self.db.retrieve_simulation(entry.id, row)
+            self.assertEqual({s.id for s in single}, {s.id for s in batch})
+
+    def _value_index_entries(self):
+        from restage import SimulationTableEntry, SimulationEntry
+        from mccode_antlr.common import Expr
+        entry = SimulationTableEntry(parameters=['par1', 'par2', 'par3'], name='super_instr_4')
+        self.db.insert_simulation_table(entry)
+        for index in range(20):
+            pars = {'par1': Expr.best(0.1 * index + 0.01), 'par2': Expr.best(index % 3), 'par3': Expr.best('"three"')}
+            self.db.insert_simulation(entry, SimulationEntry(pars, seed=index % 2))
+        rows = [SimulationEntry({'par1': Expr.best(0.1 * index + 0.02), 'par2': Expr.best(index % 3),
+                                 'par3': Expr.best('"three"')}, precision={'par1': 0.05}) for index in range(22)]
+        return entry, rows
+
+    def test_value_index(self):
+        entry, rows = self._value_index_entries()
+        indexed = self.db.retrieve_simulations(entry.id, rows)
+        self.assertEqual([len(r) for r in indexed], [1] * 20 + [0] * 2)
+        self.db.value_index = False
+        scanned = self.db.retrieve_simulations(entry.id, rows)
+        self.assertEqual([[s.id for s in r] for r in indexed], [[s.id for s in r] for r in scanned])
+
+    def test_value_index_backfill(self):
+        from restage.models import SimulationValueModel
+        entry, rows = self._value_index_entries()
+        with self.db.engine.begin() as conn:
+            conn.exec_driver_sql(f'DELETE FROM {SimulationValueModel.__tablename__}')
+        self.assertEqual(sum(len(r) for r in self.db.retrieve_simulations(entry.id, rows)), 0)
+        # the index is only refilled by migrating a database from before it existed
+        self._drop_parameter_hash()
+        with self.db.engine.begin() as conn:
+            conn.exec_driver_sql(f'DROP TABLE {SimulationValueModel.__tablename__}')
+            conn.exec_driver_sql('PRAGMA user_version = 1')
+        del self.db
+        self.db = Database(self.db_file)
+        self.assertEqual([len(r) for r in self.db.retrieve_simulations(entry.id, rows)], [1] * 20 + [0] * 2)
+        self.assertEqual(len(self.db.retrieve_simulations(entry.id, rows[:1], exact=True)[0]), 1)
+
+    def test_readonly_without_value_index(self):
+        from restage.models import SimulationValueModel
+        entry, rows = self._value_index_entries()
+        with self.db.engine.begin() as conn:
+            conn.exec_driver_sql(f'DROP TABLE {SimulationValueModel.__tablename__}')
+            conn.exec_driver_sql('PRAGMA user_version = 1')
+        del self.db
+        self.db = Database(self.db_file, readonly=True)
+        self.assertFalse(self.db.value_index)
+        self.assertEqual([len(r) for r in self.db.retrieve_simulations(entry.id, rows)], [1] * 20 + [0] * 2)
+
+    def _drop_parameter_hash(self):
+        with self.db.engine.begin() as conn:
+            conn.exec_driver_sql('DROP INDEX ix_simulations_parameter_hash')
+            conn.exec_driver_sql('ALTER TABLE simulations DROP COLUMN parameter_hash')
+            conn.exec_driver_sql('ALTER TABLE simulations DROP COLUMN derived_from')
+            conn.exec_driver_sql('PRAGMA user_version = 2')
+
+    def test_exact_hash(self):
+        from restage import SimulationEntry
+        from mccode_antlr.common import Expr
+        pars = {'a': Expr.best(1.25), 'b': Expr.best(2), 'c': Expr.best('"c"')}
+        same = {'c': Expr.best('"c"'), 'b': Expr.best(2), 'a': Expr.best(1.25)}
+        self.assertEqual(SimulationEntry(pars).exact_hash(), SimulationEntry(same).exact_hash())
+        self.assertNotEqual(SimulationEntry(pars).exact_hash(), SimulationEntry(pars, seed=1).exact_hash())
+        self.assertNotEqual(SimulationEntry(pars).exact_hash(), SimulationEntry(pars, ncount=10).exact_hash())
+        self.assertNotEqual(SimulationEntry(pars).exact_hash(),
+                            SimulationEntry({**pars, 'a': Expr.best(1.2500001)}).exact_hash())
+
+    def test_exact_simulations(self):
+        from restage import SimulationEntry
+        from mccode_antlr.common import Expr
+        entry, rows = self._value_index_entries()
+        stored = [SimulationEntry({'par1': Expr.best(0.1 * index + 0.01), 'par2': Expr.best(index % 3),
+                                   'par3': Expr.best('"three"')}, seed=index % 2) for index in range(20)]
+        exact = self.db.retrieve_simulations(entry.id, stored, exact=True)
+        self.assertEqual([len(r) for r in exact], [1] * 20)
+        self.assertEqual([r[0].seed for r in exact], [index % 2 for index in range(20)])
+        # rows without an identical stored simulation still match within tolerance
+        self.assertEqual([len(r) for r in self.db.retrieve_simulations(entry.id, rows, exact=True)],
+                         [1] * 20 + [0] * 2)
+
+    def test_parameter_hash_migration(self):
+        entry, rows = self._value_index_entries()
+        self._drop_parameter_hash()
+        del self.db
+        self.db = Database(self.db_file)
+        self.assertTrue(self.db.exact_index)
+        self.assertEqual(self.db.retrieve_column_names('simulations')[-2:], ['parameter_hash', 'derived_from'])
+        self.assertEqual(len(self.db.retrieve_all_simulations(entry.id)), 20)
+        with self.db.engine.begin() as conn:
+            nulls = conn.exec_driver_sql('SELECT COUNT(*) FROM simulations WHERE parameter_hash IS NULL').scalar()
+        self.assertEqual(nulls, 0)
+
+    def test_unversioned_migration(self):
+        from restage.database import SCHEMA_VERSION
+        entry, rows = self._value_index_entries()
+        self._drop_parameter_hash()
+        with self.db.engine.begin() as conn:
+            conn.exec_driver_sql('PRAGMA user_version = 0')
+        del self.db
+        self.db = Database(self.db_file)
+        with self.db.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql('PRAGMA user_version').scalar(), SCHEMA_VERSION)
+        self.assertEqual(len(self.db.retrieve_all_simulations(entry.id)), 20)
+        self.assertEqual([len(r) for r in self.db.retrieve_simulations(entry.id, rows, exact=True)],
+                         [1] * 20 + [0] * 2)
+
+    def test_unknown_schema(self):
+        entry, rows = self._value_index_entries()
+        with self.db.engine.begin() as conn:
+            conn.exec_driver_sql('ALTER TABLE simulation_tables ADD COLUMN unknown INTEGER')
+            conn.exec_driver_sql('PRAGMA user_version = 0')
+        del self.db
+        self.db = None
+        with self.assertRaises(ValueError):
+            Database(self.db_file)
+        # the cached simulations are kept, rather than dropped with their table
+        from sqlite3 import connect
+        with connect(self.db_file) as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM simulations').fetchone()[0], 20)
+        conn.close()
+
+    def test_readonly_without_parameter_hash(self):
+        entry, rows = self._value_index_entries()
+        self._drop_parameter_hash()
+        del self.db
+        self.db = Database(self.db_file, readonly=True)
+        self.assertFalse(self.db.exact_index)
+        self.assertEqual(len(self.db.retrieve_all_simulations(entry.id)), 20)
+        self.assertEqual([len(r) for r in self.db.retrieve_simulations(entry.id, rows, exact=True)],
+                         [1] * 20 + [0] * 2)
+
+    def test_insert_simulations(self):
+        from restage import SimulationTableEntry, SimulationEntry
+        from mccode_antlr.common import Expr
+        entry = SimulationTableEntry(parameters=['x', 'y'], name='bulk_instr')
+        simulations = [SimulationEntry({'x': Expr.best(index + 0.5), 'y': Expr.best('"y"')}) for index in range(50)]
+        self.db.insert_simulations(entry, simulations[:1])
+        self.assertEqual(len(self.db.retrieve_simulation_table(entry.id)), 1)
+        changes = self.db.changes
+        self.db.insert_simulations(entry, simulations[1:])
+        self.assertEqual(self.db.changes, changes + 1)
+        self.assertEqual(self.db.count_simulations(entry.id), 50)
+        found = self.db.retrieve_simulations(entry.id, simulations)
+        self.assertEqual([[s.id for s in r] for r in found], [[s.id] for s in simulations])
+
+    def test_derived_from(self):
+        from restage import SimulationTableEntry, SimulationEntry
+        from mccode_antlr.common import Expr
+        entry = SimulationTableEntry(parameters=['x'], name='derived_instr')
+        source = SimulationEntry({'x': Expr.best(1.5)}, ncount=1000)
+        derived = source.replace(ncount=10, id=None, derived_from=source.id)
+        self.db.insert_simulations(entry, [source, derived])
+        found = self.db.retrieve_simulation(entry.id, source.replace(ncount=None))
+        self.assertEqual({s.id: s.derived_from for s in found}, {source.id: None, derived.id: source.id})
+        found = self.db.retrieve_simulations(entry.id, [derived], exact=True)
+        self.assertEqual(found, [[derived]])
+
+    def _stored_access_times(self):
+        with self.db.engine.connect() as conn:
+            return dict(conn.exec_driver_sql('SELECT id, last_access FROM simulations').all())
+
+    def test_buffered_access_times(self):
+        entry, rows = self._value_index_entries()
+        stored = self._stored_access_times()
+        found = self.db.retrieve_simulations(entry.id, rows)
+        self.assertEqual(self._stored_access_times(), stored)
+        self.db.flush_access_times()
+        updated = self._stored_access_times()
+        for matches in found:
+            for match in matches:
+                self.assertGreater(updated[match.id], stored[match.id])
+        self.assertEqual(len(self.db._accessed_simulations), 0)
+        # a zero interval writes the access times immediately
+        self.db.flush_interval = 0
+        self.db.retrieve_simulations(entry.id, rows[:1])
+        self.assertGreater(self._stored_access_times()[found[0][0].id], updated[found[0][0].id])
+
+    def test_journal_mode(self):
+        with self.db.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql('PRAGMA journal_mode').scalar(), 'wal')
+
+    def test_retry_once(self):
+        import sqlite3
+        from unittest.mock import patch
+        from restage import SimulationTableEntry, SimulationEntry
+        from mccode_antlr.common import Expr
+        entry = SimulationTableEntry(parameters=['x'], name='locked_instr')
+        self.db.lock_retries = 2
+        locked = sqlite3.OperationalError('database is locked')
+        with patch.object(self.db, '_session', side_effect=locked) as session, patch('time.sleep') as sleep:
+            with self.assertRaises(sqlite3.OperationalError):
+                self.db.insert_simulation(entry, SimulationEntry({'x': Expr.best(0.5)}))
+        # the nested table lookup and insert are not retried on their own
+        self.assertEqual(session.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_concurrent_processes(self):
+        from concurrent.futures import ProcessPoolExecutor
+        from restage import SimulationTableEntry
+        entry = SimulationTableEntry(parameters=['x'], name='shared_instr')
+        self.db.insert_simulation_table(entry)
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            counts = list(executor.map(_insert_from_process, [self.db_file] * 4, [entry.id] * 4,
+                                       range(0, 80, 20), [20] * 4))
+        self.assertEqual(sum(counts), 80)
+        self.assertEqual(self.db.count_simulations(entry.id), 80)
+        self.assertEqual(len(self.db.retrieve_all_simulations(entry.id)), 80)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,254 @@
+import unittest
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        from pathlib import Path
+        from tempfile import mkdtemp
+        from restage.cache import FileSystem
+        from restage.database import Database
+        self.root = Path(mkdtemp())
+        self.db = Database(self.root / 'database.db')
+        self.fs = FileSystem(self.root, (), self.db)
+        self.now = 1_000_000_000.0
+        # two instruments, each with a table of simulations of 1000 bytes, one used long ago
+        self.old = self._instrument('old', self.now - 100 * 86400, [self.now - 100 * 86400] * 2)
+        self.new = self._instrument('new', self.now - 86400, [self.now - 3 * 86400, self.now - 2 * 86400,
+                                                               self.now - 1 * 86400])
+
+    def tearDown(self):
+        from shutil import rmtree
+        self.db.close()
+        rmtree(self.root)
+
+    def _directory(self, sub: str, size: int):
+        from tempfile import mkdtemp
+        from pathlib import Path
+        self.root.joinpath(sub).mkdir(exist_ok=True)
+        path = Path(mkdtemp(dir=self.root / sub))
+        path.joinpath('data').write_bytes(b'x' * size)
+        return path
+
+    def _instrument(self, name: str, last_access: float, simulations: list[float]):
+        from mccode_antlr.common import Expr
+        from restage import InstrEntry, SimulationTableEntry, SimulationEntry
+        binary = self._directory('bin', 100)
+        binary.joinpath(name).touch()
+        instr = InstrEntry(instr_hash=name, json_path=str(binary / f'{name}.json'), mpi=False, acc=False,
+                           binary_path=str(binary / name), creation=last_access, last_access=last_access)
+        table = SimulationTableEntry(id=instr.id, parameters=['a'], name=f'pst_{instr.id}', creation=last_access,
+                                     last_access=last_access)
+        self.db.insert_instr_file(instr)
+        self.db.insert_simulation_table(table)
+        entries = [SimulationEntry({'a': Expr.best(i + 0.5)}, output_path=str(self._directory('sim', 1000)),
+                                   creation=time, last_access=time) for i, time in enumerate(simulations)]
+        self.db.insert_simulations(table, entries)
+        return instr, entries
+
+    def _outside_entry(self, path):
+        from mccode_antlr.common import Expr
+        from restage import SimulationEntry
+        return SimulationEntry({'a': Expr.best(9.5)}, output_path=str(path), creation=0.0, last_access=0.0)
+
+
+
+class EvictionTestCase(CacheTestCase):
+    def _plan(self, **kwargs):
+        from restage.maintenance import plan_eviction
+        return plan_eviction(self.fs, now=self.now, **kwargs)
+
+    def test_nothing(self):
+        plan = self._plan()
+        self.assertEqual(len(plan), 0)
+        self.assertEqual(plan.remaining, 2 * 100 + 5 * 1000)
+
+    def test_max_age(self):
+        plan = self._plan(max_age=10)
+        self.assertEqual(plan.instruments, [self.old[0].id])
+        self.assertEqual(sorted(plan.simulations), sorted(s.id for s in self.old[1]))
+        self.assertEqual(plan.freed, 100 + 2 * 1000)
+        self.assertEqual(self._plan(max_age=2.5).simulations, [s.id for s in self.old[1]] + [self.new[1][0].id])
+
+    def test_used_instrument(self):
+        self.db.touch_instr_file(self.old[0].id)
+        self.db.flush_access_times()
+        plan = self._plan(max_age=10)
+        self.assertEqual(plan.instruments, [])
+        self.assertEqual(sorted(plan.simulations), sorted(s.id for s in self.old[1]))
+
+    def test_quota(self):
+        plan = self._plan(quota=1500)
+        # the old instrument and its simulations go first, then the least recently used new simulations
+        self.assertEqual(plan.instruments, [self.old[0].id])
+        self.assertEqual(plan.simulations[2:], [s.id for s in self.new[1][:2]])
+        self.assertEqual(plan.remaining, 1100)
+
+    def test_grace(self):
+        from mccode_antlr.common import Expr
+        from restage import SimulationEntry
+        # created recently, but its buffered access time may not have been written by the process using it
+        table = self.db.retrieve_simulation_table(self.old[0].id)[0]
+        recent = SimulationEntry({'a': Expr.best(7.5)}, output_path=str(self._directory('sim', 1000)),
+                                 creation=self.now - 600, last_access=self.now - 100 * 86400)
+        self.db.insert_simulation(table, recent)
+        plan = self._plan(quota=0)
+        self.assertEqual(sorted(plan.simulations), sorted(s.id for s in self.old[1] + self.new[1]))
+        # nor is the instrument of the recent simulation
+        self.assertEqual(plan.instruments, [self.new[0].id])
+        self.assertEqual(self._plan(quota=0, grace=1 / 24).simulations, plan.simulations)
+        plan = self._plan(quota=0, grace=0.005)
+        self.assertIn(recent.id, plan.simulations)
+        self.assertEqual(plan.instruments, [self.old[0].id, self.new[0].id])
+
+    def test_kept_in_use(self):
+        from time import sleep
+        from unittest.mock import patch
+        from restage.cache import cache_keep_in_use
+        from restage.maintenance import plan_eviction
+
+        def stored():
+            instr = self.db.retrieve_instr_file(self.old[0].id)[0]
+            return instr.last_access, {s.id: s.last_access for s in self.db.simulation_usage()}
+
+        # a scan which runs for longer than the grace period keeps what it uses recent
+        with patch('restage.cache.FILESYSTEM', self.fs), \
+                patch('restage.maintenance.eviction_grace', return_value=0.1 / 86400):
+            with cache_keep_in_use([self.old[0]], lambda: self.old[1][:1] + [None]):
+                first = stored()
+                self.assertGreater(first[0], self.now)
+                sleep(0.3)
+                later = stored()
+        self.assertGreater(later[0], first[0])
+        self.assertGreater(later[1][self.old[1][0].id], first[1][self.old[1][0].id])
+        self.assertEqual(later[1][self.old[1][1].id], first[1][self.old[1][1].id])
+        plan = plan_eviction(self.fs, quota=0, grace=1 / 24)
+        self.assertNotIn(self.old[0].id, plan.instruments)
+        self.assertNotIn(self.old[1][0].id, plan.simulations)
+        self.assertIn(self.old[1][1].id, plan.simulations)
+
+    def test_evict(self):
+        from pathlib import Path
+        from restage.maintenance import evict
+        paths = [Path(s.output_path) for s in self.old[1] + self.new[1]]
+        plan = evict(self.fs, max_age=2.5, dry_run=True, now=self.now)
+        self.assertEqual(len(plan), 4)
+        self.assertTrue(all(path.exists() for path in paths))
+
+        outside = self._directory('elsewhere', 10)
+        self.db.insert_simulation(self.db.retrieve_simulation_table(self.new[0].id)[0],
+                                  self._outside_entry(outside))
+        plan = evict(self.fs, max_age=2.5, now=self.now)
+        self.assertEqual(len(plan), 4)
+        self.assertEqual([path.exists() for path in paths], [False] * 3 + [True] * 2)
+        self.assertFalse(Path(self.old[0].binary_path).parent.exists())
+        self.assertTrue(outside.exists())
+        self.assertEqual(self.db.retrieve_instr_file(self.old[0].id), [])
+        self.assertEqual(self.db.retrieve_simulation_table(self.old[0].id), [])
+        self.assertEqual(self.db.count_simulations(self.old[0].id), 0)
+        self.assertEqual(self.db.count_simulations(self.new[0].id), 3)
+        self.assertEqual(list(self.root.glob('.evicting-*')), [])
+
+    def test_failed_evict(self):
+        from pathlib import Path
+        from unittest.mock import patch
+        from restage.maintenance import evict
+        paths = [Path(s.output_path) for s in self.old[1]]
+        with patch.object(self.db, 'evict', side_effect=RuntimeError('locked')):
+            with self.assertRaises(RuntimeError):
+                evict(self.fs, max_age=10, now=self.now)
+        self.assertTrue(all(path.exists() for path in paths))
+        self.assertEqual(self.db.count_simulations(self.old[0].id), 2)
+        self.assertEqual(list(self.root.glob('.evicting-*')), [])
+
+    def test_parse_quota(self):
+        from restage.maintenance import parse_quota
+        self.assertIsNone(parse_quota(None))
+        self.assertEqual(parse_quota(1000), 1000)
+        self.assertEqual(parse_quota('500G'), 500 * 10 ** 9)
+        self.assertEqual(parse_quota('1.5 GiB'), 3 * 2 ** 29)
+
+
+
+class GarbageCollectionTestCase(CacheTestCase):
+    def _age(self, path, days: float):
+        from os import utime
+        for inner in sorted(path.rglob('*'), reverse=True):
+            utime(inner, (self.now - days * 86400, self.now - days * 86400))
+        utime(path, (self.now - days * 86400, self.now - days * 86400))
+        return path
+
+    def test_collect(self):
+        from pathlib import Path
+        from shutil import rmtree
+        from restage.maintenance import collect_garbage
+        orphans = [self._age(self._directory(sub, 10), 2) for sub in ('sim', 'bin')]
+        recent = self._age(self._directory('sim', 10), 0.5)
+        interrupted = self.root.joinpath('.evicting-0123')
+        interrupted.mkdir()
+        self._age(interrupted, 2)
+        # a simulation and an instrument whose files have been removed by someone else
+        rmtree(self.new[1][0].output_path)
+        rmtree(Path(self.old[0].binary_path).parent)
+        for path in [Path(s.output_path) for s in self.old[1]]:
+            self._age(path, 2)
+        # directories are only known to be used once their simulations are in the database
+        outside = self._directory('elsewhere', 10)
+        self.db.insert_simulation(self.db.retrieve_simulation_table(self.new[0].id)[0], self._outside_entry(outside))
+
+        plan = collect_garbage(self.fs, dry_run=True, now=self.now)
+        expected = orphans + [interrupted] + [Path(s.output_path) for s in self.old[1]]
+        self.assertEqual(sorted(plan.paths), sorted(path.resolve() for path in expected))
+        self.assertEqual(plan.instruments, [self.old[0].id])
+        self.assertEqual(plan.simulations, [self.new[1][0].id])
+        self.assertEqual(plan.freed, 2 * 10 + 2 * 1000)
+
+        collect_garbage(self.fs, now=self.now)
+        self.assertFalse(any(path.exists() for path in plan.paths))
+        self.assertTrue(recent.exists())
+        self.assertTrue(outside.exists())
+        self.assertTrue(all(Path(s.output_path).exists() for s in self.new[1][1:]))
+        self.assertEqual(self.db.retrieve_instr_file(self.old[0].id), [])
+        self.assertEqual(self.db.count_simulations(self.old[0].id), 0)
+        self.assertEqual(self.db.count_simulations(self.new[0].id), 3)
+        self.assertEqual(list(self.root.glob('.evicting-*')), [])
+        self.assertEqual(len(collect_garbage(self.fs, now=self.now).paths), 0)
+
+    def test_running_simulation(self):
+        from os import utime
+        from restage.maintenance import plan_collection
+        # a primary simulation which started days ago, and still writes into a file in a subdirectory
+        running = self._age(self._directory('sim', 10), 2)
+        running.joinpath('repeat').mkdir()
+        running.joinpath('repeat', 'primary.mcpl').write_bytes(b'x')
+        utime(running.joinpath('repeat', 'primary.mcpl'), (self.now - 600, self.now - 600))
+        utime(running.joinpath('repeat'), (self.now - 2 * 86400, self.now - 2 * 86400))
+        utime(running, (self.now - 2 * 86400, self.now - 2 * 86400))
+        self.assertNotIn(running.resolve(), plan_collection(self.fs, now=self.now).paths)
+        self._age(running, 2)
+        self.assertIn(running.resolve(), plan_collection(self.fs, now=self.now).paths)
+
+
+class RecompressionTestCase(CacheTestCase):
+    def test_recompress(self):
+        import gzip
+        from pathlib import Path
+        from unittest.mock import patch
+        from restage.maintenance import recompress
+        for _, entries in (self.old, self.new):
+            for s in entries:
+                with gzip.open(Path(s.output_path) / 'primary.mcpl.gz', 'wb') as file:
+                    file.write(b'MCPL')
+        policy = {'old': 'none', 'new': None}
+        with patch('restage.maintenance.configured_compression', lambda name, cold: policy[name]):
+            plan = recompress(self.fs, max_age=10, dry_run=True, now=self.now)
+            self.assertEqual(sorted(plan), sorted((Path(s.output_path).resolve() / 'primary.mcpl.gz', 'none')
+                                                  for s in self.old[1]))
+            recompress(self.fs, max_age=2.5, now=self.now)
+            self.assertEqual(len(recompress(self.fs, max_age=2.5, dry_run=True, now=self.now)), 0)
+        for s in self.old[1]:
+            self.assertEqual(Path(s.output_path).joinpath('primary.mcpl').read_bytes(), b'MCPL')
+        self.assertTrue(all(Path(s.output_path).joinpath('primary.mcpl.gz').exists() for s in self.new[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+import unittest
+from importlib.util import find_spec
+
+
+def mcpl_bytes(particles: int, particle_size: int = 16, comments=('one', 'two'), blobs=None, weight=None,
+               order='<', count=None, fill: bytes = b'\x00') -> bytes:
+    """A minimal MCPL file, with *particles* particles of *particle_size* *fill* bytes each"""
+    from struct import pack
+
+    def buffer(data):
+        data = data.encode() if isinstance(data, str) else data
+        return pack(f'{order}I', len(data)) + data
+
+    blobs = blobs or {}
+    header = b'MCPL003' + (b'L' if order == '<' else b'B')
+    header += pack(f'{order}Q', particles if count is None else count)
+    header += pack(f'{order}8I', len(comments), len(blobs), 0, 1, 1, 2112, particle_size, weight is not None)
+    if weight is not None:
+        header += pack(f'{order}d', weight)
+    header += buffer('restage test')
+    header += b''.join(buffer(c) for c in comments)
+    header += b''.join(buffer(k) for k in blobs) + b''.join(buffer(v) for v in blobs.values())
+    return header + fill * (particles * particle_size)
+
+
+class MCPLTestCase(unittest.TestCase):
+    def setUp(self):
+        from pathlib import Path
+        from tempfile import mkdtemp
+        self.dir = Path(mkdtemp())
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.dir)
+
+    def _write(self, name, data: bytes):
+        import gzip
+        path = self.dir / name
+        if name.endswith('.gz'):
+            with gzip.open(path, 'wb') as file:
+                file.write(data)
+        else:
+            path.write_bytes(data)
+        return path
+
+    def _particles(self, path):
+        import gzip
+        from restage.mcpl import mcpl_read_header
+        header = mcpl_read_header(path)
+        data = (gzip.open if header.compressed else open)(path, 'rb').read()
+        return header, data[header.length:]
+
+
+class MCPLHeaderTestCase(MCPLTestCase):
+    def test_header(self):
+        from restage.mcpl import mcpl_read_header, mcpl_particle_count
+        for order in '<>':
+            data = mcpl_bytes(5, comments=('c',), blobs={'key': b'value'}, weight=0.5, order=order)
+            for name in ('plain.mcpl', 'compressed.mcpl.gz'):
+                path = self._write(name, data)
+                header = mcpl_read_header(path)
+                self.assertEqual(header.version, 3)
+                self.assertEqual(header.little_endian, order == '<')
+                self.assertEqual(header.particles, 5)
+                self.assertEqual(header.particle_size, 16)
+                self.assertEqual(header.source, 'restage test')
+                self.assertEqual(header.comments, ['c'])
+                self.assertEqual(header.blobs, {'key': b'value'})
+                self.assertEqual(header.universal_weight, 0.5)
+                self.assertEqual(header.universal_pdg_code, 2112)
+                self.assertTrue(header.polarisation)
+                self.assertEqual(header.length, len(data) - 5 * 16)
+                self.assertEqual(header.compressed, name.endswith('.gz'))
+                self.assertEqual(mcpl_particle_count(path), 5)
+
+    def test_real_filename(self):
+        from restage.mcpl import mcpl_particle_count
+        self._write('named.mcpl.gz', mcpl_bytes(3))
+        self.assertEqual(mcpl_particle_count(self.dir / 'named'), 3)
+
+    def test_not_closed(self):
+        from restage.mcpl import mcpl_particle_count
+        self.assertEqual(mcpl_particle_count(self._write('open.mcpl', mcpl_bytes(7, count=0))), 7)
+        with self.assertRaises(RuntimeError):
+            mcpl_particle_count(self._write('short.mcpl', mcpl_bytes(7, count=9)))
+
+    def test_not_mcpl(self):
+        from restage.mcpl import mcpl_particle_count
+        with self.assertRaises(RuntimeError):
+            mcpl_particle_count(self._write('other.mcpl', b'NOT MCPL AT ALL' * 10))
+
+
+class MCPLMergeTestCase(MCPLTestCase):
+    def _merge(self, names, counts, **kwargs):
+        from restage.mcpl import mcpl_merge_files
+        files = [self._write(name, mcpl_bytes(count, fill=bytes([index + 1])))
+                 for index, (name, count) in enumerate(zip(names, counts))]
+        mcpl_merge_files([f.parent / f.name.split('.')[0] for f in files], self.dir / 'merged', **kwargs)
+        return files
+
+    def test_merge(self):
+        for names in (('a.mcpl', 'b.mcpl', 'c.mcpl'), ('a.mcpl.gz', 'b.mcpl.gz', 'c.mcpl'), ('a.mcpl', 'b.mcpl.gz')):
+            files = self._merge(names, [3, 0, 2][:len(names)])
+            merged = self.dir / ('merged.mcpl.gz' if names[0].endswith('.gz') else 'merged.mcpl')
+            header, particles = self._particles(merged)
+            self.assertEqual(header.particles, 5 if len(names) == 3 else 3)
+            self.assertEqual(header.comments, ['one', 'two'])
+            expected = b'\x01' * 48 + (b'\x03' * 32 if len(names) == 3 else b'')
+            self.assertEqual(particles, expected)
+            self.assertFalse(any(f.exists() for f in files))
+            merged.unlink()
+
+    def test_keep_originals(self):
+        files = self._merge(('a.mcpl', 'b.mcpl'), [1, 2], keep_originals=True)
+        self.assertTrue(all(f.exists() for f in files))
+        self.assertEqual(self._particles(self.dir / 'merged.mcpl')[0].particles, 3)
+
+    def test_incompatible(self):
+        from restage.mcpl import mcpl_merge_files
+        files = [self._write('a.mcpl', mcpl_bytes(1)), self._write('b.mcpl', mcpl_bytes(1, particle_size=20))]
+        with self.assertRaises(RuntimeError):
+            mcpl_merge_files(files, self.dir / 'merged')
+        self.assertTrue(all(f.exists() for f in files))
+        self.assertEqual(list(self.dir.glob('*merged*')), [])
+
+
+class MCPLTruncateTestCase(MCPLTestCase):
+    def _weighted(self, name, particles: int):
+        import numpy as np
+        # single-precision polarised particles with their own weight, the last of their 11 values
+        values = np.arange(particles * 11, dtype='<f4').reshape(particles, 11)
+        return self._write(name, mcpl_bytes(0, particle_size=44, count=particles) + values.tobytes()), values
+
+    def test_truncate(self):
+        import numpy as np
+        from restage.mcpl import mcpl_truncate
+        for name in ('full.mcpl', 'full.mcpl.gz'):
+            path, values = self._weighted(name, 10)
+            truncated = mcpl_truncate(path, self.dir / 'part', 6, scale=10 / 6)
+            self.assertEqual(truncated.name, name.replace('full', 'part'))
+            header, particles = self._particles(truncated)
+            self.assertEqual(header.particles, 6)
+            self.assertEqual(header.comments, ['one', 'two'])
+            kept = np.frombuffer(particles, dtype='<f4').reshape(6, 11)
+            self.assertTrue(np.array_equal(kept[:, :10], values[:6, :10]))
+            self.assertTrue(np.allclose(kept[:, 10], values[:6, 10] * 10 / 6))
+            self.assertEqual(self._particles(path)[0].particles, 10)
+            truncated.unlink()
+            path.unlink()
+
+    def test_universal_weight(self):
+        from restage.mcpl import mcpl_truncate
+        path = self._write('full.mcpl', mcpl_bytes(4, particle_size=40, weight=0.5, fill=b'\x07'))
+        header, particles = self._particles(mcpl_truncate(path, self.dir / 'part', 2, scale=2.0))
+        self.assertEqual(header.particles, 2)
+        self.assertEqual(header.universal_weight, 1.0)
+        self.assertEqual(particles, b'\x07' * 80)
+
+    def test_too_many(self):
+        from restage.mcpl import mcpl_truncate
+        path, _ = self._weighted('full.mcpl', 3)
+        with self.assertRaises(ValueError):
+            mcpl_truncate(path, self.dir / 'part', 4)
+        with self.assertRaises(RuntimeError):
+            mcpl_truncate(self._write('odd.mcpl', mcpl_bytes(3, particle_size=40)), self.dir / 'part', 2, scale=2.0)
+        self.assertEqual(list(self.dir.glob('*part*')), [])
+
+
+@unittest.skipIf(find_spec('zstandard') is None, 'zstd compression requires the zstandard package')
+class MCPLCompressionTestCase(MCPLTestCase):
+    def test_compress(self):
+        from restage.mcpl import mcpl_compress, mcpl_read_header, mcpl_real_filename
+        data = mcpl_bytes(4, fill=b'\x07')
+        path = self._write('primary.mcpl.gz', data)
+        for compression, name in (('zstd', 'primary.mcpl.zst'), ('none', 'primary.mcpl'), ('gzip', 'primary.mcpl.gz')):
+            path = mcpl_compress(path, compression)
+            self.assertEqual(path, self.dir / name)
+            self.assertEqual([f.name for f in self.dir.iterdir()], [name])
+            self.assertEqual(mcpl_real_filename(self.dir / 'primary'), path)
+            self.assertEqual(mcpl_read_header(path).particles, 4)
+        self.assertEqual(mcpl_compress(path, 'gzip'), path)
+        with self.assertRaises(ValueError):
+            mcpl_compress(path, 'bzip2')
+
+    def test_readable(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest.mock import patch
+        from restage import mcpl
+        from restage.mcpl import MCPLReadable, mcpl_compress, mcpl_real_filename
+        data = [mcpl_bytes(n, fill=b'\x07') for n in (4, 5)]
+        compressed = []
+        for index, d in enumerate(data):
+            (self.dir / f'sim{index}').mkdir()
+            compressed.append(mcpl_compress(self._write(f'sim{index}/primary.mcpl', d), 'zstd'))
+        with patch.object(mcpl, '_open_mcpl', wraps=mcpl._open_mcpl) as opened:
+            with MCPLReadable(self.dir / 'readable') as readable:
+                with ThreadPoolExecutor(max_workers=4) as pool:
+                    paths = list(pool.map(readable, compressed * 4))
+                # each file is decompressed once, and shared by all of its users
+                self.assertEqual(opened.call_count, 2)
+                self.assertEqual(paths, paths[:2] * 4)
+                self.assertEqual([p.name for p in paths[:2]], ['primary.mcpl'] * 2)
+                self.assertEqual([p.read_bytes() for p in paths[:2]], data)
+                self.assertTrue(all(readable.directory in p.parents for p in paths))
+                # the uncompressed copy is not stored next to the compressed file
+                self.assertEqual(mcpl_real_filename(self.dir / 'sim0' / 'primary.mcpl'), compressed[0])
+                gzipped = mcpl_compress(compressed[1], 'gzip')
+                self.assertEqual(readable(gzipped), gzipped)
+        self.assertFalse(paths[0].exists())
+        self.assertEqual(list((self.dir / 'readable').iterdir()), [])
+
+    def test_merge(self):
+        from restage.mcpl import mcpl_compress, mcpl_merge_files, mcpl_read_header
+        files = [mcpl_compress(self._write(f'{n}.mcpl', mcpl_bytes(n)), 'zstd') for n in (1, 2)]
+        mcpl_merge_files(files, self.dir / 'merged')
+        self.assertEqual(mcpl_read_header(self.dir / 'merged.mcpl.zst').particles, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
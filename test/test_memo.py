@@ -0,0 +1,269 @@
+import unittest
+
+
+class SimulationMemoTestCase(unittest.TestCase):
+    def setUp(self):
+        from pathlib import Path
+        from tempfile import mkdtemp
+        from restage import SimulationTableEntry
+        from restage.cache import FileSystem
+        from restage.database import Database
+        self.db_dir = Path(mkdtemp())
+        self.db_file = self.db_dir.joinpath('test_database.db')
+        self.db = Database(self.db_file)
+        self.fs = FileSystem(self.db_dir, (), self.db)
+        self.table = SimulationTableEntry(parameters=['a', 'b'], name='memo_instr')
+        self.fs.insert_simulation_table(self.table)
+        for index in range(10):
+            self.fs.insert_simulation(self.table, self._entry(index))
+
+    def tearDown(self) -> None:
+        self.db.close()
+        del self.fs
+        del self.db
+        if self.db_file.exists():
+            self.db_file.unlink()
+        if self.db_dir.exists():
+            self.db_dir.rmdir()
+
+    @staticmethod
+    def _entry(index, precision=None):
+        from mccode_antlr.common import Expr
+        from restage import SimulationEntry
+        return SimulationEntry({'a': Expr.best(0.25 * index + 0.01), 'b': Expr.best('"b"')},
+                               precision=dict(precision or {}))
+
+    def _count(self, rows):
+        return [len(r) for r in self.fs.retrieve_simulations(self.table.id, rows)]
+
+    def test_memoized(self):
+        rows = [self._entry(index, {'a': 0.1}) for index in range(12)]
+        self.assertEqual(self._count(rows), [1] * 10 + [0] * 2)
+        self.assertEqual(len(self.fs.memo), 10)
+        memoized = self.fs.memo.simulations(self.db, self.table.id)
+        self.assertEqual(self._count(rows), [1] * 10 + [0] * 2)
+        self.assertIs(self.fs.memo.simulations(self.db, self.table.id), memoized)
+
+    def test_local_insert(self):
+        rows = [self._entry(index, {'a': 0.1}) for index in range(12)]
+        self.assertEqual(self._count(rows), [1] * 10 + [0] * 2)
+        memoized = self.fs.memo.simulations(self.db, self.table.id)
+        self.fs.insert_simulation(self.table, self._entry(10))
+        self.assertIs(self.fs.memo.simulations(self.db, self.table.id), memoized)
+        self.assertEqual(self._count(rows), [1] * 11 + [0])
+        # changes made directly to the database, bypassing the file system, are also noticed
+        self.db.insert_simulation(self.table, self._entry(11))
+        self.assertEqual(self._count(rows), [1] * 12)
+
+    def test_bulk_insert(self):
+        rows = [self._entry(index, {'a': 0.1}) for index in range(15)]
+        self.assertEqual(self._count(rows), [1] * 10 + [0] * 5)
+        memoized = self.fs.memo.simulations(self.db, self.table.id)
+        self.fs.insert_simulations(self.table, [self._entry(index) for index in range(10, 14)])
+        self.assertIs(self.fs.memo.simulations(self.db, self.table.id), memoized)
+        self.assertEqual(self._count(rows), [1] * 14 + [0])
+
+    def test_neighbours(self):
+        precision = {'a': 0.1}
+        self.assertEqual(self._count([self._entry(0, precision)]), [1])
+        neighbours = self.fs.simulation_neighbours(self.table.id, precision)
+        self.assertEqual(len(neighbours), 1)
+        self.assertIs(self.fs.simulation_neighbours(self.table.id, precision)[0], neighbours[0])
+        self.fs.insert_simulation(self.table, self._entry(10))
+        rebuilt = self.fs.simulation_neighbours(self.table.id, precision)
+        self.assertIsNot(rebuilt[0], neighbours[0])
+        self.assertEqual(len(rebuilt[0].entries), 11)
+
+    def test_get_simulations(self):
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from restage.cache import cache_get_simulation, cache_get_simulations
+        entry = SimpleNamespace(id=self.table.id)
+        larger = self._entry(3).replace(ncount=1000, id=None)
+        self.fs.insert_simulation(self.table, larger)
+        rows = [self._entry(3, {'a': 0.1}), self._entry(3, {'a': 0.1}).replace(ncount=1000)]
+        with patch('restage.cache.FILESYSTEM', self.fs):
+            single = [cache_get_simulation(entry, row) for row in rows]
+            batch = cache_get_simulations(entry, rows)
+        # the identical simulation is preferred by the batch lookup only
+        self.assertEqual(len(single[0]), 2)
+        self.assertEqual([len(found) for found in batch], [1, 1])
+        self.assertIsNone(batch[0][0].ncount)
+        self.assertEqual([s.id for s in single[1]], [s.id for s in batch[1]])
+
+    def test_instr_files(self):
+        from unittest.mock import patch
+        from restage import InstrEntry
+        from restage.cache import cache_instr_files
+        entries = [InstrEntry(instr_hash=f'hash{index}', json_path=f'{index}.json', binary_path=f'{index}',
+                              mpi=False, acc=False) for index in range(3)]
+        changes = self.db.changes
+        with patch('restage.cache.FILESYSTEM', self.fs):
+            cache_instr_files([])
+            cache_instr_files(entries)
+        self.assertEqual(self.db.changes, changes + 1)
+        self.assertEqual(sorted(e.id for e in self.fs.query_instr_file({'mpi': False})), sorted(e.id for e in entries))
+
+    def test_other_connection(self):
+        from restage.database import Database
+        rows = [self._entry(index, {'a': 0.1}) for index in range(12)]
+        self.assertEqual(self._count(rows), [1] * 10 + [0] * 2)
+        with Database(self.db_file) as other:
+            other.insert_simulation(self.table, self._entry(10))
+        self.assertEqual(self._count(rows), [1] * 11 + [0])
+
+    def test_too_large(self):
+        self.fs.memo.maxsize = 5
+        rows = [self._entry(index, {'a': 0.1}) for index in range(12)]
+        self.assertEqual(self._count(rows), [1] * 10 + [0] * 2)
+        self.assertIsNone(self.fs.memo.simulations(self.db, self.table.id))
+        self.assertEqual(len(self.fs.memo), 0)
+
+
+class FixedDatabaseTestCase(unittest.TestCase):
+    immutable = False
+
+    def setUp(self):
+        from pathlib import Path
+        from tempfile import mkdtemp
+        from restage import SimulationTableEntry
+        from restage.database import Database
+        self.db_dir = Path(mkdtemp())
+        self.table = SimulationTableEntry(parameters=['a'], name='attached_instr')
+        self.files = [self.db_dir.joinpath(f'fixed{index}.db') for index in range(2)]
+        for index, file in enumerate(self.files):
+            with Database(file) as db:
+                db.insert_simulation_table(self.table)
+                for value in range(index + 1):
+                    db.insert_simulation(self.table, self._entry(value))
+        self.fixed = [Database(file, readonly=True, immutable=self.immutable) for file in self.files]
+        self.db = Database(self.db_dir.joinpath('write.db'))
+        self.attached = self.db.attach(self.fixed)
+
+    def tearDown(self) -> None:
+        from shutil import rmtree
+        for db in (*self.fixed, self.db):
+            db.close()
+        rmtree(self.db_dir)
+
+    @staticmethod
+    def _entry(value):
+        from mccode_antlr.common import Expr
+        from restage import SimulationEntry
+        return SimulationEntry({'a': Expr.best(value + 0.5)})
+
+
+class AttachedDatabaseTestCase(FixedDatabaseTestCase):
+    def test_union(self):
+        from restage import SimulationTableEntry
+        from restage.database import union_query
+        self.assertEqual(self.attached, self.fixed)
+        found = union_query(SimulationTableEntry, [*self.fixed, self.db], {'id': self.table.id})
+        self.assertEqual([len(f) for f in found], [1, 1, 0])
+        self.assertEqual(found[0][0].name, self.table.name)
+
+    def test_filesystem(self):
+        from restage.cache import FileSystem
+        fs = FileSystem(self.db_dir, tuple(self.fixed), self.db)
+        rows = [self._entry(value) for value in range(3)]
+        self.assertEqual([len(r) for r in fs.retrieve_simulations(self.table.id, rows)], [2, 1, 0])
+
+    def test_attach_limit(self):
+        from restage.cache import FileSystem
+        from restage.database import Database
+        files = [self.db_dir.joinpath(f'many{index}.db') for index in range(12)]
+        for index, file in enumerate(files):
+            with Database(file) as db:
+                db.insert_simulation_table(self.table)
+                db.insert_simulation(self.table, self._entry(index))
+        fixed = [Database(file, readonly=True) for file in files]
+        with Database(self.db_dir.joinpath('many.db')) as db:
+            # SQLite's limit of ten attached databases does not count the main database
+            self.assertEqual(db.attach(fixed), fixed[:10])
+            self.assertEqual([f._hub is not None for f in fixed], [True] * 10 + [False] * 2)
+            fs = FileSystem(self.db_dir, tuple(fixed), db)
+            rows = [self._entry(value) for value in range(13)]
+            self.assertEqual([len(r) for r in fs.retrieve_simulations(self.table.id, rows)], [1] * 12 + [0])
+        for f in fixed:
+            f.close()
+
+    def test_other_connection(self):
+        from restage.database import Database
+        version = self.fixed[0].version()
+        self.assertEqual(version, self.fixed[0].version())
+        with Database(self.files[0]) as other:
+            other.insert_simulation(self.table, self._entry(5))
+        self.assertNotEqual(version, self.fixed[0].version())
+
+
+class FixedSnapshotTestCase(FixedDatabaseTestCase):
+    immutable = True
+
+    def setUp(self):
+        super().setUp()
+        self.sidecar = self.db_dir.joinpath('snapshots', 'fixed0')
+
+    def _filesystem(self, sidecar=None):
+        from restage.cache import FileSystem, FixedSnapshot
+        return FileSystem(self.db_dir, tuple(self.fixed), self.db,
+                          snapshots={self.fixed[0].db_file: FixedSnapshot(self.fixed[0], sidecar),
+                                     self.fixed[1].db_file: FixedSnapshot(self.fixed[1])})
+
+    def test_snapshot(self):
+        from unittest.mock import patch
+        fs = self._filesystem()
+        rows = [self._entry(value) for value in range(3)]
+        self.assertEqual([len(r) for r in fs.retrieve_simulations(self.table.id, rows)], [2, 1, 0])
+        # neither the tables nor the simulations of the fixed databases are read again
+        with patch.object(self.fixed[0], 'retrieve_simulation_candidates') as candidates, \
+                patch.object(self.fixed[0], 'retrieve_all_simulation_tables') as tables:
+            self.assertEqual([len(r) for r in fs.retrieve_simulations(self.table.id, rows)], [2, 1, 0])
+            self.assertEqual(fs.retrieve_simulation_table('missing'), [])
+            candidates.assert_not_called()
+            tables.assert_not_called()
+        self.assertEqual(self.fixed[0].version(), self.fixed[0].version())
+
+    def test_sidecar(self):
+        from unittest.mock import patch
+        rows = [self._entry(value) for value in range(3)]
+        self.assertEqual([len(r) for r in self._filesystem(self.sidecar).retrieve_simulations(self.table.id, rows)],
+                         [2, 1, 0])
+        self.assertEqual(sorted(f.name for f in self.sidecar.iterdir()), ['0.npy', 'manifest.json'])
+        with patch.object(self.fixed[0], 'retrieve_stored_simulations') as stored, \
+                patch.object(self.fixed[0], 'retrieve_all_simulation_tables') as tables:
+            found = self._filesystem(self.sidecar).retrieve_simulations(self.table.id, rows)
+            stored.assert_not_called()
+            tables.assert_not_called()
+        self.assertEqual([len(r) for r in found], [2, 1, 0])
+        self.assertEqual(found[0][0].parameter_values, rows[0].parameter_values)
+        self.assertEqual(found, self._filesystem().retrieve_simulations(self.table.id, rows))
+        # the snapshot is not written again while the database is unchanged
+        written = self.sidecar.joinpath('manifest.json').stat().st_mtime_ns
+        self._filesystem(self.sidecar).retrieve_simulations(self.table.id, rows)
+        self.assertEqual(self.sidecar.joinpath('manifest.json').stat().st_mtime_ns, written)
+
+    def test_outdated_sidecar(self):
+        import json
+        rows = [self._entry(value) for value in range(3)]
+        self._filesystem(self.sidecar).retrieve_simulations(self.table.id, rows)
+        manifest = json.loads(self.sidecar.joinpath('manifest.json').read_text())
+        manifest['stamp'][1] += 1
+        self.sidecar.joinpath('manifest.json').write_text(json.dumps(manifest))
+        # a file which could run code if it were unpickled is never loaded
+        self.sidecar.joinpath('0.npy').write_bytes(b'\x80\x04not numpy')
+        found = self._filesystem(self.sidecar).retrieve_simulations(self.table.id, rows)
+        self.assertEqual([len(r) for r in found], [2, 1, 0])
+        manifest = json.loads(self.sidecar.joinpath('manifest.json').read_text())
+        self.assertEqual(manifest['stamp'][1], self.files[0].stat().st_size)
+        self.assertEqual(list(self.sidecar.parent.glob('.fixed0*')), [])
+
+    def test_unreadable_sidecar(self):
+        rows = [self._entry(value) for value in range(3)]
+        self._filesystem(self.sidecar).retrieve_simulations(self.table.id, rows)
+        self.sidecar.joinpath('0.npy').write_bytes(b'\x80\x04not numpy')
+        found = self._filesystem(self.sidecar).retrieve_simulations(self.table.id, rows)
+        self.assertEqual([len(r) for r in found], [2, 1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -35,6 +35,28 @@ class SplitrunProgressFlagTest(unittest.TestCase):
         self.assertFalse(sig.parameters['progress'].default)
 
 
+class SplitrunJobsFlagTest(unittest.TestCase):
+    """The --jobs flag controls the number of concurrent primary simulations."""
+
+    def test_jobs_default(self):
+        from restage.splitrun import make_splitrun_parser
+        args = make_splitrun_parser().parse_args(['dummy.instr'])
+        self.assertEqual(args.jobs, 1)
+
+    def test_jobs_value(self):
+        from restage.splitrun import make_splitrun_parser
+        args = make_splitrun_parser().parse_args(['dummy.instr', '--jobs', '8'])
+        self.assertEqual(args.jobs, 8)
+
+    def test_splitrun_accepts_jobs_kwarg(self):
+        import inspect
+        from restage.splitrun import splitrun, splitrun_pre, splitrun_combined
+        for func in (splitrun, splitrun_pre, splitrun_combined):
+            sig = inspect.signature(func)
+            self.assertIn('jobs', sig.parameters)
+            self.assertEqual(sig.parameters['jobs'].default, 1)
+
+
 class NosplitrunParserTest(unittest.TestCase):
     """nosplitrun parser is derived from splitrun with compatible args."""
 
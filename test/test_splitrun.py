@@ -0,0 +1,175 @@
+import unittest
+from importlib.util import find_spec
+
+
+class RepeatSimulationTestCase(unittest.TestCase):
+    def setUp(self):
+        from pathlib import Path
+        from tempfile import mkdtemp
+        self.dir = Path(mkdtemp())
+        self.ncounts = []
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.dir)
+
+    def _runner(self, cmd: str):
+        """Emulate a primary instrument which writes half of its simulated particles to its MCPL file"""
+        from pathlib import Path
+        from test_mcpl import mcpl_bytes
+        args = dict(arg.lstrip('-').split('=', 1) for arg in cmd.split())
+        self.ncounts.append(int(args['ncount']))
+        Path(args['dir']).mkdir(parents=True)
+        Path(args['mcpl_filename'] + '.mcpl').write_bytes(mcpl_bytes(int(args['ncount']) // 2, fill=b'\x01'))
+
+    def _repeat(self, count, partials=None):
+        from restage.splitrun import repeat_simulation_until
+        work_dir = self.dir / 'work'
+        repeat_simulation_until(count, self._runner, {'ncount': count}, {}, work_dir, work_dir / 'primary',
+                                partials=partials)
+        return work_dir / 'primary.mcpl'
+
+    def test_repeat(self):
+        from restage.mcpl import mcpl_particle_count
+        merged = self._repeat(100)
+        self.assertEqual(self.ncounts, [100, 100])
+        self.assertEqual(mcpl_particle_count(merged), 100)
+        self.assertEqual([f.name for f in merged.parent.glob('*.mcpl')], ['primary.mcpl'])
+
+    def test_partials(self):
+        from test_mcpl import mcpl_bytes
+        from restage.mcpl import mcpl_particle_count
+        partials = []
+        for index, particles in enumerate((20, 10)):
+            (self.dir / f'cached_{index}').mkdir()
+            partials.append(self.dir / f'cached_{index}' / 'primary.mcpl')
+            partials[-1].write_bytes(mcpl_bytes(particles, fill=b'\x02'))
+        merged = self._repeat(100, partials)
+        # only the 70 missing particles are simulated
+        self.assertEqual(self.ncounts, [70, 70])
+        self.assertEqual(mcpl_particle_count(merged), 100)
+        self.assertEqual([mcpl_particle_count(f) for f in partials], [20, 10])
+        self.assertEqual([f.name for f in merged.parent.glob('*.mcpl')], ['primary.mcpl'])
+
+    def test_enough_partials(self):
+        from test_mcpl import mcpl_bytes
+        from restage.mcpl import mcpl_particle_count
+        (self.dir / 'cached').mkdir()
+        partial = self.dir / 'cached' / 'primary.mcpl'
+        partial.write_bytes(mcpl_bytes(120))
+        self.assertEqual(mcpl_particle_count(self._repeat(100, [partial])), 120)
+        self.assertEqual(self.ncounts, [])
+
+
+class DerivePrimaryTestCase(unittest.TestCase):
+    def setUp(self):
+        from pathlib import Path
+        from tempfile import mkdtemp
+        from unittest.mock import patch
+        from restage.cache import FileSystem
+        from restage.database import Database
+        self.root = Path(mkdtemp())
+        self.db = Database(self.root / 'database.db')
+        self.patch = patch('restage.cache.FILESYSTEM', FileSystem(self.root, (), self.db))
+        self.patch.start()
+
+    def tearDown(self):
+        from shutil import rmtree
+        self.patch.stop()
+        self.db.close()
+        rmtree(self.root)
+
+    def test_seeded_source(self):
+        from pathlib import Path
+        from types import SimpleNamespace
+        from mccode_antlr.common import Expr
+        from test_mcpl import mcpl_bytes
+        from restage import SimulationEntry
+        from restage.mcpl import mcpl_particle_count
+        from restage.splitrun import derive_primary_simulation
+        source_dir = self.root / 'source'
+        source_dir.mkdir()
+        source_dir.joinpath('primary.mcpl').write_bytes(mcpl_bytes(100, particle_size=40, weight=1.0))
+        source_dir.joinpath('mccode.sim').write_text('sim')
+        source = SimulationEntry({'mcpl_filename': Expr.best('"primary"'), 'a': Expr.best(1.5)}, seed=101,
+                                 ncount=100, output_path=str(source_dir))
+        derived = derive_primary_simulation(source, 25, SimpleNamespace(binary_path=str(self.root / 'bin' / 'x')))
+        # the particles are not those of a run with the seed of the source
+        self.assertIsNone(derived.seed)
+        self.assertEqual((derived.ncount, derived.derived_from), (25, source.id))
+        self.assertEqual(mcpl_particle_count(f'{derived.output_path}/primary.mcpl'), 25)
+        self.assertTrue(self.root.joinpath('sim') in Path(derived.output_path).parents)
+        self.assertFalse(source.replace(ncount=25).matches_candidate(derived))
+
+    def test_partials(self):
+        from types import SimpleNamespace
+        from mccode_antlr.common import Expr
+        from restage import SimulationEntry
+        from unittest.mock import patch
+        from restage.cache import cache_simulations
+        from restage.splitrun import _pre_partials
+        entry = SimpleNamespace(id='partial_instr')
+        precision = {'a': 0.1}
+
+        def sim(a, ncount, gravitation=False):
+            return SimulationEntry({'a': Expr.best(a)}, ncount=ncount, gravitation=gravitation, precision=precision)
+
+        exact = sim(1.5, 10)
+        cache_simulations(entry, [exact, sim(1.52, 30), sim(1.5, 20, gravitation=True)])
+        pending = [sim(1.5, 100)]
+        # cached simulations are only topped up when configured to
+        self.assertEqual(_pre_partials(entry, pending), [[]])
+        with patch('restage.splitrun._top_up_primaries', return_value=True):
+            # neither the nearby nor the gravitation simulation are merged with new particles
+            self.assertEqual([[p.id for p in found] for found in _pre_partials(entry, pending)], [[exact.id]])
+
+
+
+@unittest.skipIf(find_spec('zstandard') is None, 'zstd compression requires the zstandard package')
+class SecondaryReadableTestCase(unittest.TestCase):
+    def setUp(self):
+        from pathlib import Path
+        from tempfile import mkdtemp
+        self.root = Path(mkdtemp())
+        self.commands = []
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.root)
+
+    def _run(self, executable, target, cmd, **kwargs):
+        """Emulate a secondary instrument, which only records its command line"""
+        self.commands.append(cmd)
+
+    def _secondary(self, readable, dry_run):
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from mccode_antlr.common import Expr
+        from restage import SimulationEntry
+        from restage.splitrun import do_secondary_simulation
+        primary = SimulationEntry({'mcpl_filename': Expr.best('"primary"')}, output_path=str(self.root / 'primary'))
+        entry = SimpleNamespace(binary_path=str(self.root / 'secondary'), mpi=False, acc=False)
+        with patch('mccode_antlr.compiler.c.run_compiled_instrument', self._run):
+            do_secondary_simulation(primary, entry, {}, {'dir': self.root / f'secondary{len(self.commands)}'},
+                                    dry_run=dry_run, readable=readable)
+        return self.commands[-1].split('mcpl_filename=')[-1]
+
+    def test_decompressed_once(self):
+        from pathlib import Path
+        from test_mcpl import mcpl_bytes
+        from restage.mcpl import MCPLReadable, mcpl_compress
+        (self.root / 'primary').mkdir()
+        (self.root / 'primary' / 'primary.mcpl').write_bytes(mcpl_bytes(4))
+        compressed = mcpl_compress(self.root / 'primary' / 'primary.mcpl', 'zstd')
+        with MCPLReadable(self.root / 'readable') as readable:
+            # a dry run reads nothing, so nothing is decompressed for it
+            self.assertEqual(self._secondary(readable, True), str(compressed))
+            self.assertIsNone(readable.directory)
+            used = [self._secondary(readable, False) for _ in range(3)]
+            self.assertEqual(len(set(used)), 1)
+            self.assertTrue(readable.directory in Path(used[0]).parents)
+        self.assertFalse(Path(used[0]).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import unittest
+
+
+def _entry(precision: dict | None = None, **params):
+    from mccode_antlr.common import Expr
+    from restage.tables import SimulationEntry
+    return SimulationEntry({k: Expr.best(v) for k, v in params.items()}, precision=dict(precision or {}))
+
+
+class UniqueSimulationEntryTestCase(unittest.TestCase):
+    def test_exact_repeats(self):
+        from restage.tables import unique_simulation_entry_indexes
+        entries = [_entry(a=1.0, b=2.0), _entry(a=1.5, b=2.0), _entry(a=1.0, b=2.0), _entry(a=1.5, b=2.0)]
+        unique, representative = unique_simulation_entry_indexes(entries)
+        self.assertEqual(unique, [0, 1])
+        self.assertEqual(representative, [0, 1, 0, 1])
+
+    def test_within_precision(self):
+        from restage.tables import unique_simulation_entry_indexes
+        precision = {'a': 0.1}
+        entries = [_entry(precision, a=1.05, b=2.5), _entry(precision, a=1.01, b=2.5), _entry(precision, a=1.55, b=2.5)]
+        unique, representative = unique_simulation_entry_indexes(entries)
+        self.assertEqual(unique, [1, 2])
+        self.assertEqual(representative, [1, 1, 2])
+
+    def test_exact_values_separate(self):
+        from restage.tables import unique_simulation_entry_indexes
+        entries = [_entry(a=1.0, c='"one"'), _entry(a=1.0, c='"two"'), _entry(a=1.0, c='"one"')]
+        unique, representative = unique_simulation_entry_indexes(entries)
+        self.assertEqual(unique, [0, 1])
+        self.assertEqual(representative, [0, 1, 0])
+
+    def test_seed_separate(self):
+        from mccode_antlr.common import Expr
+        from restage.tables import SimulationEntry, unique_simulation_entry_indexes
+        entries = [SimulationEntry({'a': Expr.best(1.0)}, seed=s) for s in (1, 2, 1)]
+        unique, representative = unique_simulation_entry_indexes(entries)
+        self.assertEqual(unique, [0, 1])
+        self.assertEqual(representative, [0, 1, 0])
+
+    def test_large_scan(self):
+        from restage.tables import unique_simulation_entry_indexes
+        entries = [_entry(a=0.5 + i % 50, b=0.25 + i % 7) for i in range(700)]
+        unique, representative = unique_simulation_entry_indexes(entries)
+        self.assertEqual(len(unique), 350)
+        for index, rep in enumerate(representative):
+            self.assertTrue(entries[index].matches_candidate(entries[rep]))
+
+    def test_chained_cluster(self):
+        from restage.tables import unique_simulation_entry_indexes
+        precision = {'a': 1.0, 'b': 1.0}
+        # the first two points both match the third, but not each other
+        entries = [_entry(precision, a=10.51, b=11.01), _entry(precision, a=10.51, b=9.01),
+                   _entry(precision, a=10.01, b=10.01)]
+        unique, representative = unique_simulation_entry_indexes(entries)
+        self.assertEqual(unique, [2])
+        self.assertEqual(representative, [2, 2, 2])
+
+    def test_off_grid_scan(self):
+        from random import Random
+        from restage.tables import unique_simulation_entry_indexes
+        random = Random(3)
+        precision = {'a': 0.5, 'b': 0.25, 'c': 1.0}
+        entries = [_entry(precision, a=random.uniform(0, 10), b=random.uniform(0, 5), c=random.uniform(0, 4))
+                   for _ in range(2000)]
+        unique, representative = unique_simulation_entry_indexes(entries)
+        self.assertLess(len(unique), len(entries))
+        self.assertEqual(sorted(set(representative)), unique)
+        for index, rep in enumerate(representative):
+            self.assertEqual(representative[rep], rep)
+            self.assertTrue(entries[index].matches_candidate(entries[rep]))
+
+
+class MatchSimulationCandidatesTestCase(unittest.TestCase):
+    def test_matches_agree(self):
+        from restage.tables import match_simulation_candidates
+        precision = {'a': 0.1}
+        candidates = [_entry(a=0.05 * i + 0.01, b=0.25 + i % 3, c='"x"' if i % 2 else '"y"') for i in range(100)]
+        rows = [_entry(precision, a=0.3 * i + 0.02, b=0.25 + i % 3, c='"x"') for i in range(20)]
+        matched = match_simulation_candidates(rows, candidates)
+        for row, found in zip(rows, matched):
+            expected = [c for c in candidates if row.matches_candidate(c)]
+            self.assertEqual(found, expected)
+
+    def test_no_candidates(self):
+        from restage.tables import match_simulation_candidates
+        self.assertEqual(match_simulation_candidates([_entry(a=0.5)], []), [[]])
+
+
+class SimulationCandidatesTestCase(unittest.TestCase):
+    def test_mixed_candidates(self):
+        from restage.tables import SimulationCandidates
+        precision = {'a': 0.1}
+        candidates = [_entry(a=0.05 * i + 0.01, n=i % 4, c='"x"' if i % 2 else '"y"') for i in range(60)]
+        candidates = [c.replace(seed=i % 3 or None, ncount=100 * (i % 2), gravitation=bool(i % 5))
+                      for i, c in enumerate(candidates)]
+        candidates.append(_entry(a=0.51, n=1))
+        rows = [_entry(precision, a=0.2 * i + 0.02, n=i % 4, c='"x"') for i in range(15)]
+        rows.extend(r.replace(seed=1, ncount=100, gravitation=True) for r in rows[:5])
+        rows.append(_entry(precision, a=0.5, n=1))
+        columnar = SimulationCandidates(candidates)
+        mask = columnar.match_many(rows, chunk=64)
+        for row, found in zip(rows, mask):
+            self.assertEqual(list(found), [row.matches_candidate(c) for c in candidates])
+        self.assertEqual(list(columnar.match(rows[-1])), [row.matches_candidate(c) for c in candidates])
+
+    def test_unknown_parameters(self):
+        from restage.tables import SimulationCandidates
+        columnar = SimulationCandidates([_entry(a=0.5), _entry(a=0.5, b=1)])
+        self.assertEqual(list(columnar.match(_entry(b=1))), [False, False])
+        self.assertEqual(list(columnar.match(_entry(a=0.5))), [True, False])
+
+
+class SimulationSchemaTestCase(unittest.TestCase):
+    def test_shared_precision(self):
+        from pickle import dumps, loads
+        from mccode_antlr.common import Expr
+        from restage.tables import SimulationEntry, SimulationSchema
+        schema = SimulationSchema(['ps1speed', 'ps2speed', 'n', 'e'], {'speed': -0.5})
+        entries = [SimulationEntry({'ps1speed': Expr.best(i + 0.5), 'ps2speed': Expr.best(i + 0.25),
+                                    'n': Expr.best(i), 'e': Expr.best(10.5)}, schema=schema) for i in range(5)]
+        self.assertTrue(all(entry.precision is schema.precision for entry in entries))
+        self.assertEqual(schema.precision, {'speed': -0.5, 'ps1speed': 0.5, 'ps2speed': 0.5, 'e': 0.00105})
+        self.assertEqual(schema.precision_key('ps1speed'), 'speed')
+        self.assertTrue(entries[1].matches_candidate(entries[1].replace(parameter_values={
+            'ps1speed': Expr.best(1.9), 'ps2speed': Expr.best(1.25), 'n': Expr.best(1), 'e': Expr.best(10.5)})))
+        self.assertEqual(list(entries[3].vector), [3.5, 3.25, 3.0, 10.5])
+        self.assertEqual(list(SimulationEntry({'s': Expr.parse('"x"'), 'f': 0.5}).vector[1:]), [0.5])
+
+        restored = loads(dumps(entries))
+        self.assertEqual(restored, entries)
+        self.assertIs(restored[0].schema, restored[-1].schema)
+        self.assertEqual(list(restored[3].vector), [3.5, 3.25, 3.0, 10.5])
+
+
+class SimulationNeighboursTestCase(unittest.TestCase):
+    def setUp(self):
+        from random import Random
+        from restage.tables import SimulationSchema
+        random = Random(1)
+        self.schema = SimulationSchema(['a', 'b', 'c'], {'a': 0.5, 'b': 2.0})
+        self.entries = [_entry(a=random.randint(0, 40) / 4 + 0.01, b=random.randint(0, 20) + 0.5, c='"x"')
+                        for _ in range(200)]
+        self.entries = [e.replace(ncount=random.choice((None, 10, 100)), schema=self.schema) for e in self.entries]
+        self.entries.append(_entry(a=1.5, b=1.5, c='"y"'))
+        self.pivots = [_entry(a=random.uniform(0, 10), b=random.uniform(0, 20), c='"x"').replace(schema=self.schema)
+                       for _ in range(30)]
+
+    def _distance(self, entry, pivot):
+        return sum(abs(entry.parameter_values[k].value - pivot.parameter_values[k].value) / self.schema.precision[k]
+                   for k in 'ab')
+
+    def _brute(self, pivot, radius=None):
+        indexes = [i for i, e in enumerate(self.entries) if e.parameter_values['c'] == pivot.parameter_values['c']]
+        if radius is not None:
+            indexes = [i for i in indexes if pivot.matches_candidate(self.entries[i])]
+        return sorted(indexes, key=lambda i: (self._distance(self.entries[i], pivot), -(self.entries[i].ncount or 0)))
+
+    def _check(self, tree):
+        from restage.tables import SimulationNeighbours
+        neighbours = SimulationNeighbours(self.entries, self.schema.precision)
+        if not tree:
+            for _, _, _, t in neighbours.groups.values():
+                self.assertIsNone(t)
+        for pivot in self.pivots:
+            expected = self._brute(pivot)
+            self.assertEqual(neighbours.nearest(pivot, 5), expected[:5])
+            self.assertEqual(neighbours.within(pivot), self._brute(pivot, 1))
+            matched = self._brute(pivot, 1)
+            if len(matched):
+                self.assertEqual(neighbours.best(pivot, among=matched), matched[0])
+        # the entry with different non-floating-point values can not be compared to the others
+        self.assertIsNone(neighbours.best(self.pivots[0]))
+        self.assertEqual(neighbours.nearest(_entry(a=0.5, b=0.5, c='"z"').replace(schema=self.schema)), [])
+
+    def test_numpy(self):
+        from unittest.mock import patch
+        with patch.dict('sys.modules', {'scipy': None, 'scipy.spatial': None}):
+            self._check(False)
+
+    def test_kdtree(self):
+        try:
+            import scipy.spatial  # noqa: F401
+        except ImportError:
+            self.skipTest('SciPy is not installed')
+        self._check(True)
+
+    def test_best_matches(self):
+        from restage.tables import best_simulation_entry_matches, best_simulation_entry_match
+        pivots = [pivot for pivot in self.pivots if len(self._brute(pivot, 1))]
+        candidates = [[self.entries[i] for i in self._brute(pivot, 1)][::-1] for pivot in pivots]
+        self.assertTrue(any(len(found) > 2 for found in candidates))
+        best = best_simulation_entry_matches(candidates, pivots)
+        for found, pivot, b in zip(candidates, pivots, best):
+            self.assertIs(b, best_simulation_entry_match(found, pivot))
+
+    def test_prebuilt_neighbours(self):
+        from unittest.mock import patch
+        from restage.tables import SimulationCandidates, best_simulation_entry_matches, best_simulation_entry_match
+        pivots = [pivot for pivot in self.pivots if len(self._brute(pivot, 1))]
+        candidates = [[self.entries[i] for i in self._brute(pivot, 1)][::-1] for pivot in pivots]
+        table = SimulationCandidates(self.entries[:100])
+        first = table.neighbours(self.schema.precision)
+        table.extend(self.entries[100:])
+        # the index is rebuilt only when the candidates change
+        neighbours = table.neighbours(self.schema.precision)
+        self.assertIsNot(neighbours, first)
+        self.assertIs(table.neighbours(dict(self.schema.precision)), neighbours)
+
+        with patch('restage.tables.SimulationNeighbours', side_effect=AssertionError('rebuilt')):
+            best = best_simulation_entry_matches(candidates, pivots, [neighbours])
+            for found, pivot, b in zip(candidates, pivots, best):
+                self.assertIs(b, best_simulation_entry_match(found, pivot, [neighbours]))
+        self.assertEqual(best, best_simulation_entry_matches(candidates, pivots))
+
+
+class StoredParameterValueTestCase(unittest.TestCase):
+    def test_same_as_expr(self):
+        from mccode_antlr.common import Expr
+        from restage.tables import stored_parameter_value
+        values = [0.1, 1.25, -2.5e-7, 1 / 3, 12.345678901234567, -399192.0532688213, 7697965438.425775,
+                  3, -4, 2 ** 70, '"abc"', '"it\'s"', '""']
+        for value in values:
+            expr = Expr.parse(value) if isinstance(value, str) else Expr.best(value)
+            data = expr.to_dict()
+            decoded, numeric = stored_parameter_value(data)
+            self.assertEqual(decoded, Expr.from_dict(data).value)
+            self.assertEqual(type(decoded), type(Expr.from_dict(data).value))
+            self.assertEqual(numeric, not isinstance(value, str))
+
+    def test_expression(self):
+        from mccode_antlr.common import Expr
+        from restage.tables import stored_parameter_value
+        self.assertEqual(stored_parameter_value(Expr.parse('a + b').to_dict()), ('a + b', False))
+
+    def test_stored_candidates(self):
+        from restage.tables import SimulationCandidates
+        precision = {'a': 0.1}
+        entries = [_entry(a=0.05 * i + 0.01, n=i % 4, c='"x"' if i % 2 else '"y"') for i in range(40)]
+        stored = SimulationCandidates()
+        stored.extend_stored([entry.to_model('table') for entry in entries], ['a', 'n', 'c'])
+        self.assertEqual(stored._entries, [None] * 40)
+        rows = [_entry(precision, a=0.2 * i + 0.02, n=i % 4, c='"x"') for i in range(10)]
+        matched = stored.matches(rows)
+        self.assertEqual([[c.id for c in m] for m in matched],
+                         [[c.id for c in entries if row.matches_candidate(c)] for row in rows])
+        # only the matched entries were constructed
+        self.assertEqual(sum(e is not None for e in stored._entries), len({c.id for m in matched for c in m}))
+
+
+if __name__ == '__main__':
+    unittest.main()